@@ -1,17 +1,51 @@
+from src.startup import probe
+
+# Only what the first frame needs is imported here. Menus, popups, the
+# settings dialog and the Ollama client (and aiohttp with it) are imported
+# when they are first used.
 from kivy.app import App
 from kivy.uix.boxlayout import BoxLayout
-from kivy.uix.gridlayout import GridLayout
 from kivy.uix.button import Button
-from kivy.uix.textinput import TextInput
 from kivy.uix.label import Label
-from kivy.uix.scrollview import ScrollView
-from kivy.core.window import Window
-from kivy.uix.dropdown import DropDown
-from kivy.uix.popup import Popup
+from kivy.uix.textinput import TextInput
 from kivy.clock import Clock
 from kivy.config import Config
+from kivy.utils import escape_markup
 import asyncio
 import os
+import time
+from pathlib import Path
+
+from src.settings_store import get_settings_store
+from src.context_window import ContextWindow
+from src.continuation import ContinuationStore
+from src.message_list import MessageList
+from src.model_catalog import ModelCatalog
+from src.request_scheduler import BACKGROUND, INTERACTIVE, RequestScheduler, request_key
+from src.search_index import SearchIndex, highlight, make_snippet
+from src.session_store import SessionStore
+from src.session_tabs import SessionSidebar, TabBar
+from src.telemetry import MetricsServer, Telemetry, request_kind
+from src.update_batcher import UpdateBatcher
+from src.workspace import Workspace
+
+probe.mark("imports")
+
+# Status bar text colour for each status type
+STATUS_COLORS = {
+    "info": (0.8, 0.8, 0.8, 1),
+    "error": (1, 0.45, 0.45, 1),
+}
+
+WELCOME_MESSAGE = "Welcome to the Chat Application! Type a message to begin."
+
+TITLE_PROMPT = "Reply with a title of at most six words for this conversation, and nothing else."
+
+def request_errors():
+    """Return the exceptions a failed Ollama request raises"""
+    import aiohttp
+    from src.ollama_client import OllamaError
+    return (OllamaError, aiohttp.ClientError)
 
 # Configure the app
 Config.set('input', 'mouse', 'mouse,multitouch_on_demand')
@@ -21,13 +55,88 @@ Config.set('graphics', 'minimum_width', '600')
 Config.set('graphics', 'minimum_height', '400')
 
 class ChatApp(App):
+    _ollama_client = None
+    _attachments = None
+
+    @property
+    def ollama_client(self):
+        """The Ollama client, created on first use"""
+        if self._ollama_client is None:
+            from src.ollama_client import OllamaClient
+            self._ollama_client = OllamaClient.from_config(self.app_config)
+            self._ollama_client.telemetry = self.telemetry
+        return self._ollama_client
+
+    @ollama_client.setter
+    def ollama_client(self, client):
+        self._ollama_client = client
+
+    @property
+    def attachments(self):
+        """The image attachment pipeline, created on first use"""
+        if self._attachments is None:
+            from src.attachments import AttachmentPipeline
+            self._attachments = AttachmentPipeline.from_config(self.app_config)
+        return self._attachments
+
+    @property
+    def session(self):
+        """The session shown in the transcript"""
+        return self.workspace.active
+
+    @property
+    def session_id(self):
+        return self.workspace.active.session_id
+
+    @property
+    def generation_task(self):
+        """The generation streaming into the shown session, if any"""
+        return self.workspace.active.generation_task
+
+    @generation_task.setter
+    def generation_task(self, task):
+        self.workspace.active.generation_task = task
+
+    @property
+    def has_older_history(self):
+        return self.workspace.active.has_older_history
+
     def build(self):
         # Initialize settings
         self.settings = {
             "theme": "dark",
             "available_themes": ["light", "dark"]
         }
-        self.available_models = ["llama2", "mistral", "codellama"]
+        # Settings are read once and cached; edits to the file are pushed to
+        # on_settings_changed on the UI thread
+        self.settings_store = get_settings_store(
+            dispatch=lambda callback: Clock.schedule_once(lambda dt: callback())
+        )
+        self.settings_store.subscribe(self.on_settings_changed)
+        self.app_config = self.settings_store.get()
+        # Models saved by the last run; refreshed once connected
+        self.available_models = ModelCatalog.from_config(self.app_config).names()
+        self.context_window = ContextWindow.from_config(self.app_config)
+        self.continuations = ContinuationStore(self.context_window)
+        self.scheduler = RequestScheduler.from_config(self.app_config)
+        self.background_tasks = set()
+        self.export_job = None
+        self.telemetry = None
+        self.metrics_server = None
+        if self.app_config.get('telemetry', {}).get('enabled', True):
+            self.telemetry = Telemetry.from_config(self.app_config, on_record=self.show_telemetry)
+        self.closing = None
+        # Images prepared for the next message
+        self.pending_attachments = []
+        self.session_store = SessionStore.from_config(self.app_config)
+        # Open chats; only the one shown has widgets
+        self.workspace = Workspace.from_config(self.session_store, self.app_config)
+        self.search_index = SearchIndex(self.session_store)
+        self.embedding_index = self.embedding_indexer = None
+        self.warmup = None
+        self.search_mode = 'keyword'
+        if self.app_config.get('embeddings', {}).get('enabled'):
+            self.open_embedding_index()
         
         # Set window title
         self.title = "Chat Application"
@@ -35,70 +144,78 @@ class ChatApp(App):
         # Create the main layout
         self.main_layout = BoxLayout(orientation='vertical', spacing=10, padding=10)
         
-        # Add menu bar
-        self.menu_layout = GridLayout(cols=5, size_hint=(1, None), height=40)
+        # Add menu bar; each dropdown is built the first time it opens
+        self.menu_layout = BoxLayout(orientation='horizontal', size_hint=(1, None), height=40)
+        self.menus = {}
+        for name in ('file', 'edit', 'theme'):
+            menu_btn = Button(text=name.capitalize(), size_hint=(None, None), size=(80, 40))
+            menu_btn.bind(on_release=lambda btn, name=name: self.open_menu(name, btn))
+            self.menu_layout.add_widget(menu_btn)
         
-        # File menu
-        self.file_menu = Button(text='File', size_hint=(None, None), size=(80, 40))
-        self.file_dropdown = DropDown()
-        
-        new_chat_btn = Button(text='New Chat', size_hint_y=None, height=40)
-        new_chat_btn.bind(on_release=self.new_chat)
-        self.file_dropdown.add_widget(new_chat_btn)
-        
-        save_chat_btn = Button(text='Save Chat', size_hint_y=None, height=40)
-        save_chat_btn.bind(on_release=self.save_chat)
-        self.file_dropdown.add_widget(save_chat_btn)
-        
-        exit_btn = Button(text='Exit', size_hint_y=None, height=40)
-        exit_btn.bind(on_release=self.stop)
-        self.file_dropdown.add_widget(exit_btn)
-        
-        self.file_menu.bind(on_release=self.file_dropdown.open)
-        self.menu_layout.add_widget(self.file_menu)
-        
-        # Edit menu
-        self.edit_menu = Button(text='Edit', size_hint=(None, None), size=(80, 40))
-        self.edit_dropdown = DropDown()
-        
-        clear_chat_btn = Button(text='Clear Chat', size_hint_y=None, height=40)
-        clear_chat_btn.bind(on_release=self.clear_chat)
-        self.edit_dropdown.add_widget(clear_chat_btn)
-        
-        settings_btn = Button(text='Settings', size_hint_y=None, height=40)
-        settings_btn.bind(on_release=self.toggle_settings)
-        self.edit_dropdown.add_widget(settings_btn)
-        
-        self.edit_menu.bind(on_release=self.edit_dropdown.open)
-        self.menu_layout.add_widget(self.edit_menu)
+        # Search box; results update as you type
+        self.search_input = TextInput(
+            hint_text='Search chats...',
+            multiline=False,
+            size_hint=(None, None),
+            size=(240, 40)
+        )
+        self.search_input.bind(text=lambda instance, text: self._search_trigger())
+        self.search_dropdown = None
+        self._search_trigger = Clock.create_trigger(self.run_search, 0.15)
+        self.menu_layout.add_widget(self.search_input)
+        if self.embedding_index is not None:
+            self.search_mode_button = Button(text='Words', size_hint=(None, None), size=(80, 40))
+            self.search_mode_button.bind(on_release=self.toggle_search_mode)
+            self.menu_layout.add_widget(self.search_mode_button)
         
-        # Theme menu
-        self.theme_menu = Button(text='Theme', size_hint=(None, None), size=(80, 40))
-        self.theme_dropdown = DropDown()
+        # Selected model and whether it is loaded; opens the model menu
+        self.model_button = Button(
+            text=self.app_config.get('model', ''),
+            size_hint=(None, None),
+            size=(240, 40)
+        )
+        self.model_button.bind(on_release=self.open_model_menu)
+        self.menu_layout.add_widget(self.model_button)
         
-        for theme_name in self.settings.get("available_themes", ["light", "dark"]):
-            theme_display_name = theme_name.capitalize()
-            theme_btn = Button(text=theme_display_name, size_hint_y=None, height=40)
-            theme_btn.bind(on_release=lambda btn, tn=theme_name: self.change_theme(tn))
-            self.theme_dropdown.add_widget(theme_btn)
+        self.main_layout.add_widget(self.menu_layout)
         
-        self.theme_menu.bind(on_release=self.theme_dropdown.open)
-        self.menu_layout.add_widget(self.theme_menu)
+        # Saved sessions on the left; open ones as tabs above the transcript
+        self.body_layout = BoxLayout(orientation='horizontal', spacing=10)
+        self.sidebar = SessionSidebar(on_select=self.open_session, size_hint=(0.25, 1))
+        self.body_layout.add_widget(self.sidebar)
+        self.chat_layout = BoxLayout(orientation='vertical', spacing=4)
+        self.tab_bar = TabBar(
+            on_select=self.open_session,
+            on_close=self.close_tab,
+            size_hint=(1, None),
+            height=36
+        )
+        self.chat_layout.add_widget(self.tab_bar)
         
-        self.main_layout.add_widget(self.menu_layout)
+        # Chat display area; only the visible messages of the shown session
+        # are laid out
+        self.chat_display = MessageList(
+            size_hint=(1, 1),
+            message_colors=self.app_config.get('message_colors', {})
+        )
+        self.chat_display.bind(scroll_y=self._on_chat_scroll)
+        self.chat_layout.add_widget(self.chat_display)
+        self.body_layout.add_widget(self.chat_layout)
+        self.main_layout.add_widget(self.body_layout)
+        self.update_batcher = UpdateBatcher(
+            self._flush_stream_updates,
+            interval=self.app_config.get('ui', {}).get('stream_flush_interval', 0)
+        )
         
-        # Chat display area
-        self.scroll_view = ScrollView(size_hint=(1, 1))
-        self.chat_display = TextInput(
-            text='',
-            multiline=True,
-            readonly=True,
+        # Thumbnails of the images attached to the next message; hidden when empty
+        self.attachment_bar = BoxLayout(
+            orientation='horizontal',
             size_hint=(1, None),
-            height=Window.height
+            height=0,
+            opacity=0,
+            spacing=6
         )
-        self.chat_display.bind(minimum_height=self.chat_display.setter('height'))
-        self.scroll_view.add_widget(self.chat_display)
-        self.main_layout.add_widget(self.scroll_view)
+        self.main_layout.add_widget(self.attachment_bar)
         
         # Input area
         self.input_layout = BoxLayout(
@@ -111,32 +228,280 @@ class ChatApp(App):
         self.message_input = TextInput(
             hint_text='Type your message here...',
             multiline=False,
-            size_hint=(0.85, 1)
+            size_hint=(0.6, 1)
         )
         self.message_input.bind(on_text_validate=self.send_message)
         self.input_layout.add_widget(self.message_input)
         
+        self.attach_button = Button(text='Attach', size_hint=(0.1, 1))
+        self.attach_button.bind(on_release=self.open_attach_dialog)
+        self.input_layout.add_widget(self.attach_button)
+        
         self.send_button = Button(text='Send', size_hint=(0.15, 1))
         self.send_button.bind(on_release=self.send_message)
         self.input_layout.add_widget(self.send_button)
         
+        self.stop_button = Button(text='Stop', size_hint=(0.15, 1), disabled=True)
+        self.stop_button.bind(on_release=self.stop_generation)
+        self.input_layout.add_widget(self.stop_button)
+        
         self.main_layout.add_widget(self.input_layout)
         
-        # Display welcome message
-        Clock.schedule_once(
-            lambda dt: self.receive_message("Welcome to the Chat Application! Type a message to begin."),
-            0.1
-        )
+        # Status bar: what the app is doing on the left, generation speed on the right
+        self.status_bar = BoxLayout(orientation='horizontal', size_hint=(1, None), height=24)
+        self.status_label = Label(text='', halign='left', valign='middle', size_hint=(0.55, 1))
+        self.stats_label = Label(text='', halign='right', valign='middle', size_hint=(0.45, 1))
+        for label in (self.status_label, self.stats_label):
+            label.bind(size=lambda label, size: setattr(label, 'text_size', size))
+            self.status_bar.add_widget(label)
+        self.main_layout.add_widget(self.status_bar)
+        
+        # Show the tail of the last session, or a welcome message for a new one
+        self.open_session(self.session_store.latest_session() or self.session_store.create_session())
+        if not self.chat_display.data:
+            session = self.session
+            Clock.schedule_once(
+                lambda dt: self.receive_message(WELCOME_MESSAGE, role="system", session=session),
+                0.1
+            )
         
         return self.main_layout
 
+    def on_start(self):
+        """Connect to Ollama in the background once the first frame is drawn"""
+        probe.mark("build")
+        probe.on_first_frame(self.after_first_frame)
+
+    def after_first_frame(self):
+        """Start work that the first frame should not wait for"""
+        loop = asyncio.get_running_loop()
+        loop.create_task(self.connect_to_ollama())
+        if self.telemetry is not None and self.app_config['telemetry'].get('prometheus_port'):
+            loop.create_task(self.start_metrics_server())
+
+    def open_menu(self, name, button):
+        """Open a menu dropdown, building it on first use"""
+        dropdown = self.menus.get(name)
+        if dropdown is None:
+            dropdown = self.menus[name] = self.build_menu(name)
+        dropdown.open(button)
+
+    def build_menu(self, name):
+        """Create the dropdown of the ``name`` menu"""
+        from kivy.uix.dropdown import DropDown
+
+        if name == 'file':
+            items = [
+                ('New Chat', self.new_chat),
+                ('Save Chat', self.save_chat),
+                ('Export Chat', self.export_chat),
+                ('Export All Chats', self.export_all_chats),
+                ('Export Telemetry', self.export_telemetry),
+                ('Exit', self.stop),
+            ]
+        elif name == 'edit':
+            items = [
+                ('Clear Chat', self.clear_chat),
+                ('Settings', self.toggle_settings),
+            ]
+        else:
+            items = [
+                (theme_name.capitalize(), lambda btn, tn=theme_name: self.change_theme(tn))
+                for theme_name in self.settings.get("available_themes", ["light", "dark"])
+            ]
+        dropdown = DropDown()
+        for text, callback in items:
+            item_btn = Button(text=text, size_hint_y=None, height=40)
+            item_btn.bind(on_release=callback)
+            item_btn.bind(on_release=lambda btn: dropdown.dismiss())
+            dropdown.add_widget(item_btn)
+        return dropdown
+
+    def on_stop(self):
+        """Cancel every generation, then release the HTTP pool and session store"""
+        tasks = [session.generation_task for session in self.workspace.sessions.values()
+                 if session.generation_task is not None]
+        for task in tasks:
+            task.cancel()
+        try:
+            self.closing = asyncio.get_running_loop().create_task(self.shutdown(tasks))
+        except RuntimeError:
+            asyncio.run(self.shutdown(tasks))
+
+    async def shutdown(self, tasks=()):
+        """Wait for ``tasks`` to finish saving, then close the client and store"""
+        for background in self.background_tasks:
+            background.cancel()
+        if self.export_job is not None:
+            self.export_job.cancel()
+            await asyncio.to_thread(self.export_job.wait, 5)
+        await asyncio.gather(*self.background_tasks, *tasks, return_exceptions=True)
+        if self.embedding_indexer is not None:
+            await self.embedding_indexer.close()
+            self.embedding_index.close()
+        if self.warmup is not None:
+            await self.warmup.close()
+        if self.metrics_server is not None:
+            await self.metrics_server.close()
+        if self.telemetry is not None:
+            self.telemetry.close()
+        if self._attachments is not None:
+            self._attachments.close()
+        if self._ollama_client is not None:
+            await self._ollama_client.close()
+        self.search_index.close()
+        self.session_store.close()
+        self.settings_store.close()
+        self.chat_display.renderer.close()
+
     async def connect_to_ollama(self):
         """Connect to the Ollama API server"""
-        return True
+        connected = await self.ollama_client.connect()
+        if connected:
+            self.update_status(f"Connected to {self.ollama_client.host}")
+            self.ollama_client.start_health_checks()
+            if self.embedding_indexer is not None:
+                self.embedding_indexer.start()
+            await self.load_models()
+            self.start_warmup()
+        else:
+            self.update_status(f"Cannot reach Ollama at {self.ollama_client.host}", "error")
+        return connected
+
+    async def load_models(self):
+        """Update the model list, revalidating the saved catalog if it is stale"""
+        client = self.ollama_client
+        try:
+            await client.list_models()
+            if client.catalog.is_stale():
+                await client.refresh_models_soon()
+        except request_errors() as e:
+            self.update_status(f"Could not list models: {e}", "error")
+            return
+        self.available_models = client.available_models
+
+    def start_warmup(self):
+        """Preload the selected and pinned models and start tracking which are loaded"""
+        from src.model_warmup import WarmupManager
+
+        if not self.app_config.get('warmup', {}).get('enabled', True):
+            return
+        if self.warmup is None:
+            self.warmup = WarmupManager.from_config(
+                self.ollama_client, self.app_config, on_change=self.show_model_state
+            )
+            self.warmup.start()
+        else:
+            self.warmup.attach(self.ollama_client)
+        for model in {self.app_config.get('model')} | self.warmup.pinned:
+            self.warmup.preload(model)
+
+    def show_model_state(self):
+        """Show the selected model, and whether it is loaded, on the model button"""
+        model = self.app_config.get('model', '')
+        if self.warmup is not None:
+            model = f"{model} ({self.warmup.describe(model)})"
+        self.model_button.text = model
+
+    def open_model_menu(self, button):
+        """List the installed models with their state, to select, pin or unload one"""
+        from kivy.uix.dropdown import DropDown
+
+        dropdown = DropDown(auto_width=False, width=440)
+        pinned = sorted(self.warmup.pinned) if self.warmup is not None else []
+        for model in dict.fromkeys(list(self.available_models) + pinned):
+            row = BoxLayout(orientation='horizontal', size_hint_y=None, height=40)
+            label = model if self.warmup is None else f"{model} ({self.warmup.describe(model)})"
+            select_btn = Button(text=label, size_hint_x=0.6)
+            select_btn.bind(on_release=lambda btn, m=model: self.select_model(m))
+            row.add_widget(select_btn)
+            if self.warmup is not None:
+                pin_btn = Button(text='Unpin' if model in self.warmup.pinned else 'Pin', size_hint_x=0.2)
+                pin_btn.bind(on_release=lambda btn, m=model: self.toggle_pin(m))
+                unload_btn = Button(text='Unload', size_hint_x=0.2,
+                                    disabled=self.warmup.state(model) != 'ready')
+                unload_btn.bind(on_release=lambda btn, m=model: self.start_background(self.unload_model(m)))
+                row.add_widget(pin_btn)
+                row.add_widget(unload_btn)
+            for child in row.children:
+                child.bind(on_release=lambda btn: dropdown.dismiss())
+            dropdown.add_widget(row)
+        dropdown.open(button)
+
+    def select_model(self, model):
+        """Use ``model`` for new replies; it starts loading through on_settings_changed"""
+        self.settings_store.update({'model': model})
+
+    def toggle_pin(self, model):
+        """Pin ``model`` so it stays loaded, or unpin it"""
+        if model in self.warmup.pinned:
+            self.warmup.unpin(model)
+        else:
+            self.warmup.pin(model)
+        self.settings_store.update({'warmup': {'pinned': sorted(self.warmup.pinned)}})
+
+    async def unload_model(self, model):
+        """Free the memory ``model`` holds on the server"""
+        try:
+            await self.warmup.unload(model)
+        except request_errors() as e:
+            self.update_status(f"Could not unload {model}: {e}", "error")
+            return
+        self.settings_store.update({'warmup': {'pinned': sorted(self.warmup.pinned)}})
+        self.update_status(f"Unloaded {model}")
 
     def update_status(self, status_text, status_type="info"):
         """Update the status bar with new text and appropriate styling."""
-        print(f"Status: {status_text} [{status_type}]")
+        self.status_label.text = status_text
+        self.status_label.color = STATUS_COLORS.get(status_type, STATUS_COLORS["info"])
+
+    def show_live_rate(self, model):
+        """Show the tokens per second of the replies streaming now"""
+        if self.telemetry.active:
+            self.stats_label.text = f"{model}: {self.telemetry.live_rate('reply'):.1f} tokens/s"
+
+    def show_telemetry(self, record):
+        """Show the speed of a finished reply and its model's recent percentiles
+
+        Background requests such as titles are recorded but not shown.
+        """
+        if record['status'] != 'ok' or record['kind'] != 'reply':
+            return
+        parts = []
+        if record.get('eval_duration'):
+            parts.append(f"{record['eval_count'] / record['eval_duration'] * 1e9:.1f} tokens/s")
+        ttft = self.telemetry.percentiles(model=record['model']).get('ttft')
+        if ttft:
+            values = "/".join(f"{ttft[pct]:.2f}" for pct in (50, 95, 99))
+            parts.append(f"first token p50/p95/p99 {values}s")
+        self.stats_label.text = f"{record['model']}: " + ", ".join(parts)
+
+    async def start_metrics_server(self):
+        """Serve the telemetry to Prometheus on the configured local port"""
+        port = self.app_config['telemetry']['prometheus_port']
+        self.metrics_server = MetricsServer(self.telemetry, port)
+        try:
+            url = await self.metrics_server.start()
+        except OSError as e:
+            self.metrics_server = None
+            self.update_status(f"Could not serve metrics: {e}", "error")
+            return
+        self.update_status(f"Serving metrics at {url}")
+
+    def export_telemetry(self, instance=None):
+        """Write the timing of recent requests to a JSONL file"""
+        if self.telemetry is None:
+            self.show_popup("Telemetry Off", "Turn on telemetry in the settings to record requests")
+            return
+        name = time.strftime('telemetry-%Y%m%d-%H%M%S.jsonl')
+        path = Path(self.app_config.get('save_path', 'saved_chats')) / name
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            count = self.telemetry.export_jsonl(path)
+        except OSError as e:
+            self.show_popup("Error", f"Failed to export telemetry: {e}")
+            return
+        self.show_popup("Telemetry Exported", f"{count} requests written to {path}")
 
     def toggle_theme(self):
         """Toggle between light and dark theme"""
@@ -145,31 +510,47 @@ class ChatApp(App):
         self.change_theme(new_theme)
 
     def clear_chat(self, instance=None):
-        """Clear the chat display"""
-        self.chat_display.text = ''
+        """Clear the chat display and the current session's saved messages"""
+        self.stop_generation()
+        # Other sessions may have text waiting too
+        self.update_batcher.flush()
+        self.session.replace([])
+        self.session_store.delete_messages(self.session_id)
+        self.continuations.forget(self.session_id)
         print("Clear chat clicked")
 
     def save_chat(self, instance=None):
-        """Save chat content to a file"""
-        content = self.chat_display.text
-        try:
-            # Open file dialog popup
-            self.show_save_dialog(content)
-        except Exception as e:
-            self.show_popup("Save Failed", f"Error: {str(e)}")
+        """Checkpoint the chat; finished messages are already in the session store"""
+        self.checkpoint_stream()
+        self.show_popup("Chat Saved", f"Chat history is saved in {self.session_store.path}")
+
+    def export_chat(self, instance=None):
+        """Export the current chat to a Markdown, JSONL, HTML or text file"""
+        self.checkpoint_stream()
+        self.show_save_dialog([self.session_id], 'chat_history.md')
+
+    def export_all_chats(self, instance=None):
+        """Export every chat into one zip archive"""
+        self.checkpoint_stream()
+        session_ids = [session['id'] for session in self.session_store.list_sessions()]
+        self.show_save_dialog(session_ids, 'chats.zip')
+
+    def show_save_dialog(self, session_ids, filename):
+        """Ask for a file name, then export ``session_ids`` to it in the background"""
+        from kivy.uix.popup import Popup
+        from src.exporter import ExportCancelled, ExportJob
 
-    def show_save_dialog(self, content):
-        """Show a file save dialog"""
         layout = BoxLayout(orientation='vertical')
         
         # Add a text input for filename
         filename_input = TextInput(
-            text='chat_history.txt',
+            text=filename,
             multiline=False,
             size_hint_y=None,
             height=40
         )
-        layout.add_widget(Label(text='Enter filename:'))
+        status = Label(text='Enter filename (.md, .jsonl, .html, .txt or .zip):')
+        layout.add_widget(status)
         layout.add_widget(filename_input)
         
         # Add buttons
@@ -177,52 +558,582 @@ class ChatApp(App):
         
         save_btn = Button(text='Save')
         cancel_btn = Button(text='Cancel')
-        
+
+        def progress(done, total):
+            Clock.schedule_once(
+                lambda dt: setattr(status, 'text', f"Exported {done} of {total} messages"))
+
+        def finished(error):
+            def report(dt):
+                self.export_job = None
+                popup.dismiss()
+                if error is None:
+                    self.show_popup("Success", f"Chat exported to {filename_input.text}")
+                elif isinstance(error, ExportCancelled):
+                    self.show_popup("Export Cancelled", "Nothing was written")
+                else:
+                    self.show_popup("Error", f"Failed to export: {error}")
+            Clock.schedule_once(report)
+
         def save(instance):
             try:
-                with open(filename_input.text, 'w') as f:
-                    f.write(content)
-                self.show_popup("Success", "Chat saved successfully!")
+                job = ExportJob(
+                    self.session_store.path, session_ids, filename_input.text,
+                    on_progress=progress, on_done=finished,
+                )
+            except ValueError as e:
+                status.text = str(e)
+                return
+            save_btn.disabled = True
+            filename_input.disabled = True
+            self.export_job = job.start()
+
+        def cancel(instance):
+            if self.export_job is not None:
+                self.export_job.cancel()
+            else:
                 popup.dismiss()
-            except Exception as e:
-                self.show_popup("Error", f"Failed to save: {str(e)}")
         
         save_btn.bind(on_release=save)
-        cancel_btn.bind(on_release=lambda x: popup.dismiss())
+        cancel_btn.bind(on_release=cancel)
         
         buttons.add_widget(save_btn)
         buttons.add_widget(cancel_btn)
         layout.add_widget(buttons)
         
         popup = Popup(
-            title='Save Chat',
+            title='Export Chat',
             content=layout,
             size_hint=(None, None),
-            size=(400, 200)
+            size=(400, 200),
+            auto_dismiss=False
         )
         popup.open()
 
     def send_message(self, instance):
         """Send a message"""
         message = self.message_input.text
-        if message:
-            self.receive_message(f"You: {message}")
+        if message or self.pending_attachments:
+            session = self.session
+            attachments, self.pending_attachments = self.pending_attachments, []
+            self.show_attachments()
+            history = self.chat_history()
+            history.append({"role": "user", "content": message})
+            if attachments:
+                history[-1]["images"] = [attachment["image"] for attachment in attachments]
+            message_id = self.session_store.append_message(
+                session.session_id, "user", message, attachments=attachments
+            )
+            self.index_message(message_id, message)
+            key = self.receive_message(
+                message, role="user", id=message_id,
+                attachments=[attachment["key"] for attachment in attachments]
+            )
+            session.mark_saved(session.get(key))
             self.message_input.text = ''
+            self.stop_generation()
+            # Background work such as titling is out of date once the user moves on
+            self.scheduler.supersede(session.session_id)
+            task = asyncio.get_running_loop().create_task(self.generate_reply(history, session))
+            task.add_done_callback(lambda task: self.generation_finished(session))
+            session.generation_task = task
+            self.refresh_sessions()
+
+    def chat_history(self):
+        """Return the conversation so far as /api/chat messages
+
+        Messages with images list their cache keys under ``attachments``;
+        :meth:`load_images` swaps them for the images themselves.
+        """
+        records = [record for record in self.session.data
+                   if record["role"] in ("user", "assistant")]
+        # Bodies paged out to the session store are read without evicting others
+        texts = self.workspace.bodies.texts(records)
+        history = []
+        for record, text in zip(records, texts):
+            message = {"role": record["role"], "content": text}
+            if record.get("attachments"):
+                message["attachments"] = list(record["attachments"])
+            history.append(message)
+        return history
+
+    async def load_images(self, history):
+        """Replace the attachment keys in ``history`` with base64 images read off the UI thread"""
+        for message in history:
+            keys = message.pop("attachments", None)
+            if keys:
+                message["images"] = await self.attachments.images(keys)
+        return history
+
+    def open_attach_dialog(self, instance=None):
+        """Choose image files to attach to the next message"""
+        from kivy.uix.filechooser import FileChooserListView
+        from kivy.uix.popup import Popup
+
+        layout = BoxLayout(orientation='vertical')
+        chooser = FileChooserListView(
+            path=os.path.expanduser('~'),
+            multiselect=True,
+            filters=['*.png', '*.jpg', '*.jpeg', '*.webp', '*.gif', '*.bmp']
+        )
+        layout.add_widget(chooser)
+        buttons = BoxLayout(size_hint_y=None, height=40)
+        attach_btn = Button(text='Attach')
+        cancel_btn = Button(text='Cancel')
+        buttons.add_widget(attach_btn)
+        buttons.add_widget(cancel_btn)
+        layout.add_widget(buttons)
+        popup = Popup(title='Attach Images', content=layout, size_hint=(0.9, 0.9))
+
+        def attach(instance):
+            popup.dismiss()
+            if chooser.selection:
+                self.start_background(self.attach_files(chooser.selection))
+
+        attach_btn.bind(on_release=attach)
+        cancel_btn.bind(on_release=lambda btn: popup.dismiss())
+        popup.open()
+
+    async def attach_files(self, paths):
+        """Prepare images for the next message in the background, all at once"""
+        self.update_status(f"Preparing {len(paths)} image{'s' if len(paths) > 1 else ''}...")
+        attachments, errors = await self.attachments.prepare_many(paths)
+        self.pending_attachments.extend(attachments)
+        self.show_attachments()
+        if errors:
+            self.update_status("; ".join(errors), "error")
+        else:
+            self.update_status(f"{len(self.pending_attachments)} image(s) ready to send")
+        return attachments
+
+    def show_attachments(self):
+        """Show thumbnails of the pending attachments; tapping one removes it"""
+        self.attachment_bar.clear_widgets()
+        for attachment in self.pending_attachments:
+            thumbnail = Button(
+                background_normal=attachment["thumbnail"],
+                background_down=attachment["thumbnail"],
+                size_hint=(None, 1),
+                width=64
+            )
+            thumbnail.bind(on_release=lambda btn, a=attachment: self.remove_attachment(a))
+            self.attachment_bar.add_widget(thumbnail)
+        shown = bool(self.pending_attachments)
+        self.attachment_bar.height = 64 if shown else 0
+        self.attachment_bar.opacity = 1 if shown else 0
+
+    def remove_attachment(self, attachment):
+        """Drop an image from the next message"""
+        self.pending_attachments.remove(attachment)
+        self.show_attachments()
+
+    async def generate_reply(self, history, session=None):
+        """Stream the model's reply to ``history`` into a new message of ``session``
+
+        ``session`` defaults to the one shown; the reply keeps streaming into
+        it while other sessions are shown or generating.
+        """
+        session = session or self.session
+        session_id = session.session_id
+
+        def status(text, status_type="info"):
+            # The status bar describes the session being shown
+            if session is self.session:
+                self.update_status(text, status_type)
+
+        model = self.app_config.get("model")
+        parameters = dict(self.app_config.get("ollama", {}).get("parameters", {}))
+        parameters.update(self.context_window.options())
+        history = await self.retrieve_context(await self.load_images(history), session)
+        turn = None
+        # The generate endpoint takes images for the new turn only, so chats
+        # with images are always sent whole
+        if (self.app_config.get("context", {}).get("continuation")
+                and not any(message.get("images") for message in history)):
+            # Only the new message is prefilled when the chat continues
+            # from the context tokens of the last reply
+            turn = self.continuations.plan(session_id, model, history)
+            prompt_tokens = turn["tokens"]
+            stream = self.scheduler.stream(
+                lambda: self.ollama_client.stream_generate(
+                    model, turn["prompt"], turn["system"], parameters, context=turn["context"]
+                ),
+                key=request_key("generate", model, turn, parameters),
+                priority=INTERACTIVE,
+                group=session_id
+            )
+        else:
+            history, prompt_tokens = self.context_window.build(history)
+            stream = self.scheduler.stream(
+                lambda: self.ollama_client.stream_chat(model, history, parameters),
+                key=request_key("chat", model, history, parameters),
+                priority=INTERACTIVE,
+                group=session_id
+            )
+        message_id = self.session_store.append_message(
+            session_id, "assistant", "", model=model, finalized=False
+        )
+        key = self.receive_message("", role="assistant", session=session, id=message_id, model=model)
+        record = session.get(key)
+        parts = []
+        session.streaming = (message_id, parts)
+        checkpoint = Clock.schedule_interval(
+            lambda dt: self.checkpoint_stream(session),
+            self.app_config.get('storage', {}).get('checkpoint_interval', 2)
+        )
+        self.update_controls()
+        status(f"Generating with {model} ({prompt_tokens} prompt tokens)...")
+        rate_display = None
+        if self.telemetry is not None:
+            rate_display = Clock.schedule_interval(lambda dt: self.show_live_rate(model), 0.5)
+        final = {}
+        try:
+            async for chunk in stream:
+                parts.append(chunk["token"])
+                self.stream_message(key, chunk["token"], session)
+                if chunk.get("done"):
+                    final = chunk
+            reply = {"role": "assistant", "content": "".join(parts)}
+            if turn is not None:
+                self.continuations.update(session_id, model, history, reply["content"],
+                                          final.get("context"))
+                reused = len(turn["context"] or [])
+                status(
+                    f"Ready ({final.get('prompt_eval_count', 0)} prompt tokens prefilled, "
+                    f"{reused} reused)"
+                )
+            else:
+                status("Ready")
+            if (self.app_config.get('storage', {}).get('auto_title', True)
+                    and not self.session_store.get_session(session_id)["title"]):
+                self.generate_title(session_id, history + [reply])
+        except asyncio.CancelledError:
+            status("Generation stopped")
+            raise
+        except request_errors() as e:
+            status(f"Generation failed: {e}", "error")
+            self.receive_message(f"Error: {e}", role="system", session=session)
+        finally:
+            checkpoint.cancel()
+            if rate_display is not None:
+                rate_display.cancel()
+            self.session_store.finalize_message(message_id, "".join(parts))
+            self.index_message(message_id, "".join(parts))
+            self.update_batcher.flush()
+            session.mark_saved(record)
+            session.streaming = None
+            self.update_controls()
+
+    def generation_finished(self, session):
+        """Unmark a session whose generation ended and page out idle ones if needed"""
+        self.refresh_sessions()
+        self.workspace.enforce()
+
+    def generate_title(self, session_id, history):
+        """Name a session after its first exchange, as a background request"""
+        model = self.app_config.get("model")
+        messages = history + [{"role": "user", "content": TITLE_PROMPT}]
+        # The request runs in a task that inherits the kind set here
+        kind = request_kind.set("title")
+        try:
+            stream = self.scheduler.stream(
+                lambda: self.ollama_client.stream_chat(model, messages, {"temperature": 0}),
+                key=request_key("title", model, messages),
+                priority=BACKGROUND,
+                group=session_id
+            )
+        finally:
+            request_kind.reset(kind)
+        return self.start_background(self.save_title(session_id, stream))
+
+    async def save_title(self, session_id, stream):
+        """Store the title streamed by :meth:`generate_title`"""
+        parts = []
+        try:
+            async for chunk in stream:
+                parts.append(chunk["token"])
+        except request_errors():
+            return None
+        title = " ".join("".join(parts).split()).strip(" \"'.")[:80]
+        if title:
+            self.session_store.rename_session(session_id, title)
+            if session_id in self.workspace:
+                self.workspace.sessions[session_id].title = title
+            self.refresh_sessions()
+        return title
+
+    def open_embedding_index(self):
+        """Open the semantic search index and start embedding messages as they are saved"""
+        from src.embedding_index import EmbeddingIndex, EmbeddingIndexer
+
+        embeddings = self.app_config['embeddings']
+        self.embedding_index = EmbeddingIndex.from_config(self.app_config)
+        self.embedding_indexer = EmbeddingIndexer(
+            self.embedding_index,
+            self.embed_texts,
+            source=self.session_store.load_after,
+            batch_size=embeddings.get('batch_size', 32)
+        )
 
-    def receive_message(self, message):
-        """Display a received message"""
-        self.chat_display.text += f"{message}\n"
-        # Scroll to the bottom
-        self.chat_display.cursor = (0, len(self.chat_display.text))
+    async def embed_texts(self, texts):
+        """Return the embedding vectors of ``texts``"""
+        model = self.app_config.get('embeddings', {}).get('model', 'nomic-embed-text')
+        return await self.ollama_client.embed(model, texts)
+
+    def index_message(self, message_id, text):
+        """Queue a saved message for the semantic search index"""
+        if self.embedding_indexer is not None:
+            self.embedding_indexer.submit(message_id, text)
+
+    async def retrieve_context(self, history, session=None):
+        """Prepend the past messages most similar to the last one in ``history``
+
+        Messages already in ``session``, by default the one shown, are left out.
+        """
+        embeddings = self.app_config.get('embeddings', {})
+        if self.embedding_index is None or not embeddings.get('retrieval') or not history:
+            return history
+        try:
+            [vector] = await self.embed_texts([history[-1]['content']])
+        except request_errors():
+            # Answer without retrieved context rather than not at all
+            return history
+        shown = {record.get('id') for record in (session or self.session).data} - {None}
+        hits = await asyncio.to_thread(
+            self.embedding_index.search, vector, embeddings.get('retrieval_k', 3), shown
+        )
+        ids = [message_id for message_id, score in hits
+               if score >= embeddings.get('min_score', 0.5)]
+        messages = self.session_store.get_messages(ids)
+        if not messages:
+            return history
+        excerpts = "\n\n".join(
+            f"[{message['role']}] {message['content'][:1000]}" for message in messages
+        )
+        context = {
+            "role": "system",
+            "content": "Possibly relevant excerpts from earlier conversations:\n\n" + excerpts,
+        }
+        return [context] + history
+
+    def start_background(self, coro):
+        """Run ``coro`` as a background task that is cancelled on shutdown"""
+        task = asyncio.get_running_loop().create_task(coro)
+        self.background_tasks.add(task)
+        task.add_done_callback(self.background_tasks.discard)
+        return task
+
+    def stop_generation(self, instance=None):
+        """Cancel the shown session's generation; its HTTP response is closed immediately"""
+        task = self.generation_task
+        if task is not None and not task.done():
+            task.cancel()
+        self.generation_task = None
+
+    def checkpoint_stream(self, session=None):
+        """Save the text streamed so far for replies being generated
+
+        Only ``session`` is saved when it is given, otherwise every open one.
+        """
+        sessions = [session] if session is not None else self.workspace.sessions.values()
+        for session in sessions:
+            if session.streaming is not None:
+                message_id, parts = session.streaming
+                self.session_store.checkpoint_message(message_id, "".join(parts))
+
+    def receive_message(self, message, role="assistant", session=None, **fields):
+        """Add a message to ``session``, by default the one shown; returns its key"""
+        return (session or self.session).append(role, message, **fields)
+
+    def stream_message(self, key, delta, session=None):
+        """Queue streamed text for the message with ``key``; shown on the next flush"""
+        self.update_batcher.push(((session or self.session).session_id, key), delta)
+
+    def _flush_stream_updates(self, updates):
+        """Apply one frame's worth of streamed text to the sessions' messages"""
+        for (session_id, key), text in updates.items():
+            session = self.workspace.sessions.get(session_id)
+            # Text for a tab closed since is already in the session store
+            if session is not None:
+                session.extend(key, text)
+
+    def update_controls(self):
+        """Enable Send or Stop for the shown session"""
+        generating = self.session.streaming is not None
+        self.send_button.disabled = generating
+        self.stop_button.disabled = not generating
+
+    def refresh_sessions(self):
+        """Redraw the tabs and the sidebar, marking the sessions that are generating"""
+        active_id = self.session_id if self.session is not None else None
+        generating = {session_id for session_id, session in self.workspace.sessions.items()
+                      if session.is_generating()}
+        self.tab_bar.set_tabs(
+            [(session_id, session.title, session_id in generating)
+             for session_id, session in self.workspace.sessions.items()],
+            active_id
+        )
+        self.sidebar.set_sessions(self.session_store.list_sessions(), active_id, generating)
+
+    def load_history(self):
+        """Reload the most recent page of the shown session"""
+        self.workspace.load(self.session)
+
+    def load_older_history(self):
+        """Prepend the page of messages before the oldest one shown"""
+        session = self.session
+        ids = [record['id'] for record in session.data if 'id' in record]
+        if not session.has_older_history or not ids:
+            return
+        page_size = self.workspace.page_size
+        rows = self.session_store.load_recent(session.session_id, page_size, before_id=ids[0])
+        session.has_older_history = len(rows) == page_size
+        session.prepend(self.workspace.records(rows))
+
+    def _on_chat_scroll(self, instance, scroll_y):
+        if scroll_y >= 0.999 and self.session is not None and self.has_older_history:
+            self.load_older_history()
+
+    def toggle_search_mode(self, instance=None):
+        """Switch the search box between keyword and semantic search"""
+        self.search_mode = 'semantic' if self.search_mode == 'keyword' else 'keyword'
+        self.search_mode_button.text = 'Meaning' if self.search_mode == 'semantic' else 'Words'
+        self._search_trigger()
+
+    def run_search(self, *args):
+        """Show the best matches for the search box text"""
+        if self.search_mode == 'semantic':
+            self.start_background(self.run_semantic_search(self.search_input.text))
+        else:
+            self.start_background(self.run_keyword_search(self.search_input.text))
+
+    async def run_keyword_search(self, text):
+        """Show the saved messages containing the words of ``text``, searched off the UI thread"""
+        results = await self.search_index.search_async(text)
+        if text != self.search_input.text:
+            # The query changed while this one was running
+            return
+        self.show_search_results(results)
+
+    async def run_semantic_search(self, text, limit=20):
+        """Show the saved messages closest in meaning to ``text``"""
+        if not text.strip():
+            self.show_search_results([])
+            return
+        try:
+            [vector] = await self.embed_texts([text])
+        except request_errors() as e:
+            self.update_status(f"Semantic search failed: {e}", "error")
+            return
+        hits = await asyncio.to_thread(self.embedding_index.search, vector, limit)
+        if text != self.search_input.text:
+            # The query changed while this one was running
+            return
+        results = self.session_store.get_messages(message_id for message_id, _ in hits)
+        for result in results:
+            result["snippet"] = make_snippet(result.pop("content"), text)
+        self.show_search_results(results)
+
+    def show_search_results(self, results):
+        """Fill the search dropdown with ``results``"""
+        from kivy.uix.dropdown import DropDown
+
+        if self.search_dropdown is None:
+            if not results:
+                return
+            self.search_dropdown = DropDown()
+        self.search_dropdown.clear_widgets()
+        if not results:
+            self.search_dropdown.dismiss()
+            return
+        for result in results:
+            snippet = highlight(result["snippet"], "[b]", "[/b]", escape=escape_markup)
+            result_btn = Button(
+                text=snippet.replace("\n", " "),
+                markup=True,
+                shorten=True,
+                size_hint_y=None,
+                height=40
+            )
+            result_btn.bind(on_release=lambda btn, r=result: self.open_search_result(r))
+            self.search_dropdown.add_widget(result_btn)
+        if self.search_dropdown.attach_to is None:
+            self.search_dropdown.open(self.search_input)
+
+    def open_search_result(self, result):
+        """Open the session containing a search result"""
+        if self.search_dropdown is not None:
+            self.search_dropdown.dismiss()
+        self.open_session(result["session_id"])
+
+    def open_session(self, session_id):
+        """Show a saved session, opening a tab for it if it has none
+
+        Generations keep streaming into the sessions that are not shown.
+        """
+        self.workspace.show(session_id, self.chat_display)
+        self.update_controls()
+        self.refresh_sessions()
 
     def new_chat(self, instance=None):
-        """Start a new chat"""
-        self.clear_chat()
-        self.receive_message("Welcome to the Chat Application! Type a message to begin.")
+        """Start a new chat in a new tab"""
+        self.open_session(self.session_store.create_session())
+        self.receive_message(WELCOME_MESSAGE, role="system")
+
+    def close_tab(self, session_id):
+        """Close a session's tab, stopping its generation; the session stays saved"""
+        ids = list(self.workspace.sessions)
+        session = self.workspace.close(session_id)
+        if session is None:
+            return
+        task = session.generation_task
+        if task is not None and not task.done():
+            task.cancel()
+            # Shutdown waits for the partial reply to be saved
+            self.background_tasks.add(task)
+            task.add_done_callback(self.background_tasks.discard)
+        if self.session is not None:
+            self.refresh_sessions()
+        elif self.workspace.sessions:
+            index = ids.index(session_id)
+            self.open_session(ids[index - 1] if index else ids[1])
+        else:
+            self.new_chat()
 
     def toggle_settings(self, instance=None):
-        """Toggle settings panel"""
-        self.show_popup("Settings", "Settings panel would appear here.")
+        """Open the settings dialog; saved changes arrive through on_settings_changed"""
+        from src.settings_dialog import SettingsDialog, dialog_values
+
+        SettingsDialog(settings=dialog_values(self.app_config)).open()
+
+    def on_settings_changed(self, settings):
+        """Apply settings changed in the dialog or in the settings file"""
+        previous, self.app_config = self.app_config, settings
+        self.context_window = ContextWindow.from_config(settings)
+        self.continuations.context_window = self.context_window
+        self.workspace.configure(settings)
+        self.scheduler.configure(settings)
+        self.chat_display.message_colors = settings.get('message_colors', {})
+        if settings.get("ollama") != previous.get("ollama") and self._ollama_client is not None:
+            # The next request creates a client for the new hosts; replies
+            # still streaming from the old one are left to finish
+            client, self._ollama_client = self._ollama_client, None
+            running = [session.generation_task for session in self.workspace.sessions.values()
+                       if session.is_generating()]
+            self.start_background(self.retire_client(client, running + list(self.background_tasks)))
+            asyncio.get_running_loop().create_task(self.connect_to_ollama())
+        elif settings.get('model') != previous.get('model') and self.warmup is not None:
+            # Load the new model now rather than on the first message
+            self.warmup.preload(settings['model'])
+        self.show_model_state()
+
+    async def retire_client(self, client, tasks):
+        """Close a replaced client once ``tasks``, which may be using it, have finished"""
+        try:
+            if tasks:
+                await asyncio.wait(tasks)
+        finally:
+            await client.close()
 
     def change_theme(self, theme_name):
         """Change the theme"""
@@ -232,10 +1143,13 @@ class ChatApp(App):
         text_color = (0.9, 0.9, 0.9, 1) if theme_name == "dark" else (0.1, 0.1, 0.1, 1)
         self.chat_display.background_color = bg_color
         self.chat_display.foreground_color = text_color
+        self.chat_display.theme = theme_name
         self.show_popup("Theme Changed", f"Theme changed to {theme_name}")
 
     def show_popup(self, title, content):
         """Show a popup with the given title and content"""
+        from kivy.uix.popup import Popup
+
         popup = Popup(
             title=title,
             content=Label(text=content),
@@ -244,5 +1158,11 @@ class ChatApp(App):
         )
         popup.open()
 
+async def main():
+    app = ChatApp()
+    await app.async_run(async_lib='asyncio')
+    if app.closing is not None:
+        await app.closing
+
 if __name__ == "__main__":
-    ChatApp().run()
+    asyncio.run(main())
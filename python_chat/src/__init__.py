@@ -1,2 +1,9 @@
 from .config import *
-from .ollama_client import OllamaClient
+
+
+def __getattr__(name):
+    # The client pulls in aiohttp, so it is only imported when asked for
+    if name in ("OllamaClient", "OllamaError"):
+        from . import ollama_client
+        return getattr(ollama_client, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,244 @@
+import asyncio
+import base64
+import hashlib
+import io
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+# Bytes hashed per read when fingerprinting an attached file
+HASH_CHUNK = 1024 * 1024
+
+
+class AttachmentError(Exception):
+    """Raised when a file cannot be attached, with a message for the user."""
+
+
+def file_digest(path):
+    """Return the SHA-256 of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def prepare_image(source, image_path, thumbnail_path, max_side, quality, thumbnail_size):
+    """Downscale ``source`` for the model and save it and its thumbnail.
+
+    Runs in a worker process. The image is decoded at reduced scale where
+    the format allows it, turned upright from its EXIF orientation, fitted
+    in ``max_side`` pixels and saved as a JPEG at ``image_path``; a PNG
+    thumbnail goes to ``thumbnail_path``. Returns the JPEG base64-encoded,
+    as Ollama takes it, with the new size.
+    """
+    from PIL import Image, ImageOps
+
+    try:
+        with Image.open(source) as image:
+            # JPEGs decode straight to the nearest power-of-two scale, so a
+            # 12-megapixel photo is never decoded at full size
+            image.draft("RGB", (max_side, max_side))
+            image = ImageOps.exif_transpose(image).convert("RGB")
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        raise AttachmentError(f"{Path(source).name} is not an image Pillow can read: {e}") from None
+    image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+    encoded = io.BytesIO()
+    image.save(encoded, "JPEG", quality=quality, optimize=True)
+    data = encoded.getvalue()
+    thumbnail = image.copy()
+    thumbnail.thumbnail((thumbnail_size, thumbnail_size), Image.Resampling.LANCZOS)
+    thumbnail_data = io.BytesIO()
+    thumbnail.save(thumbnail_data, "PNG")
+    try:
+        _write_atomic(thumbnail_path, thumbnail_data.getvalue())
+        _write_atomic(image_path, data)
+    except OSError as e:
+        raise AttachmentError(f"Cannot save {Path(source).name}: {e.strerror or e}") from None
+    return {
+        "image": base64.b64encode(data).decode("ascii"),
+        "width": image.width,
+        "height": image.height,
+    }
+
+
+def _write_atomic(path, data):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    partial = path.with_name(path.name + ".partial")
+    partial.write_bytes(data)
+    os.replace(partial, path)
+
+
+class AttachmentCache:
+    """Prepared images addressed by the hash of the original file and the settings.
+
+    Each entry is a downscaled JPEG and a PNG thumbnail on disk, so the same
+    photo is only ever processed once and thumbnails are shown straight
+    from their file. The base64 form of the last ``max_entries`` images
+    used is also kept in memory.
+    """
+
+    def __init__(self, directory, max_entries=32):
+        self.directory = Path(directory)
+        self.max_entries = max_entries
+        self._memory = OrderedDict()
+
+    def image_path(self, key):
+        return self.directory / key[:2] / f"{key}.jpg"
+
+    def thumbnail_path(self, key):
+        return self.directory / key[:2] / f"{key}.thumb.png"
+
+    def get(self, key, disk=True):
+        """Return the cached attachment for ``key``, or None.
+
+        A memory miss reads the disk unless ``disk`` is false.
+        """
+        attachment = self._memory.get(key)
+        if attachment is not None:
+            self._memory.move_to_end(key)
+            return attachment
+        attachment = self.read(key) if disk else None
+        if attachment is not None:
+            self.put(key, attachment)
+        return attachment
+
+    def read(self, key):
+        """Load ``key`` from disk without touching the memory tier; safe in any thread."""
+        try:
+            data = self.image_path(key).read_bytes()
+        except OSError:
+            return None
+        return {
+            "key": key,
+            "image": base64.b64encode(data).decode("ascii"),
+            "thumbnail": str(self.thumbnail_path(key)),
+        }
+
+    def put(self, key, attachment):
+        self._memory[key] = attachment
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+
+class AttachmentPipeline:
+    """Turns image files into attachments for multimodal models such as llava.
+
+    Hashing runs in a thread and decoding, downscaling to ``max_side``,
+    re-encoding and base64 run in a pool of ``workers`` processes, so the
+    UI thread only ever waits on a future. Results go to an
+    :class:`AttachmentCache`; attaching an image that was attached before,
+    or twice at once, does the work once.
+
+    An attachment is a dict with the cache ``key``, the file ``name``, the
+    base64 ``image`` and the ``thumbnail`` path.
+    """
+
+    def __init__(self, directory, max_side=672, quality=85, thumbnail_size=96, workers=2,
+                 cache_entries=32):
+        self.cache = AttachmentCache(directory, cache_entries)
+        self.max_side = max_side
+        self.quality = quality
+        self.thumbnail_size = thumbnail_size
+        self.workers = workers
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "processed": 0}
+        self._executor = None
+        self._pending = {}
+
+    @classmethod
+    def from_config(cls, config):
+        """Create a pipeline from the ``attachments`` section of the app config."""
+        attachments = config.get("attachments", {})
+        return cls(
+            Path(config.get("save_path", "saved_chats")) / "attachments",
+            max_side=attachments.get("max_side", 672),
+            quality=attachments.get("quality", 85),
+            thumbnail_size=attachments.get("thumbnail_size", 96),
+            workers=attachments.get("workers", 2),
+            cache_entries=attachments.get("cache_entries", 32),
+        )
+
+    async def prepare(self, path):
+        """Return the attachment for the image at ``path``; raises AttachmentError."""
+        path = Path(path)
+        try:
+            digest = await asyncio.to_thread(file_digest, path)
+        except OSError as e:
+            raise AttachmentError(f"Cannot read {path.name}: {e.strerror or e}") from None
+        key = f"{digest}-{self.max_side}-{self.quality}-{self.thumbnail_size}"
+        attachment = self.cache.get(key, disk=False)
+        if attachment is not None:
+            self.stats["memory_hits"] += 1
+        else:
+            attachment = await asyncio.to_thread(self.cache.read, key)
+            if attachment is not None:
+                self.stats["disk_hits"] += 1
+                self.cache.put(key, attachment)
+        if attachment is None:
+            task = self._pending.get(key)
+            if task is None:
+                task = self._pending[key] = asyncio.ensure_future(self._process(path, key))
+                task.add_done_callback(lambda task: self._pending.pop(key, None))
+            attachment = await asyncio.shield(task)
+        return dict(attachment, name=path.name)
+
+    async def prepare_many(self, paths):
+        """Prepare a batch of files at once; returns ``(attachments, errors)``.
+
+        ``errors`` holds a message for each file that could not be attached;
+        the others are attached all the same.
+        """
+        results = await asyncio.gather(*(self.prepare(path) for path in paths),
+                                       return_exceptions=True)
+        attachments, errors = [], []
+        for result in results:
+            if isinstance(result, AttachmentError):
+                errors.append(str(result))
+            elif isinstance(result, BaseException):
+                raise result
+            else:
+                attachments.append(result)
+        return attachments, errors
+
+    async def images(self, keys):
+        """Return the base64 images of ``keys``; images missing from the cache are skipped.
+
+        Images that are not in memory are read from disk in a thread.
+        """
+        found = {key: self.cache.get(key, disk=False) for key in keys}
+        missing = [key for key, attachment in found.items() if attachment is None]
+        if missing:
+            loaded = await asyncio.to_thread(lambda: [self.cache.read(key) for key in missing])
+            for key, attachment in zip(missing, loaded):
+                if attachment is not None:
+                    self.cache.put(key, attachment)
+                    found[key] = attachment
+        return [found[key]["image"] for key in keys if found[key] is not None]
+
+    async def _process(self, path, key):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        loop = asyncio.get_running_loop()
+        try:
+            result = await loop.run_in_executor(
+                self._executor, prepare_image, str(path),
+                self.cache.image_path(key), self.cache.thumbnail_path(key),
+                self.max_side, self.quality, self.thumbnail_size,
+            )
+        except BrokenProcessPool:
+            self._executor = None
+            raise AttachmentError(f"Processing {path.name} stopped unexpectedly") from None
+        attachment = dict(result, key=key, thumbnail=str(self.cache.thumbnail_path(key)))
+        self.cache.put(key, attachment)
+        self.stats["processed"] += 1
+        return attachment
+
+    def close(self):
+        """Stop the worker processes; images being processed are abandoned."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,337 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+import aiohttp
+
+from .host_pool import percentile
+from .ollama_client import OllamaClient, OllamaError, OllamaTimeoutError
+from .settings_store import deep_merge
+
+# Bytes read at a time when looking for the end of the last complete line
+TAIL_CHUNK = 4096
+
+
+class InvalidJob(ValueError):
+    """Raised for an input line that is JSON but not a job; ``job_id`` is its id."""
+
+    def __init__(self, message, job_id):
+        super().__init__(message)
+        self.job_id = job_id
+
+
+def parse_prompt(line, index):
+    """Return the job for one input line, or None for a blank line.
+
+    A line is a JSON object with ``prompt`` or ``messages`` and optionally
+    ``id``, ``model``, ``system`` and ``options``; any other line is taken
+    as the prompt text itself. Jobs without an ``id`` are numbered by line.
+    Raises InvalidJob for an object with neither ``prompt`` nor ``messages``,
+    or with ``options`` that are not an object.
+    """
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        job = json.loads(line)
+    except ValueError:
+        job = None
+    if not isinstance(job, dict):
+        job = {"prompt": line}
+    job.setdefault("id", index + 1)
+    if "prompt" not in job and "messages" not in job:
+        raise InvalidJob(f"line {index + 1}: needs 'prompt' or 'messages'", job["id"])
+    if not isinstance(job.get("options") or {}, dict):
+        raise InvalidJob(f"line {index + 1}: 'options' must be an object", job["id"])
+    job["index"] = index
+    return job
+
+
+def load_done(path):
+    """Return the ids of the jobs that already succeeded in an output file."""
+    done = set()
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    result = json.loads(line)
+                except ValueError:
+                    # The last line of a crashed run may be cut short
+                    continue
+                if result.get("ok"):
+                    done.add(result["id"])
+    except FileNotFoundError:
+        pass
+    return done
+
+
+def trim_partial_line(path):
+    """Cut a line left unfinished by a killed run off the end of ``path``.
+
+    Appending to a torn line would glue the next result onto it and lose
+    both, so a resumed run starts after the last complete line.
+    """
+    try:
+        f = open(path, "rb+")
+    except FileNotFoundError:
+        return
+    with f:
+        size = end = f.seek(0, os.SEEK_END)
+        while end > 0:
+            start = max(end - TAIL_CHUNK, 0)
+            f.seek(start)
+            newline = f.read(end - start).rfind(b"\n")
+            if newline != -1:
+                end = start + newline + 1
+                break
+            end = start
+        if end < size:
+            f.truncate(end)
+
+
+def is_retryable(error):
+    """Return True for failures worth retrying: lost connections, timeouts and 5xx.
+
+    Client errors such as an unknown model or a bad request fail the same
+    way every time, so they are reported at once.
+    """
+    if isinstance(error, (aiohttp.ClientError, asyncio.TimeoutError, OllamaTimeoutError)):
+        return True
+    return isinstance(error, OllamaError) and error.status is not None and error.status >= 500
+
+
+def summarize(results, elapsed):
+    """Return throughput and latency percentiles for a list of results."""
+    ok = [r for r in results if r["ok"]]
+    summary = {
+        "requests": len(results),
+        "ok": len(ok),
+        "failed": len(results) - len(ok),
+        "elapsed": round(elapsed, 3),
+        "requests_per_s": round(len(ok) / elapsed, 2) if elapsed else 0,
+        "tokens_per_s": round(sum(r["eval_count"] for r in ok) / elapsed, 1) if elapsed else 0,
+    }
+    for name in ("latency", "ttft"):
+        values = [r[name] for r in ok if r[name] is not None]
+        for pct in (50, 95, 99):
+            summary[f"{name}_p{pct}"] = round(percentile(values, pct), 3) if values else None
+    return summary
+
+
+class BatchRunner:
+    """Runs prompt jobs against an OllamaClient with bounded concurrency.
+
+    At most ``concurrency`` jobs are in flight. A job that fails with a
+    retryable error (see :func:`is_retryable`) is tried again up to
+    ``retries`` times, waiting ``backoff`` seconds, then twice as long, and
+    so on. An input line that is not a valid job is reported as failed.
+    Results are handed to the output as soon as they finish, or in input
+    order when ``ordered`` is set, and the output is flushed after every
+    line so a crashed run can be resumed.
+    """
+
+    def __init__(self, client, model, concurrency=4, retries=2, backoff=1.0, ordered=False,
+                 parameters=None):
+        self.client = client
+        self.model = model
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.ordered = ordered
+        self.parameters = parameters
+        self.results = []
+        self._pending = {}
+        self._next = 0
+
+    async def run(self, lines, out, skip=()):
+        """Run a job for every line of ``lines``, writing results to ``out``.
+
+        Jobs whose id is in ``skip`` are not run. ``lines`` is read as the
+        jobs are started, so it may be a large file or a pipe. Returns the
+        summary of the results.
+        """
+        started = time.perf_counter()
+        queue = asyncio.Queue(self.concurrency)
+        workers = [asyncio.ensure_future(self._worker(queue, out))
+                   for _ in range(self.concurrency)]
+        try:
+            index = 0
+            while True:
+                line = await asyncio.to_thread(lines.readline)
+                if not line:
+                    break
+                try:
+                    job = parse_prompt(line, index)
+                except InvalidJob as e:
+                    result = {"id": e.job_id, "ok": False, "error": str(e)}
+                    self.results.append(result)
+                    self._emit(out, index, result)
+                    index += 1
+                    continue
+                index += 1
+                if job is None or job["id"] in skip:
+                    self._emit(out, index - 1, None)
+                    continue
+                await queue.put(job)
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
+        return summarize(self.results, time.perf_counter() - started)
+
+    async def _worker(self, queue, out):
+        while True:
+            job = await queue.get()
+            if job is None:
+                return
+            result = await self.run_job(job)
+            self.results.append(result)
+            self._emit(out, job["index"], result)
+
+    async def run_job(self, job):
+        """Run one job, retrying failures; returns its result record."""
+        result = {"id": job["id"], "model": job.get("model") or self.model, "ok": False}
+        for attempt in range(self.retries + 1):
+            if attempt:
+                await asyncio.sleep(self.backoff * 2 ** (attempt - 1))
+            result["attempts"] = attempt + 1
+            try:
+                result.update(await self._request(job, result["model"]))
+            except (OllamaError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                result["error"] = str(e) or type(e).__name__
+                if is_retryable(e):
+                    continue
+                break
+            result["ok"] = True
+            result.pop("error", None)
+            break
+        if not result["ok"]:
+            result.update(response=None, ttft=None, latency=None, eval_count=0)
+        return result
+
+    async def _request(self, job, model):
+        parameters = dict(self.parameters or {}, **(job.get("options") or {}))
+        if "messages" in job:
+            stream = self.client.stream_chat(model, job["messages"], parameters)
+        else:
+            stream = self.client.stream_generate(model, job["prompt"], job.get("system", ""),
+                                                 parameters)
+        started = time.perf_counter()
+        ttft = None
+        tokens = []
+        final = {}
+        async for record in stream:
+            if ttft is None and record["token"]:
+                ttft = time.perf_counter() - started
+            tokens.append(record["token"])
+            if record.get("done"):
+                final = record
+        return {
+            "response": "".join(tokens),
+            "ttft": ttft,
+            "latency": time.perf_counter() - started,
+            "eval_count": final.get("eval_count", 0),
+            "prompt_eval_count": final.get("prompt_eval_count", 0),
+        }
+
+    def _emit(self, out, index, result):
+        if not self.ordered:
+            if result is not None:
+                self._write(out, result)
+            return
+        # Hold results back until every earlier line has been written
+        self._pending[index] = result
+        while self._next in self._pending:
+            result = self._pending.pop(self._next)
+            self._next += 1
+            if result is not None:
+                self._write(out, result)
+
+    def _write(self, out, result):
+        out.write(json.dumps(result, ensure_ascii=False) + "\n")
+        out.flush()
+
+
+def format_summary(summary):
+    """Return the summary as the lines printed at the end of a run."""
+    def percentiles(name):
+        values = [summary[f"{name}_p{pct}"] for pct in (50, 95, 99)]
+        return " / ".join("-" if v is None else f"{v:.3f}s" for v in values)
+
+    return (
+        f"{summary['ok']} ok, {summary['failed']} failed in {summary['elapsed']:.1f}s: "
+        f"{summary['requests_per_s']} requests/s, {summary['tokens_per_s']} tokens/s\n"
+        f"latency p50/p95/p99: {percentiles('latency')}\n"
+        f"first token p50/p95/p99: {percentiles('ttft')}"
+    )
+
+
+async def run_batch(args, config):
+    """Run the batch described by parsed command line ``args``; returns the summary."""
+    if args.host:
+        config = deep_merge(config, {"ollama": {"host": args.host.rstrip("/"), "hosts": []}})
+    client = OllamaClient.from_config(config)
+    runner = BatchRunner(
+        client,
+        args.model or config.get("model", "mistral"),
+        concurrency=args.concurrency,
+        retries=args.retries,
+        backoff=args.backoff,
+        ordered=args.ordered,
+        parameters=config.get("ollama", {}).get("parameters"),
+    )
+    skip = load_done(args.output) if args.resume and args.output else set()
+    lines = open(args.input, "r", encoding="utf-8") if args.input != "-" else sys.stdin
+    if args.output:
+        if args.resume:
+            trim_partial_line(args.output)
+        out = open(args.output, "a" if args.resume else "w", encoding="utf-8")
+    else:
+        out = sys.stdout
+    try:
+        return await runner.run(lines, out, skip)
+    finally:
+        await client.close()
+        if lines is not sys.stdin:
+            lines.close()
+        if out is not sys.stdout:
+            out.close()
+
+
+def main(argv=None):
+    """Command line entry point: ``python -m src.batch``."""
+    from .config import load_settings
+
+    parser = argparse.ArgumentParser(
+        description="Run a JSONL file of prompts against Ollama without the GUI.")
+    parser.add_argument("input", nargs="?", default="-",
+                        help="JSONL prompts, one per line (default: stdin)")
+    parser.add_argument("-o", "--output", help="JSONL results file (default: stdout)")
+    parser.add_argument("--model", help="model for jobs that do not name one (default: from config)")
+    parser.add_argument("--host", help="Ollama URL (default: from config)")
+    parser.add_argument("-c", "--concurrency", type=int, default=4)
+    parser.add_argument("--retries", type=int, default=2)
+    parser.add_argument("--backoff", type=float, default=1.0,
+                        help="seconds before the first retry; doubles after that")
+    parser.add_argument("--ordered", action="store_true",
+                        help="write results in input order rather than as they finish")
+    parser.add_argument("--resume", action="store_true",
+                        help="skip jobs that already succeeded in --output and append to it")
+    args = parser.parse_args(argv)
+    if args.resume and not args.output:
+        parser.error("--resume needs --output")
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+
+    summary = asyncio.run(run_batch(args, load_settings()))
+    print(format_summary(summary), file=sys.stderr)
+    return 0 if not summary["failed"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
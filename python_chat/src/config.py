@@ -1,6 +1,9 @@
 import json
 from pathlib import Path
 
+# Where settings that differ from the defaults are saved
+SETTINGS_PATH = Path('settings') / 'config.json'
+
 # Default configuration
 DEFAULT_CONFIG = {
     'theme': 'light',
@@ -12,14 +15,136 @@ DEFAULT_CONFIG = {
     },
     'ollama': {
         'host': 'http://localhost:11434',
+        # Several hosts to balance requests across; overrides 'host' when set
+        'hosts': [],
+        'api_key': '',
+        'use_local_model': True,
+        'routing': {
+            # Consecutive failures before a host is taken out of rotation
+            'failure_threshold': 3,
+            # Seconds before a failed host is tried again
+            'cooldown': 30,
+            # Seconds between background health checks of every host
+            'health_interval': 15,
+            # Send a duplicate request to a second host when the first token
+            # is slower than this percentile of recent ones; 0 disables it
+            'hedge_percentile': 0,
+            'hedge_min_samples': 20
+        },
         'parameters': {
             'temperature': 0.7,
             'top_p': 0.9,
             'top_k': 40
-        }
+        },
+        'connection': {
+            'limit': 10,
+            'limit_per_host': 0,
+            'keepalive_timeout': 30,
+            'dns_cache_ttl': 300
+        },
+        'timeouts': {
+            'connect': 5,
+            'first_byte': 120,
+            'idle': 60
+        },
+        # Seconds before the saved model list is refreshed in the background
+        'catalog_ttl': 300,
+        # How long a model stays loaded after a request, by model name or
+        # '*' for the rest, e.g. {'mistral': '30m', '*': '5m'}; -1 keeps it
+        # loaded. Models not listed use the server's default.
+        'keep_alive': {}
+    },
+    'context': {
+        # Context length requested from Ollama (num_ctx)
+        'max_tokens': 4096,
+        # Part of the window kept free for the reply
+        'reserve_tokens': 512,
+        # Most history messages to send; 0 means no limit
+        'max_messages': 0,
+        # Continue each chat from the context tokens Ollama returned for the
+        # last reply (via /api/generate) so only the new message is prefilled
+        'continuation': False
+    },
+    'cache': {
+        # Reuse responses to deterministic requests (temperature 0 or a fixed seed)
+        'enabled': False,
+        'max_entries': 256,
+        'max_disk_mb': 100,
+        'ttl': 86400
     },
     'model': 'mistral',
+    'ui': {
+        # Seconds between transcript updates while streaming; 0 means once per frame
+        'stream_flush_interval': 0
+    },
     'save_path': 'saved_chats',
+    'storage': {
+        # Seconds between saves of a reply that is still streaming
+        'checkpoint_interval': 2,
+        # Messages loaded when a session opens and per scroll to the top
+        'history_page_size': 200,
+        # Name new sessions after their first exchange with a background request
+        'auto_title': True
+    },
+    'workspace': {
+        # Megabytes of messages kept for open chats that are not shown; past
+        # this the least recently shown idle chats are reloaded when reopened
+        'max_memory_mb': 64,
+        # Message bodies kept in memory across open chats; older ones are read
+        # back from the session store when scrolled to
+        'resident_messages': 2000
+    },
+    'scheduler': {
+        # Requests sent to one host at a time; more wait their turn by priority
+        'max_per_host': 2
+    },
+    'embeddings': {
+        # Semantic search over saved messages; needs an embedding model pulled
+        'enabled': False,
+        'model': 'nomic-embed-text',
+        # Store vectors as int8 rather than float32 (a quarter of the size)
+        'quantize': False,
+        # Messages embedded per request
+        'batch_size': 32,
+        # Stored vectors before searches switch to an approximate index
+        'ivf_threshold': 20000,
+        'nprobe': 8,
+        # Add the most similar past messages to the prompt
+        'retrieval': False,
+        'retrieval_k': 3,
+        # Least cosine similarity for a message to be retrieved
+        'min_score': 0.5
+    },
+    'warmup': {
+        # Load the selected model in the background when it is chosen and at startup
+        'enabled': True,
+        # Seconds between checks of which models the server holds in memory
+        'poll_interval': 10,
+        # Models kept loaded (keep_alive -1) until unpinned or unloaded
+        'pinned': []
+    },
+    'telemetry': {
+        # Time every request and show tokens/s in the status bar
+        'enabled': True,
+        # Requests per model and host that the percentiles are taken over
+        'window': 500,
+        # Append one JSON line per request to this file; empty disables it
+        'jsonl_path': '',
+        # Serve Prometheus metrics at http://127.0.0.1:<port>/metrics; 0 disables it
+        'prometheus_port': 0
+    },
+    'attachments': {
+        # Longest side, in pixels, images are scaled down to before sending;
+        # llava models see 336 or 672
+        'max_side': 672,
+        # JPEG quality of the scaled images
+        'quality': 85,
+        'thumbnail_size': 96,
+        # Processes that decode and scale images
+        'workers': 2,
+        # Prepared images kept in memory as well as on disk
+        'cache_entries': 32
+    },
     'message_colors': {
         'user': '#1f6aa5',
         'assistant': '#2b9348',
@@ -28,9 +153,11 @@ DEFAULT_CONFIG = {
 }
 
 def load_settings():
-    """Load settings from file or return defaults."""
-    return DEFAULT_CONFIG.copy()
+    """Return the settings, read from SETTINGS_PATH once and merged with the defaults."""
+    from .settings_store import get_settings_store
+    return get_settings_store().get()
 
 def save_settings(settings):
-    """Save settings to file."""
-    pass  # For testing, we don't need to actually save
+    """Merge ``settings`` into the saved settings; the file is written in the background."""
+    from .settings_store import get_settings_store
+    return get_settings_store().update(settings)
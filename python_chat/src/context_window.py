@@ -0,0 +1,73 @@
+import re
+from functools import lru_cache
+
+# Tokens added around every message by chat templates, and to prime the
+# reply; the same accounting as estimateTokensFromMessages in the Electron app.
+TOKENS_PER_MESSAGE = 4
+REPLY_PRIMING_TOKENS = 3
+
+_TOKEN_PATTERN = re.compile(r"\w{1,4}|[^\w\s]", re.UNICODE)
+
+
+def estimate_tokens(text):
+    """Approximate a BPE token count: word pieces of up to four characters plus punctuation."""
+    return len(_TOKEN_PATTERN.findall(text))
+
+
+class ContextWindow:
+    """Choose which history to send so the prompt fits the model's context.
+
+    Each message text is counted once; counts are memoized, so building a
+    prompt costs one cache lookup per message it includes rather than
+    re-tokenizing the history on every send.
+    """
+
+    def __init__(self, max_tokens=4096, reserve_tokens=512, max_messages=0,
+                 count_tokens=estimate_tokens, cache_size=16384):
+        self.max_tokens = max_tokens
+        self.reserve_tokens = reserve_tokens
+        self.max_messages = max_messages
+        self._count = lru_cache(maxsize=cache_size)(count_tokens)
+
+    @classmethod
+    def from_config(cls, config):
+        """Create a context window from the ``context`` section of the app config."""
+        context = config.get("context", {})
+        return cls(
+            max_tokens=context.get("max_tokens", 4096),
+            reserve_tokens=context.get("reserve_tokens", 512),
+            max_messages=context.get("max_messages", 0),
+        )
+
+    def message_tokens(self, message):
+        """Return the token cost of one ``{"role", "content"}`` message."""
+        return TOKENS_PER_MESSAGE + self._count(message["content"])
+
+    def build(self, messages, system=""):
+        """Return ``(messages, tokens)`` for the newest history that fits.
+
+        ``messages`` is oldest first. The system prompt and the newest
+        message are always kept; older messages are added until the budget
+        or ``max_messages`` is reached. ``tokens`` is the prompt's count.
+        """
+        tokens = REPLY_PRIMING_TOKENS
+        if system:
+            tokens += self.message_tokens({"content": system})
+        budget = self.max_tokens - self.reserve_tokens
+        selected = []
+        for message in reversed(messages):
+            if self.max_messages and len(selected) >= self.max_messages:
+                break
+            cost = self.message_tokens(message)
+            if selected and tokens + cost > budget:
+                break
+            tokens += cost
+            selected.append(message)
+        selected.reverse()
+        if system:
+            selected.insert(0, {"role": "system", "content": system})
+        return selected, tokens
+
+    def options(self):
+        """Ollama options that make the server use the same window size."""
+        return {"num_ctx": self.max_tokens}
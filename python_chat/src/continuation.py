@@ -0,0 +1,104 @@
+import hashlib
+import json
+from collections import OrderedDict
+
+from .context_window import REPLY_PRIMING_TOKENS
+
+ROLE_LABELS = {"system": "System", "user": "User", "assistant": "Assistant"}
+
+
+def history_digest(messages):
+    """Return a digest of the user and assistant turns in ``messages``."""
+    turns = [[m["role"], m["content"]] for m in messages if m["role"] in ("user", "assistant")]
+    blob = json.dumps(turns, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha1(blob.encode("utf-8")).hexdigest()
+
+
+def transcript(messages):
+    """Flatten chat messages into the text of a single /api/generate prompt."""
+    return "\n\n".join(
+        f"{ROLE_LABELS.get(m['role'], m['role'])}: {m['content']}" for m in messages
+    )
+
+
+class ContinuationStore:
+    """Per-session Ollama ``context`` tokens, so a turn only prefills what is new.
+
+    /api/generate returns the tokens of the whole exchange so far as
+    ``context``; passing them back with the next prompt lets the server
+    reuse its KV cache instead of evaluating the conversation again. The
+    store keeps the tokens of the last ``max_sessions`` sessions with a
+    digest of the history they encode. :meth:`plan` continues from them
+    when the model is the same, the history up to the new message still
+    matches the digest and the total fits the context window; after an
+    edit, a cleared chat or a model switch it falls back to a full prompt
+    built by the :class:`ContextWindow`.
+    """
+
+    def __init__(self, context_window, max_sessions=8):
+        self.context_window = context_window
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self.stats = {
+            "turns_continued": 0,
+            "turns_full": 0,
+            # Prompt tokens the server did not have to evaluate again
+            "tokens_saved": 0,
+        }
+
+    def plan(self, session_id, model, history):
+        """Return the /api/generate request for the reply to ``history``.
+
+        ``history`` is oldest first and ends with the new user message;
+        system messages in it (retrieved excerpts) are sent alongside that
+        message. Returns a dict with ``prompt``, ``system``, ``context``
+        (None for a full prompt) and ``tokens``, the estimated prompt tokens
+        to be evaluated.
+        """
+        notes = [m for m in history if m["role"] == "system"]
+        turns = [m for m in history if m["role"] != "system"]
+        state = self._sessions.get(session_id)
+        if state is not None and state["model"] == model and turns:
+            message = turns[-1]
+            prompt = "\n\n".join([m["content"] for m in notes] + [message["content"]])
+            tokens = self.context_window.message_tokens({"content": prompt}) + REPLY_PRIMING_TOKENS
+            budget = self.context_window.max_tokens - self.context_window.reserve_tokens
+            if (state["digest"] == history_digest(turns[:-1])
+                    and len(state["context"]) + tokens <= budget):
+                self._sessions.move_to_end(session_id)
+                self.stats["turns_continued"] += 1
+                self.stats["tokens_saved"] += len(state["context"])
+                return {"prompt": prompt, "system": "", "context": state["context"],
+                        "tokens": tokens}
+
+        selected, tokens = self.context_window.build(history)
+        system = "\n\n".join(m["content"] for m in selected if m["role"] == "system")
+        turns = [m for m in selected if m["role"] != "system"]
+        if len(turns) == 1:
+            prompt = turns[0]["content"]
+        else:
+            prompt = transcript(turns)
+        self.stats["turns_full"] += 1
+        return {"prompt": prompt, "system": system, "context": None, "tokens": tokens}
+
+    def update(self, session_id, model, history, reply, context):
+        """Remember the ``context`` returned for ``reply`` to ``history``."""
+        if not context:
+            self.forget(session_id)
+            return
+        turns = [m for m in history if m["role"] != "system"]
+        self._sessions[session_id] = {
+            "model": model,
+            "digest": history_digest(turns + [{"role": "assistant", "content": reply}]),
+            "context": context,
+        }
+        self._sessions.move_to_end(session_id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+
+    def forget(self, session_id=None):
+        """Drop the saved context of one session, or of every session."""
+        if session_id is None:
+            self._sessions.clear()
+        else:
+            self._sessions.pop(session_id, None)
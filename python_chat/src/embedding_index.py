@@ -0,0 +1,365 @@
+import asyncio
+import json
+import os
+import shutil
+import threading
+from pathlib import Path
+
+import numpy as np
+
+# Rows scored per step of a brute-force search, to bound temporary memory
+SEARCH_CHUNK = 65536
+
+
+def normalize(vectors):
+    """Return ``vectors`` as float32 rows of unit length (zero rows stay zero)."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[None, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def quantize(vectors):
+    """Return int8 rows and the float32 scale that restores each one."""
+    scales = np.abs(vectors).max(axis=1) / 127
+    scales[scales == 0] = 1
+    return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+
+class EmbeddingIndex:
+    """Message embeddings in memory-mapped NumPy files.
+
+    Vectors are normalized when added, so a dot product is the cosine
+    similarity, and stored as one float32 row per message, or as int8 with
+    a per-row scale when ``quantize`` is set (a quarter of the size). A
+    parallel column maps rows to message ids. Files grow by doubling, and
+    ``meta.json`` records how many rows are valid; it is replaced
+    atomically after the rows are flushed, so a crash loses at most the
+    last unflushed batch.
+
+    Queries score every row with a matrix product. Once there are
+    ``ivf_threshold`` rows an inverted-file index is built: rows are
+    clustered around about sqrt(n) centroids and a query only scores the
+    rows of its ``nprobe`` closest clusters.
+
+    Changing the embedding model starts the index over. Methods may be
+    called from worker threads.
+    """
+
+    def __init__(self, path, model, quantize=False, ivf_threshold=20000, nprobe=8,
+                 capacity=1024):
+        self.path = Path(path)
+        self.model = model
+        self.quantize = quantize
+        self.ivf_threshold = ivf_threshold
+        self.nprobe = nprobe
+        self.count = 0
+        self.dim = None
+        self.capacity = capacity
+        self.centroids = None
+        # Row count when the centroids were last trained
+        self.ivf_size = 0
+        # Id of the last saved message the backfill has been through
+        self.backfill_after = 0
+        self._rows = {}
+        self._lock = threading.RLock()
+        self._vectors = self._scales = self._ids = self._lists = None
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._load()
+
+    @classmethod
+    def from_config(cls, config):
+        """Open the index under ``save_path`` for the ``embeddings`` settings."""
+        embeddings = config.get("embeddings", {})
+        return cls(
+            Path(config.get("save_path", "saved_chats")) / "embeddings",
+            embeddings.get("model", "nomic-embed-text"),
+            quantize=embeddings.get("quantize", False),
+            ivf_threshold=embeddings.get("ivf_threshold", 20000),
+            nprobe=embeddings.get("nprobe", 8),
+        )
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, message_id):
+        return message_id in self._rows
+
+    def add(self, ids, vectors):
+        """Store the embeddings of messages ``ids``, replacing any they had."""
+        vectors = normalize(vectors)
+        if len(ids) != len(vectors):
+            raise ValueError("need one vector per id")
+        if not len(ids):
+            return
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                self._open_columns()
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"expected {self.dim}-dimensional vectors, got {vectors.shape[1]}")
+            rows = []
+            for message_id in ids:
+                row = self._rows.get(message_id)
+                if row is None:
+                    row = self._rows[message_id] = self.count
+                    self.count += 1
+                rows.append(row)
+            if self.count > self.capacity:
+                self._grow(self.count)
+            rows = np.array(rows)
+            self._ids[rows] = ids
+            if self.quantize:
+                self._vectors[rows], self._scales[rows] = quantize(vectors)
+            else:
+                self._vectors[rows] = vectors
+            if self.centroids is not None:
+                self._lists[rows] = np.argmax(vectors @ self.centroids.T, axis=1)
+            if self.count >= self.ivf_threshold and self.count >= 2 * self.ivf_size:
+                self.build_ivf()
+            self.flush()
+
+    def search(self, vector, k=10, exclude=()):
+        """Return up to ``k`` ``(message_id, score)`` pairs, most similar first.
+
+        Scores are cosine similarities. Messages in ``exclude`` are skipped.
+        """
+        query = normalize(vector)[0]
+        with self._lock:
+            if not self.count or query.shape[0] != self.dim:
+                return []
+            if self.centroids is not None:
+                probe = np.argsort(self.centroids @ query)[-self.nprobe:]
+                rows = np.flatnonzero(np.isin(self._lists[:self.count], probe))
+                scores = self._score(query, rows)
+            else:
+                rows = None
+                scores = self._score(query)
+            ids = self._ids[:self.count] if rows is None else self._ids[rows]
+            if exclude:
+                scores[np.isin(ids, np.fromiter(exclude, dtype=np.int64))] = -np.inf
+            k = min(k, len(scores))
+            if not k:
+                return []
+            best = np.argpartition(-scores, k - 1)[:k]
+            best = best[np.argsort(-scores[best])]
+            return [(int(ids[i]), float(scores[i])) for i in best if scores[i] > -np.inf]
+
+    def build_ivf(self, iterations=8, seed=0):
+        """Cluster the rows and rebuild the inverted lists."""
+        with self._lock:
+            n = self.count
+            nlist = max(int(np.sqrt(n)), 1)
+            rng = np.random.default_rng(seed)
+            sample = np.sort(rng.choice(n, size=min(n, nlist * 64), replace=False))
+            points = self._rows_as_float(sample)
+            centroids = points[rng.choice(len(points), size=nlist, replace=False)]
+            for _ in range(iterations):
+                assignment = np.argmax(points @ centroids.T, axis=1)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, assignment, points)
+                empty = ~sums.any(axis=1)
+                sums[empty] = centroids[empty]
+                centroids = normalize(sums)
+            for start in range(0, n, SEARCH_CHUNK):
+                block = self._rows_as_float(slice(start, min(start + SEARCH_CHUNK, n)))
+                self._lists[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+            self.centroids = centroids
+            self.ivf_size = n
+            np.save(self.path / "centroids.npy", centroids)
+            self.flush()
+
+    def flush(self):
+        """Write the rows to disk, then record how many are valid."""
+        with self._lock:
+            for column in (self._vectors, self._scales, self._ids, self._lists):
+                if column is not None:
+                    column.flush()
+            meta = {
+                "model": self.model,
+                "dim": self.dim,
+                "count": self.count,
+                "capacity": self.capacity,
+                "quantize": self.quantize,
+                "ivf_size": self.ivf_size,
+                "backfill_after": self.backfill_after,
+            }
+            tmp = self.path / ".meta.json.tmp"
+            tmp.write_text(json.dumps(meta), encoding="utf-8")
+            os.replace(tmp, self.path / "meta.json")
+
+    def close(self):
+        with self._lock:
+            if self.dim is not None:
+                self.flush()
+            self._vectors = self._scales = self._ids = self._lists = None
+
+    def _load(self):
+        try:
+            meta = json.loads((self.path / "meta.json").read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            meta = None
+        if not meta or meta.get("model") != self.model or meta.get("quantize") != self.quantize:
+            # Vectors from another model, or stored another way, are of no use
+            shutil.rmtree(self.path)
+            self.path.mkdir(parents=True)
+            return
+        self.dim = meta["dim"]
+        self.count = meta["count"]
+        self.capacity = max(meta["capacity"], self.count, self.capacity)
+        self.ivf_size = meta.get("ivf_size", 0)
+        self.backfill_after = meta.get("backfill_after", 0)
+        if self.dim is None:
+            return
+        self._open_columns()
+        self._rows = {int(message_id): row for row, message_id in enumerate(self._ids[:self.count])}
+        if self.ivf_size:
+            self.centroids = np.load(self.path / "centroids.npy")
+
+    def _open_columns(self):
+        self._vectors = self._column("vectors", np.int8 if self.quantize else np.float32, self.dim)
+        self._scales = self._column("scales", np.float32) if self.quantize else None
+        self._ids = self._column("ids", np.int64)
+        self._lists = self._column("lists", np.int32)
+
+    def _column(self, name, dtype, width=1):
+        path = self.path / f"{name}.bin"
+        size = self.capacity * width * np.dtype(dtype).itemsize
+        with open(path, "ab") as f:
+            if f.tell() < size:
+                f.truncate(size)
+        shape = (self.capacity, width) if width > 1 else (self.capacity,)
+        return np.memmap(path, dtype=dtype, mode="r+", shape=shape)
+
+    def _grow(self, needed):
+        capacity = self.capacity
+        while capacity < needed:
+            capacity *= 2
+        for column in (self._vectors, self._scales, self._ids, self._lists):
+            if column is not None:
+                column.flush()
+        self.capacity = capacity
+        self._open_columns()
+
+    def _rows_as_float(self, rows):
+        vectors = self._vectors[rows]
+        if not self.quantize:
+            return np.asarray(vectors)
+        return vectors.astype(np.float32) * self._scales[rows][:, None]
+
+    def _score(self, query, rows=None):
+        if rows is not None:
+            return self._rows_as_float(rows) @ query
+        scores = np.empty(self.count, dtype=np.float32)
+        for start in range(0, self.count, SEARCH_CHUNK):
+            end = min(start + SEARCH_CHUNK, self.count)
+            scores[start:end] = self._rows_as_float(slice(start, end)) @ query
+        return scores
+
+
+class EmbeddingIndexer:
+    """Embeds saved messages in the background and adds them to an index.
+
+    :meth:`submit` queues a message; the worker waits ``delay`` seconds so
+    messages saved together are embedded together, then sends up to
+    ``batch_size`` texts per ``embed(texts)`` call. When the queue is empty
+    it works through older messages from ``source(after_id, limit)`` that
+    are not in the index yet, one page per batch. How far it got is saved
+    with the index, so a later launch carries on from there, and pages of
+    messages already indexed are skipped without waiting. Index updates
+    run on a worker thread.
+    """
+
+    def __init__(self, index, embed, source=None, batch_size=32, delay=1.0, retry_delay=30):
+        self.index = index
+        self.embed = embed
+        self.source = source
+        self.batch_size = batch_size
+        self.delay = delay
+        self.retry_delay = retry_delay
+        self.last_error = None
+        self._pending = {}
+        self._backfill_after = index.backfill_after if source is not None else None
+        self._wakeup = None
+        self._task = None
+
+    def start(self):
+        """Start the worker on the running event loop."""
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return self._task
+
+    def submit(self, message_id, text):
+        """Queue a message to be embedded."""
+        if not text.strip():
+            return
+        self._pending[message_id] = text
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def close(self):
+        """Stop the worker; queued messages are picked up by the next backfill."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def run_once(self):
+        """Embed one batch; returns how many messages were indexed."""
+        batch, cursor = self._next_batch()
+        if not batch:
+            self._save_cursor(cursor)
+            return 0
+        try:
+            vectors = await self.embed([text for _, text in batch])
+        except Exception:
+            # Try the batch again later
+            for message_id, text in batch:
+                self._pending.setdefault(message_id, text)
+            raise
+        await asyncio.to_thread(self.index.add, [message_id for message_id, _ in batch], vectors)
+        self._save_cursor(cursor)
+        return len(batch)
+
+    def _save_cursor(self, cursor):
+        # Written to meta.json by the next flush of the index
+        if cursor is not None:
+            self.index.backfill_after = cursor
+
+    async def _run(self):
+        indexed = None
+        while True:
+            if not self._pending and self._backfill_after is None:
+                await self._wakeup.wait()
+                indexed = None
+            self._wakeup.clear()
+            # Yield to the loop, but do not wait, between pages that were
+            # all indexed already
+            await asyncio.sleep(0 if indexed == 0 else self.delay)
+            try:
+                indexed = await self.run_once()
+                self.last_error = None
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.last_error = e
+                await asyncio.sleep(self.retry_delay)
+
+    def _next_batch(self):
+        """Return the queued messages and at most one backfill page, with the backfill cursor."""
+        batch = []
+        cursor = None
+        while self._pending and len(batch) < self.batch_size:
+            message_id = next(iter(self._pending))
+            batch.append((message_id, self._pending.pop(message_id)))
+        if len(batch) < self.batch_size and self._backfill_after is not None:
+            rows = self.source(self._backfill_after, self.batch_size - len(batch))
+            if not rows:
+                self._backfill_after = None
+            else:
+                self._backfill_after = cursor = rows[-1]["id"]
+                batch.extend((row["id"], row["content"]) for row in rows
+                             if row["id"] not in self.index and row["content"].strip())
+        return batch, cursor
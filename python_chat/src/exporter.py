@@ -0,0 +1,266 @@
+import html
+import json
+import os
+import re
+import threading
+import time
+import zipfile
+from pathlib import Path
+
+import markdown
+from markdown.treeprocessors import Treeprocessor
+
+from .session_store import SessionStore
+
+# Bytes handed to the file per write, whatever the size of the chat
+CHUNK_SIZE = 64 * 1024
+
+ROLE_LABELS = {
+    'user': 'You',
+    'assistant': 'Assistant',
+}
+
+HTML_HEAD = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+body {{ font-family: sans-serif; max-width: 48em; margin: 2em auto; padding: 0 1em; color: #222; }}
+.message {{ margin: 1em 0; padding: 0.5em 1em; border-radius: 6px; background: #f4f4f4; }}
+.message.user {{ background: #e3eefa; }}
+.message.system {{ background: none; color: #666; font-style: italic; }}
+.role {{ font-weight: bold; margin-bottom: 0.3em; }}
+pre {{ background: #272822; color: #f8f8f2; padding: 0.7em; overflow-x: auto; }}
+code {{ font-family: monospace; }}
+</style>
+</head>
+<body>
+<h1>{title}</h1>
+"""
+
+HTML_FOOT = "</body>\n</html>\n"
+
+# URL schemes links and images in the HTML export may use; others are dropped
+SAFE_SCHEMES = {"http", "https", "mailto"}
+
+
+class ExportCancelled(Exception):
+    """Raised inside an export that was cancelled."""
+
+
+def session_title(session):
+    return session.get("title") or f"Chat {session['id']}"
+
+
+def text_chunks(session, messages):
+    """Yield a session as a plain transcript, the format the search index imports."""
+    for message in messages:
+        label = ROLE_LABELS.get(message["role"])
+        text = message["content"]
+        yield f"{label}: {text}\n" if label else f"{text}\n"
+
+
+def markdown_chunks(session, messages):
+    """Yield a session as Markdown, one section per message."""
+    yield f"# {session_title(session)}\n\n"
+    for message in messages:
+        label = ROLE_LABELS.get(message["role"], message["role"].capitalize())
+        yield f"**{label}:**\n\n{message['content']}\n\n"
+
+
+def jsonl_chunks(session, messages):
+    """Yield a session as JSON Lines: the session record, then one line per message."""
+    yield json.dumps(dict(session, type="session"), ensure_ascii=False) + "\n"
+    for message in messages:
+        yield json.dumps(dict(message, type="message"), ensure_ascii=False) + "\n"
+
+
+def is_safe_url(url):
+    """Return True if ``url`` is relative or uses one of SAFE_SCHEMES.
+
+    Entities are decoded and whitespace removed first, as a browser would,
+    so ``&#106;avascript:`` and ``java\tscript:`` count as ``javascript:``.
+    """
+    url = re.sub(r"[\x00-\x20\x7f]", "", html.unescape(url))
+    scheme = re.match(r"([a-zA-Z][a-zA-Z0-9+.-]*):", url)
+    return scheme is None or scheme.group(1).lower() in SAFE_SCHEMES
+
+
+class _SafeLinks(Treeprocessor):
+    """Drops link and image URLs that :func:`is_safe_url` rejects."""
+
+    def run(self, root):
+        for element in root.iter():
+            for attribute in ("href", "src"):
+                url = element.get(attribute)
+                if url is not None and not is_safe_url(url):
+                    del element.attrib[attribute]
+
+
+def html_chunks(session, messages):
+    """Yield a session as one self-contained HTML page.
+
+    Message text is rendered from Markdown with raw HTML disabled, so
+    nothing a model wrote can add markup or scripts to the page; links
+    and images keep their URL only if :func:`is_safe_url` allows it.
+    """
+    converter = markdown.Markdown(extensions=["fenced_code", "tables"])
+    converter.preprocessors.deregister("html_block")
+    converter.inlinePatterns.deregister("html")
+    # After the inline processor, which turns links into elements
+    converter.treeprocessors.register(_SafeLinks(converter), "safe_links", 5)
+    yield HTML_HEAD.format(title=html.escape(session_title(session)))
+    for message in messages:
+        role = message["role"]
+        label = ROLE_LABELS.get(role, role.capitalize())
+        body = converter.reset().convert(message["content"])
+        yield (f'<div class="message {html.escape(role)}">\n'
+               f'<div class="role">{html.escape(label)}</div>\n{body}\n</div>\n')
+    yield HTML_FOOT
+
+
+FORMATS = {
+    "txt": text_chunks,
+    "md": markdown_chunks,
+    "jsonl": jsonl_chunks,
+    "html": html_chunks,
+}
+
+
+def format_for(path):
+    """Return the export format named by the extension of ``path``."""
+    fmt = Path(path).suffix.lower().lstrip(".")
+    if fmt == "markdown":
+        fmt = "md"
+    if fmt not in FORMATS:
+        raise ValueError(f"Cannot export to .{fmt} files; use one of "
+                         + ", ".join("." + name for name in FORMATS))
+    return fmt
+
+
+def write_chunks(pieces, stream, chunk_size=CHUNK_SIZE):
+    """Encode ``pieces`` and write them to binary ``stream`` in ``chunk_size`` writes."""
+    buffer = bytearray()
+    for piece in pieces:
+        buffer += piece.encode("utf-8")
+        while len(buffer) >= chunk_size:
+            stream.write(buffer[:chunk_size])
+            del buffer[:chunk_size]
+    if buffer:
+        stream.write(buffer)
+
+
+def archive_name(session, fmt):
+    slug = re.sub(r"[^\w-]+", "-", session.get("title") or "").strip("-").lower()[:40]
+    return f"{session['id']:05d}-{slug or 'chat'}.{fmt}"
+
+
+class ExportJob:
+    """Export sessions from a SessionStore file on a worker thread.
+
+    Messages are read from the database in batches and pushed through a
+    generator for the chosen format straight into the output file, so
+    memory use does not grow with the length of the chat. One session is
+    written to ``dest`` in the format its extension names; several, or a
+    ``dest`` ending in ``.zip``, go into a zip archive with one ``fmt``
+    file per session.
+
+    ``on_progress(done, total)`` is called as messages are written and
+    ``on_done(error)`` once at the end, with None on success and
+    ExportCancelled after :meth:`cancel`. Both run on the worker thread.
+    The output only appears at ``dest`` once it is complete.
+    """
+
+    def __init__(self, db_path, session_ids, dest, fmt=None, on_progress=None, on_done=None,
+                 chunk_size=CHUNK_SIZE, batch_size=500, progress_interval=0.1):
+        self.db_path = db_path
+        self.session_ids = list(session_ids)
+        self.dest = Path(dest)
+        self.archive = len(self.session_ids) != 1 or self.dest.suffix.lower() == ".zip"
+        self.fmt = fmt or ("md" if self.archive else format_for(dest))
+        if self.fmt not in FORMATS:
+            raise ValueError(f"Unknown export format: {self.fmt}")
+        self.on_progress = on_progress
+        self.on_done = on_done
+        self.chunk_size = chunk_size
+        self.batch_size = batch_size
+        self.progress_interval = progress_interval
+        self.done = 0
+        self.total = 0
+        self.error = None
+        self._cancelled = threading.Event()
+        self._thread = None
+        self._reported = 0
+
+    def start(self):
+        """Run the export on a background thread."""
+        self._thread = threading.Thread(target=self._run_reporting, name="export", daemon=True)
+        self._thread.start()
+        return self
+
+    def cancel(self):
+        """Stop the export at the next message; nothing is left at ``dest``."""
+        self._cancelled.set()
+
+    def wait(self, timeout=None):
+        """Wait for a started export; returns True once it has finished."""
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    def run(self):
+        """Export on the calling thread; raises what the export raised."""
+        # SQLite connections belong to the thread that opened them
+        store = SessionStore(self.db_path)
+        part = self.dest.with_name(f".{self.dest.name}.part")
+        try:
+            sessions = [store.get_session(session_id) for session_id in self.session_ids]
+            missing = [sid for sid, session in zip(self.session_ids, sessions) if session is None]
+            if missing:
+                raise ValueError(f"No such session: {missing[0]}")
+            self.total = sum(store.count_messages(session["id"]) for session in sessions)
+            self._progress(force=True)
+            self.dest.parent.mkdir(parents=True, exist_ok=True)
+            if self.archive:
+                with zipfile.ZipFile(part, "w", zipfile.ZIP_DEFLATED) as archive:
+                    for session in sessions:
+                        with archive.open(archive_name(session, self.fmt), "w") as stream:
+                            self._write_session(store, session, stream)
+            else:
+                with open(part, "wb") as stream:
+                    self._write_session(store, sessions[0], stream)
+            os.replace(part, self.dest)
+            self._progress(force=True)
+        except BaseException:
+            part.unlink(missing_ok=True)
+            raise
+        finally:
+            store.close()
+
+    def _run_reporting(self):
+        try:
+            self.run()
+        except Exception as e:
+            self.error = e
+        if self.on_done is not None:
+            self.on_done(self.error)
+
+    def _write_session(self, store, session, stream):
+        messages = self._messages(store, session["id"])
+        write_chunks(FORMATS[self.fmt](session, messages), stream, self.chunk_size)
+
+    def _messages(self, store, session_id):
+        for message in store.iter_messages(session_id, self.batch_size):
+            if self._cancelled.is_set():
+                raise ExportCancelled()
+            yield message
+            self.done += 1
+            self._progress()
+
+    def _progress(self, force=False):
+        if self.on_progress is None:
+            return
+        now = time.monotonic()
+        if force or now - self._reported >= self.progress_interval:
+            self._reported = now
+            self.on_progress(self.done, self.total)
@@ -0,0 +1,128 @@
+import time
+from collections import deque
+
+
+def percentile(values, pct):
+    """Return the ``pct`` percentile of ``values`` (nearest rank)."""
+    values = sorted(values)
+    index = min(int(round(pct / 100 * (len(values) - 1))), len(values) - 1)
+    return values[index]
+
+
+class HostState:
+    """Load, health and latency of one Ollama host."""
+
+    def __init__(self, url, ttft_window=100):
+        self.url = url
+        self.outstanding = 0
+        self.healthy = True
+        self.failures = 0
+        self.down_until = 0
+        # Model names reported by /api/tags; None until the first check
+        self.models = None
+        self.ttfts = deque(maxlen=ttft_window)
+        self.stats = {
+            "requests": 0,
+            "errors": 0,
+            "hedges": 0,
+            "hedges_won": 0,
+            "cancelled": 0,
+        }
+
+    def has_model(self, model):
+        return self.models is None or model in self.models
+
+    def snapshot(self):
+        """Return the stats shown for this host."""
+        return dict(
+            self.stats,
+            outstanding=self.outstanding,
+            healthy=self.healthy,
+            models=sorted(self.models) if self.models is not None else None,
+            ttft_p50=percentile(self.ttfts, 50) if self.ttfts else None,
+            ttft_p95=percentile(self.ttfts, 95) if self.ttfts else None,
+        )
+
+
+class HostPool:
+    """Routing table for several Ollama hosts.
+
+    Requests go to the healthy host with the fewest outstanding requests
+    among those that have the model. A host is marked down after
+    ``failure_threshold`` consecutive failures (passive checks) or a failed
+    probe (active checks, see :meth:`OllamaClient.check_hosts`); a host
+    that is down gets tried again once ``cooldown`` seconds have passed.
+    """
+
+    def __init__(self, hosts, failure_threshold=3, cooldown=30, hedge_percentile=95,
+                 hedge_min_samples=20, ttft_window=100):
+        self.hosts = {}
+        for url in hosts:
+            url = url.rstrip("/")
+            self.hosts[url] = HostState(url, ttft_window)
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self._ttfts = deque(maxlen=ttft_window)
+
+    def candidates(self, model, exclude=()):
+        """Return the hosts that may serve ``model``, preferring healthy ones."""
+        now = time.monotonic()
+        hosts = [h for h in self.hosts.values() if h.url not in exclude and h.has_model(model)]
+        available = [h for h in hosts if h.healthy or now >= h.down_until]
+        return available or hosts
+
+    def choose(self, model, exclude=()):
+        """Return the URL of the least loaded host for ``model``, or None."""
+        hosts = self.candidates(model, exclude)
+        if not hosts:
+            return None
+        best = min(hosts, key=lambda h: (not h.healthy, h.outstanding, h.stats["requests"]))
+        return best.url
+
+    def hedge_delay(self):
+        """Seconds to wait for a first token before hedging, or None.
+
+        This is the configured percentile of recent time-to-first-token
+        across the pool; there is no hedging until enough samples exist.
+        """
+        if not self.hedge_percentile or len(self._ttfts) < self.hedge_min_samples:
+            return None
+        return percentile(self._ttfts, self.hedge_percentile)
+
+    def started(self, url):
+        host = self.hosts[url]
+        host.outstanding += 1
+        host.stats["requests"] += 1
+
+    def finished(self, url):
+        self.hosts[url].outstanding -= 1
+
+    def record_ttft(self, url, seconds):
+        self.hosts[url].ttfts.append(seconds)
+        self._ttfts.append(seconds)
+
+    def record_success(self, url):
+        host = self.hosts[url]
+        host.failures = 0
+        host.healthy = True
+
+    def record_failure(self, url):
+        host = self.hosts[url]
+        host.failures += 1
+        host.stats["errors"] += 1
+        if host.failures >= self.failure_threshold:
+            self.mark_down(url)
+
+    def mark_down(self, url):
+        host = self.hosts[url]
+        host.healthy = False
+        host.down_until = time.monotonic() + self.cooldown
+
+    def set_models(self, url, names):
+        self.hosts[url].models = set(names)
+
+    def stats(self):
+        """Return per-host stats keyed by URL."""
+        return {url: host.snapshot() for url, host in self.hosts.items()}
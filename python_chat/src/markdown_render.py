@@ -0,0 +1,318 @@
+import re
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from kivy.utils import escape_markup
+
+try:
+    from pygments.lexers import TextLexer, get_lexer_by_name, guess_lexer
+    from pygments.styles import get_style_by_name
+    from pygments.util import ClassNotFound
+except ImportError:  # Code blocks are shown without highlighting
+    get_lexer_by_name = None
+
+CODE_FONT = "RobotoMono-Regular"
+
+# Colors for markup that is not code, and the Pygments style used for code
+THEMES = {
+    'dark': {'style': 'monokai', 'code': '#e6db74', 'muted': '#9e9e9e', 'link': '#66b3ff'},
+    'light': {'style': 'default', 'code': '#c7254e', 'muted': '#6e6e6e', 'link': '#1f6aa5'},
+}
+
+HEADING_SIZES = {1: "22sp", 2: "19sp", 3: "17sp"}
+
+FENCE = re.compile(r"^ {0,3}(`{3,}|~{3,})\s*([\w+#.-]*)")
+HEADING = re.compile(r"^ {0,3}(#{1,6})\s+(.*?)\s*#*\s*$")
+BULLET = re.compile(r"^(\s*)[-*+]\s+(.*)$")
+ORDERED = re.compile(r"^(\s*)(\d+[.)])\s+(.*)$")
+QUOTE = re.compile(r"^ {0,3}>\s?(.*)$")
+RULE = re.compile(r"^ {0,3}([-*_])(\s*\1){2,}\s*$")
+INLINE = re.compile(
+    r"(?P<code>`+)(?P<code_text>.+?)(?P=code)"
+    r"|\*\*(?P<bold>.+?)\*\*"
+    r"|(?<!\w)__(?P<bold2>.+?)__(?!\w)"
+    r"|~~(?P<strike>.+?)~~"
+    r"|\*(?P<italic>[^\s*](?:.*?[^\s*])?)\*"
+    r"|(?<!\w)_(?P<italic2>[^\s_](?:.*?[^\s_])?)_(?!\w)"
+    r"|\[(?P<link>[^\]]+)\]\((?P<url>[^)\s]+)\)"
+)
+
+
+def render_inline(text, palette):
+    """Return Kivy markup for the inline Markdown in one line of text."""
+    out = []
+    pos = 0
+    for match in INLINE.finditer(text):
+        out.append(escape_markup(text[pos:match.start()]))
+        pos = match.end()
+        kind = match.lastgroup
+        if kind == 'code_text':
+            out.append(f"[font={CODE_FONT}][color={palette['code']}]"
+                       f"{escape_markup(match.group('code_text').strip())}[/color][/font]")
+        elif kind in ('bold', 'bold2'):
+            out.append(f"[b]{render_inline(match.group(kind), palette)}[/b]")
+        elif kind in ('italic', 'italic2'):
+            out.append(f"[i]{render_inline(match.group(kind), palette)}[/i]")
+        elif kind == 'strike':
+            out.append(f"[s]{render_inline(match.group(kind), palette)}[/s]")
+        else:
+            url = escape_markup(match.group('url'))
+            out.append(f"[ref={url}][color={palette['link']}][u]"
+                       f"{render_inline(match.group('link'), palette)}[/u][/color][/ref]")
+    out.append(escape_markup(text[pos:]))
+    return "".join(out)
+
+
+def render_code(code, palette):
+    """Return a code block as plain monospaced markup."""
+    return f"[font={CODE_FONT}]{escape_markup(code)}[/font]"
+
+
+def highlight_code(code, language, theme):
+    """Return a code block as syntax-highlighted Kivy markup.
+
+    This is the slow part of rendering and is run on a worker thread.
+    """
+    palette = THEMES[theme]
+    if get_lexer_by_name is None:
+        return render_code(code, palette)
+    try:
+        lexer = get_lexer_by_name(language) if language else guess_lexer(code)
+    except ClassNotFound:
+        lexer = TextLexer()
+    style = get_style_by_name(palette['style'])
+    out = [f"[font={CODE_FONT}]"]
+    for token_type, value in lexer.get_tokens(code):
+        value = escape_markup(value)
+        token_style = style.style_for_token(token_type)
+        if token_style['color']:
+            value = f"[color=#{token_style['color']}]{value}[/color]"
+        if token_style['bold']:
+            value = f"[b]{value}[/b]"
+        if token_style['italic']:
+            value = f"[i]{value}[/i]"
+        out.append(value)
+    # Lexers end their output with a newline the block does not have
+    markup = "".join(out)
+    if markup.endswith("\n") and not code.endswith("\n"):
+        markup = markup[:-1]
+    return markup + "[/font]"
+
+
+def split_code(block):
+    """Return ``(language, code, closed)`` for a fenced code block."""
+    lines = block.split("\n")
+    match = FENCE.match(lines[0])
+    fence = match.group(1)
+    closed = len(lines) > 1 and lines[-1].strip().startswith(fence) \
+        and not lines[-1].strip().strip(fence[0])
+    body = lines[1:-1] if closed else lines[1:]
+    return match.group(2).lower(), "\n".join(body), closed
+
+
+def render_block(block, palette):
+    """Return Kivy markup for one block other than a fenced code block."""
+    lines = []
+    for line in block.split("\n"):
+        match = HEADING.match(line)
+        if match:
+            level = len(match.group(1))
+            text = f"[b]{render_inline(match.group(2), palette)}[/b]"
+            size = HEADING_SIZES.get(level)
+            lines.append(f"[size={size}]{text}[/size]" if size else text)
+            continue
+        if RULE.match(line):
+            lines.append(f"[color={palette['muted']}]{'─' * 24}[/color]")
+            continue
+        match = BULLET.match(line)
+        if match:
+            indent = "    " * (len(match.group(1).expandtabs(4)) // 2)
+            lines.append(f"{indent}  •  {render_inline(match.group(2), palette)}")
+            continue
+        match = ORDERED.match(line)
+        if match:
+            indent = "    " * (len(match.group(1).expandtabs(4)) // 2)
+            lines.append(f"{indent}  {match.group(2)}  {render_inline(match.group(3), palette)}")
+            continue
+        match = QUOTE.match(line)
+        if match:
+            lines.append(f"[color={palette['muted']}][i]│ "
+                         f"{render_inline(match.group(1), palette)}[/i][/color]")
+            continue
+        lines.append(render_inline(line, palette))
+    return "\n".join(lines)
+
+
+class MarkdownDocument:
+    """A message split into completed blocks and one open block.
+
+    Blocks are separated by blank lines, and a fenced code block is one
+    block from its opening fence to its closing one. A block is complete
+    once the line that ends it has arrived and never changes after that;
+    everything from there on is the open block. :meth:`feed` only scans
+    the text added since the last call.
+    """
+
+    def __init__(self):
+        self.blocks = []
+        self.text = ""
+        # Markup of the open block by theme, as ``(block, markup)``
+        self.open_markup = {}
+        # Index of the first line not yet scanned
+        self._offset = 0
+        self._lines = []
+        self._fence = None
+
+    def feed(self, text):
+        """Bring the document up to date with ``text``; returns the open block."""
+        if not text.startswith(self.text):
+            self.__init__()
+        self.text = text
+        while True:
+            end = text.find("\n", self._offset)
+            if end < 0:
+                break
+            self._scan(text[self._offset:end])
+            self._offset = end + 1
+        return "\n".join(self._lines + [text[self._offset:]]).strip("\n")
+
+    def _scan(self, line):
+        if self._fence:
+            self._lines.append(line)
+            stripped = line.strip()
+            if stripped.startswith(self._fence) and not stripped.strip(self._fence[0]):
+                self._close()
+            return
+        match = FENCE.match(line)
+        if match:
+            self._close()
+            self._fence = match.group(1)
+            self._lines.append(line)
+        elif line.strip():
+            self._lines.append(line)
+        else:
+            self._close()
+
+    def _close(self):
+        if self._lines:
+            self.blocks.append("\n".join(self._lines))
+        self._lines = []
+        self._fence = None
+
+
+class MarkdownRenderer:
+    """Turns message Markdown into Kivy markup, caching by block.
+
+    Rendered blocks are kept in an LRU keyed by block text and theme, so a
+    block is parsed once per theme however often its row is redrawn, and
+    switching back to a theme reuses its earlier output. While a message
+    streams, only its open block is rendered again.
+
+    Code blocks are highlighted on a worker thread. Until that finishes
+    they are shown as plain monospaced text; ``dispatch`` then runs
+    ``on_update`` (on the UI thread, if it is given one) so the rows can be
+    redrawn.
+    """
+
+    def __init__(self, on_update=None, dispatch=None, highlight=True, max_blocks=4096,
+                 max_documents=256):
+        self.on_update = on_update
+        self.dispatch = dispatch or (lambda callback: callback())
+        self.highlight = highlight and get_lexer_by_name is not None
+        self.max_blocks = max_blocks
+        self.max_documents = max_documents
+        # Bumped whenever highlighted output replaces plain output
+        self.generation = 0
+        self._blocks = OrderedDict()
+        self._documents = OrderedDict()
+        self._pending = set()
+        self._executor = None
+
+    def render(self, text, theme='dark', key=None):
+        """Return markup for ``text``.
+
+        Pass the message ``key`` while it streams so the blocks found on
+        the previous call are reused rather than found again.
+        """
+        document = self._documents.pop(key, None) if key is not None else None
+        if document is None:
+            document = MarkdownDocument()
+        tail = document.feed(text)
+        if key is not None:
+            self._documents[key] = document
+            if len(self._documents) > self.max_documents:
+                self._documents.popitem(last=False)
+        parts = [self.render_block(block, theme) for block in document.blocks]
+        if tail:
+            # The open block changes with every token, so it is kept with the
+            # document rather than filling the shared cache
+            cached = document.open_markup.get(theme)
+            if cached is None or cached[0] != tail:
+                cached = document.open_markup[theme] = (
+                    tail, self.render_block(tail, theme, complete=False))
+            parts.append(cached[1])
+        return "\n\n".join(parts)
+
+    def render_block(self, block, theme, complete=True):
+        """Return markup for one block, from the cache when it is complete."""
+        cache_key = (block, theme)
+        markup = self._blocks.get(cache_key)
+        if markup is not None:
+            self._blocks.move_to_end(cache_key)
+            return markup
+        palette = THEMES[theme]
+        if not FENCE.match(block):
+            markup = render_block(block, palette)
+        else:
+            language, code, closed = split_code(block)
+            markup = render_code(code, palette)
+            if closed and self.highlight:
+                # Cache nothing until the highlighted version arrives
+                self._highlight_soon(cache_key, code, language)
+                return markup
+        if complete:
+            self._store(cache_key, markup)
+        return markup
+
+    def forget(self, key=None):
+        """Drop the streaming state for ``key``, or for every message."""
+        if key is None:
+            self._documents.clear()
+        else:
+            self._documents.pop(key, None)
+
+    def close(self):
+        """Stop the highlighting worker; queued work is dropped."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        self._pending.clear()
+
+    def _store(self, cache_key, markup):
+        self._blocks[cache_key] = markup
+        if len(self._blocks) > self.max_blocks:
+            self._blocks.popitem(last=False)
+
+    def _highlight_soon(self, cache_key, code, language):
+        if cache_key in self._pending:
+            return
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="highlight")
+        self._pending.add(cache_key)
+        future = self._executor.submit(highlight_code, code, language, cache_key[1])
+        future.add_done_callback(
+            lambda future: self.dispatch(lambda: self._highlighted(cache_key, future))
+        )
+
+    def _highlighted(self, cache_key, future):
+        if cache_key not in self._pending:
+            return
+        self._pending.discard(cache_key)
+        if future.cancelled() or future.exception() is not None:
+            # Keep the plain version rather than trying again on every redraw
+            self._store(cache_key, render_code(split_code(cache_key[0])[1], THEMES[cache_key[1]]))
+            return
+        self._store(cache_key, future.result())
+        self.generation += 1
+        if self.on_update is not None:
+            self.on_update()
@@ -0,0 +1,309 @@
+from bisect import bisect_left, bisect_right
+from itertools import islice
+
+from kivy.clock import Clock
+from kivy.graphics import Color, Rectangle
+from kivy.metrics import dp
+from kivy.properties import DictProperty, ListProperty, NumericProperty, StringProperty
+from kivy.uix.label import Label
+from kivy.uix.recyclelayout import RecycleLayout
+from kivy.uix.recycleview import RecycleView
+from kivy.uix.recycleview.views import RecycleDataViewBehavior
+from kivy.utils import escape_markup
+
+from .markdown_render import MarkdownRenderer
+from .message_model import Message
+
+ROLE_LABELS = {
+    'user': 'You',
+    'assistant': 'Assistant',
+}
+
+
+class MessageRow(RecycleDataViewBehavior, Label):
+    """One transcript row; instances are recycled as the list scrolls."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.markup = True
+        self.halign = 'left'
+        self.valign = 'top'
+        self.size_hint_y = None
+        self.padding = (dp(6), dp(5))
+        self.record = None
+        self.bind(width=self._update_text_size, texture_size=self._update_height)
+
+    def refresh_view_attrs(self, rv, index, data):
+        """Render the message record at ``index`` into this row."""
+        self.record = data
+        self.color = rv.foreground_color
+        self.text = rv.format_message(data, index - rv._offset)
+        return super().refresh_view_attrs(rv, index, {})
+
+    def _update_text_size(self, instance, width):
+        self.text_size = (width, None)
+
+    def _update_height(self, instance, texture_size):
+        self.height = texture_size[1]
+        # Remember the measured height so the row keeps its size when it is
+        # scrolled back into view or its text grows.
+        if self.record is not None:
+            self.record['height'] = self.height
+
+
+class MessageLayout(RecycleLayout):
+    """Vertical layout manager whose cost follows the changed and visible rows.
+
+    ``RecycleBoxLayout`` recomputes the position of every row whenever one
+    row is added or resized. Here rows are placed by their offset from the
+    top, so an append or a resize only recomputes offsets from that row
+    down, and finding the rows in the viewport is a binary search.
+    """
+
+    padding = NumericProperty(0)
+    spacing = NumericProperty(0)
+    minimum_height = NumericProperty(0)
+
+    def __init__(self, **kwargs):
+        # _offsets[i] is the distance from the top of the content to row i;
+        # the final entry is the height of all rows.
+        self._offsets = [0]
+        self._dirty_from = 0
+        super().__init__(**kwargs)
+        self.fbind('pos', self._reposition_views)
+        self.fbind('height', self._reposition_views)
+
+    def compute_sizes_from_data(self, data, flags):
+        start = len(self.view_opts)
+        for flag in flags:
+            if not flag:
+                start = 0
+            for value in flag.values():
+                start = min(start, getattr(value, 'start', value) or 0)
+        self._dirty_from = min(self._dirty_from, start)
+        super().compute_sizes_from_data(data, flags)
+
+    def compute_layout(self, data, flags):
+        super().compute_layout(data, flags)
+        changed = self._changed_views
+        if changed == []:
+            self._dirty_from = 0
+        elif changed:
+            self._dirty_from = min([self._dirty_from] + [c[0] for c in changed])
+
+        opts = self.view_opts
+        n = len(opts)
+        offsets = self._offsets
+        start = min(self._dirty_from, len(offsets) - 1)
+        if start < n or len(offsets) != n + 1:
+            del offsets[start + 1:]
+            top = offsets[start]
+            spacing = self.spacing
+            for opt in islice(opts, start, n):
+                top += opt['size'][1] + spacing
+                offsets.append(top)
+        self._dirty_from = n
+
+        content = offsets[n] - self.spacing if n else 0
+        self.minimum_height = content + 2 * self.padding
+        self._reposition_views()
+
+    def compute_visible_views(self, data, viewport):
+        if not data:
+            return []
+        x, y, w, h = viewport
+        top = self.top - self.padding
+        offsets = self._offsets
+        n = len(offsets) - 1
+        first = max(bisect_right(offsets, top - (y + h)) - 1, 0)
+        last = min(bisect_left(offsets, top - y), n)
+        return list(range(first, last))
+
+    def get_view_index_at(self, pos):
+        n = len(self._offsets) - 1
+        index = bisect_right(self._offsets, self.top - self.padding - pos[1]) - 1
+        return min(max(index, 0), max(n - 1, 0))
+
+    def refresh_view_layout(self, index, layout, view, viewport):
+        opt = self.view_opts[index]
+        opt['size'][0] = self.width - 2 * self.padding
+        layout['size'] = list(opt['size'])
+        layout['pos'] = self._row_pos(index)
+        super().refresh_view_layout(index, layout, view, viewport)
+
+    def _row_pos(self, index):
+        height = self.view_opts[index]['size'][1]
+        return (self.x + self.padding,
+                self.top - self.padding - self._offsets[index] - height)
+
+    def _reposition_views(self, *args):
+        if len(self._offsets) != len(self.view_opts) + 1:
+            return
+        for view, index in self.view_indices.items():
+            view.pos = self._row_pos(index)
+
+
+class MessageList(RecycleView):
+    """Virtualized chat transcript.
+
+    ``data`` holds one record per message and is the message model: a
+    :class:`Message`, or any dict with ``role`` and ``text``. Only the rows
+    inside the viewport are laid out, so appending to a long chat costs the
+    same as appending to a short one.
+
+    Messages are addressed by the key :meth:`append_message` returns, which
+    stays valid when older history is prepended above it.
+
+    Assistant messages are Markdown and are rendered through a
+    :class:`MarkdownRenderer` in the current ``theme``.
+    """
+
+    background_color = ListProperty([0.1, 0.1, 0.1, 1])
+    foreground_color = ListProperty([0.9, 0.9, 0.9, 1])
+    message_colors = DictProperty({})
+    theme = StringProperty('dark')
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.layout = MessageLayout(
+            size_hint_y=None,
+            default_size=(None, dp(32)),
+            default_size_hint=(1, None),
+            padding=dp(4),
+            spacing=dp(4)
+        )
+        self.layout.bind(minimum_height=self.layout.setter('height'))
+        self.add_widget(self.layout)
+        self.viewclass = MessageRow
+
+        with self.canvas.before:
+            self._bg_color = Color(*self.background_color)
+            self._bg_rect = Rectangle(pos=self.pos, size=self.size)
+        self.bind(pos=self._update_background, size=self._update_background)
+        self._scroll_trigger = Clock.create_trigger(self._scroll_to_bottom)
+        # Number of records prepended since the last clear; keys are data
+        # indices minus this offset
+        self._offset = 0
+        self._refresh_trigger = Clock.create_trigger(lambda dt: self.refresh_from_data())
+        self.renderer = MarkdownRenderer(
+            on_update=self._refresh_trigger,
+            dispatch=lambda callback: Clock.schedule_once(lambda dt: callback()),
+        )
+
+    def append_message(self, role, text, **fields):
+        """Append a message record and return its key."""
+        follow = self.is_at_bottom()
+        self.data.append(Message(role, text, **fields))
+        if follow:
+            self._scroll_trigger()
+        return len(self.data) - 1 - self._offset
+
+    def prepend_messages(self, records):
+        """Insert older records above the current ones, keeping the view still."""
+        if not records:
+            return
+        # Keep the distance from the bottom of the content constant so the
+        # rows the user is looking at do not jump.
+        from_bottom = self.scroll_y * max(self.layout.height - self.height, 0)
+
+        def restore(layout, height):
+            layout.unbind(height=restore)
+            scrollable = height - self.height
+            if scrollable > 0:
+                self.scroll_y = min(from_bottom / scrollable, 1)
+
+        self.layout.bind(height=restore)
+        self.data[0:0] = records
+        self._offset += len(records)
+
+    def get_message(self, key):
+        """Return the record for a key from :meth:`append_message`."""
+        return self.data[key + self._offset]
+
+    def extend_message(self, key, delta):
+        """Append ``delta`` to the text of the message with ``key``."""
+        follow = self.is_at_bottom()
+        index = key + self._offset
+        record = self.data[index]
+        record['text'] += delta
+        # Reassigning the record marks its row for a refresh
+        self.data[index] = record
+        if follow:
+            self._scroll_trigger()
+
+    def clear(self):
+        """Remove every message."""
+        self.data = []
+        self._offset = 0
+        self.renderer.forget()
+
+    def load_records(self, records, offset=0, scroll_y=0):
+        """Show another message model: ``records`` with ``offset`` prepended above key 0."""
+        self.renderer.forget()
+        self.data = records
+        self._offset = offset
+        self.scroll_y = scroll_y
+
+    def unload_records(self):
+        """Remove every message and return ``(records, offset)`` for :meth:`load_records`."""
+        records, offset = list(self.data), self._offset
+        self.clear()
+        return records, offset
+
+    def transcript(self):
+        """Return the whole conversation as plain text."""
+        lines = []
+        for record in self.data:
+            label = ROLE_LABELS.get(record['role'])
+            lines.append(f"{label}: {record['text']}" if label else record['text'])
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def format_message(self, record, key=None):
+        """Return the Kivy markup shown for a message record."""
+        if record['role'] == 'assistant':
+            text = self.renderer.render(record['text'], self.theme, key)
+        else:
+            text = escape_markup(record['text'])
+        attachments = record.get('attachments')
+        if attachments:
+            count = len(attachments)
+            text += f"\n[i]({count} image{'s' if count > 1 else ''} attached)[/i]"
+        label = ROLE_LABELS.get(record['role'])
+        if not label:
+            return text
+        color = self.message_colors.get(record['role'], '')
+        if color:
+            return f"[b][color={color}]{label}:[/color][/b] {text}"
+        return f"[b]{label}:[/b] {text}"
+
+    def is_at_bottom(self):
+        """Return True when the newest message is in view."""
+        return self.scroll_y <= 0.001 or self.layout.height <= self.height
+
+    def scroll_to_bottom(self):
+        """Scroll to the newest message once the layout has caught up."""
+        self._scroll_trigger()
+
+    def _scroll_to_bottom(self, *args):
+        self.scroll_y = 0
+
+    def on_foreground_color(self, instance, value):
+        # Rows pick the color up when they are recycled; only the visible
+        # ones need updating now.
+        for view in self.layout.children:
+            view.color = value
+
+    def on_background_color(self, instance, value):
+        if hasattr(self, '_bg_color'):
+            self._bg_color.rgba = value
+
+    def on_message_colors(self, instance, value):
+        self.refresh_from_data()
+
+    def on_theme(self, instance, value):
+        # Blocks already rendered in this theme come from the cache
+        self.refresh_from_data()
+
+    def _update_background(self, *args):
+        self._bg_rect.pos = self.pos
+        self._bg_rect.size = self.size
@@ -0,0 +1,162 @@
+import sys
+from collections import OrderedDict
+
+# Message ids read from the session store per query when paging bodies in
+LOAD_BATCH = 500
+
+
+class Message:
+    """One transcript record, with fixed slots instead of a per-message dict.
+
+    Role and model names are interned, so every message from the same model
+    shares one string. The body is held once, in ``text``; after the
+    message is attached to :class:`MessageBodies` it may be dropped from
+    memory and is read back from the session store the next time it is
+    accessed.
+
+    Records can also be read and written like the dicts :class:`MessageList`
+    takes, which is how the Kivy layout reads ``height``: ``record['text']``,
+    ``record.get('id')`` and ``'id' in record`` work, and fields that are
+    not set count as missing.
+    """
+
+    __slots__ = ("id", "role", "model", "created_at", "attachments", "height", "_text", "_bodies")
+
+    FIELDS = ("id", "role", "model", "created_at", "attachments", "height")
+
+    def __init__(self, role, text, id=None, model=None, created_at=None, attachments=None,
+                 height=None):
+        self.id = id
+        self.role = sys.intern(role)
+        self.model = sys.intern(model) if model else None
+        self.created_at = created_at
+        # Keys of attached images in the attachment cache
+        self.attachments = tuple(attachments) if attachments else None
+        self.height = height
+        self._text = text
+        self._bodies = None
+
+    @property
+    def text(self):
+        if self._text is None:
+            return self._bodies.page_in(self)
+        if self._bodies is not None:
+            self._bodies.touch(self)
+        return self._text
+
+    @text.setter
+    def text(self, text):
+        self._text = text
+
+    def is_resident(self):
+        """Return True when the body is in memory."""
+        return self._text is not None
+
+    def memory(self):
+        """Return the bytes of body held in memory.
+
+        Python stores text at one, two or four bytes a character depending
+        on the widest one, so this is the size of the string object rather
+        than its length.
+        """
+        return sys.getsizeof(self._text) if self._text is not None else 0
+
+    def __getitem__(self, key):
+        if key == "text":
+            return self.text
+        value = getattr(self, key, None) if key in self.FIELDS else None
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        if key != "text" and key not in self.FIELDS:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key == "text" or (key in self.FIELDS and getattr(self, key) is not None)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __repr__(self):
+        return f"Message({self.role!r}, id={self.id!r})"
+
+
+class MessageBodies:
+    """An LRU window of the message bodies kept in memory.
+
+    Messages attached here are already saved, so once more than
+    ``max_resident`` of them hold their body the least recently used ones
+    drop it; :attr:`Message.text` reads it back through
+    ``load(ids) -> {id: text}`` when the message is scrolled to. Messages
+    that are not attached, such as a reply still streaming, always stay
+    in memory.
+    """
+
+    def __init__(self, load, max_resident=2000):
+        self.load = load
+        self.max_resident = max_resident
+        # message id -> Message, least recently used first
+        self._resident = OrderedDict()
+        self.stats = {"paged_out": 0, "paged_in": 0}
+
+    def attach(self, message):
+        """Let ``message``, which must have an id, be paged out from now on."""
+        message._bodies = self
+        if message._text is not None:
+            self._admit(message)
+
+    def forget(self, messages):
+        """Stop tracking ``messages``, for example when their session is closed."""
+        for message in messages:
+            if getattr(message, "_bodies", None) is self:
+                self._resident.pop(message.id, None)
+
+    def touch(self, message):
+        if message.id in self._resident:
+            self._resident.move_to_end(message.id)
+
+    def page_in(self, message):
+        """Read the body of ``message`` back into memory; returns it."""
+        text = self.load([message.id]).get(message.id, "")
+        message._text = text
+        self.stats["paged_in"] += 1
+        self._admit(message)
+        return text
+
+    def texts(self, messages):
+        """Return the bodies of ``messages`` without paging them back in.
+
+        Bodies that are paged out are read in batches, so walking a long
+        history does not push the messages being viewed out of memory.
+        """
+        missing = [m.id for m in messages if isinstance(m, Message) and m._text is None]
+        loaded = {}
+        for start in range(0, len(missing), LOAD_BATCH):
+            loaded.update(self.load(missing[start:start + LOAD_BATCH]))
+        texts = []
+        for message in messages:
+            if not isinstance(message, Message):
+                texts.append(message["text"])
+            elif message._text is None:
+                texts.append(loaded.get(message.id, ""))
+            else:
+                texts.append(message._text)
+        return texts
+
+    def resident(self):
+        """Return how many attached messages hold their body."""
+        return len(self._resident)
+
+    def _admit(self, message):
+        self._resident[message.id] = message
+        self._resident.move_to_end(message.id)
+        while len(self._resident) > self.max_resident:
+            _, oldest = self._resident.popitem(last=False)
+            oldest._text = None
+            self.stats["paged_out"] += 1
@@ -0,0 +1,117 @@
+import json
+import os
+import re
+import time
+from pathlib import Path
+
+
+def parse_show(show):
+    """Extract the context length and quantization from an /api/show reply."""
+    details = show.get("details", {})
+    info = show.get("model_info", {})
+    context_length = None
+    for key, value in info.items():
+        if key.endswith(".context_length"):
+            context_length = value
+            break
+    # A num_ctx set in the Modelfile overrides the architecture default
+    match = re.search(r"^num_ctx\s+(\d+)", show.get("parameters", ""), re.MULTILINE)
+    if match:
+        context_length = int(match.group(1))
+    return {
+        "context_length": context_length,
+        "quantization": details.get("quantization_level"),
+        "family": details.get("family"),
+        "parameter_size": details.get("parameter_size"),
+    }
+
+
+class ModelCatalog:
+    """What is installed on an Ollama server, cached with a TTL.
+
+    Entries hold each model's name, digest and size from /api/tags plus the
+    context length and quantization from /api/show. The catalog is saved to
+    ``path`` so the model list is available at startup before the server
+    has been asked; :meth:`OllamaClient.list_models` serves it while it is
+    stale and refreshes it in the background.
+    """
+
+    def __init__(self, path=None, ttl=300):
+        self.path = Path(path) if path else None
+        self.ttl = ttl
+        self.entries = {}
+        self.fetched_at = 0
+        if self.path is not None:
+            self.load()
+
+    @classmethod
+    def from_config(cls, config):
+        """Create a catalog saved under the configured ``save_path``."""
+        return cls(
+            path=Path(config.get("save_path", "saved_chats")) / "models.json",
+            ttl=config.get("ollama", {}).get("catalog_ttl", 300),
+        )
+
+    def is_stale(self):
+        return not self.fetched_at or time.time() - self.fetched_at > self.ttl
+
+    def names(self):
+        return sorted(self.entries)
+
+    def models(self):
+        """Return every entry, sorted by name."""
+        return [self.entries[name] for name in self.names()]
+
+    def get(self, name):
+        return self.entries.get(name)
+
+    def update(self, tags):
+        """Merge the ``models`` list of an /api/tags reply.
+
+        Models that are gone are dropped, and a model whose digest changed
+        loses its cached details. Returns the names that need /api/show.
+        """
+        entries = {}
+        missing = []
+        for model in tags:
+            name = model["name"]
+            entry = self.entries.get(name)
+            if entry is None or entry.get("digest") != model.get("digest"):
+                entry = {"context_length": None, "quantization": None, "details_digest": None}
+            entry.update(
+                name=name,
+                digest=model.get("digest"),
+                size=model.get("size"),
+                modified_at=model.get("modified_at"),
+            )
+            if entry["details_digest"] != entry["digest"]:
+                missing.append(name)
+            entries[name] = entry
+        self.entries = entries
+        self.fetched_at = time.time()
+        return missing
+
+    def set_details(self, name, show):
+        """Record the parsed /api/show reply for ``name``."""
+        entry = self.entries.get(name)
+        if entry is not None:
+            entry.update(parse_show(show))
+            entry["details_digest"] = entry["digest"]
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.entries = {entry["name"]: entry for entry in data.get("models", [])}
+        self.fetched_at = data.get("fetched_at", 0)
+
+    def save(self):
+        if self.path is None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"fetched_at": self.fetched_at, "models": self.models()}, f, indent=2)
+        os.replace(tmp, self.path)
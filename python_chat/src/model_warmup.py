@@ -0,0 +1,173 @@
+import asyncio
+
+import aiohttp
+
+from .ollama_client import OllamaError, model_key
+
+LOADING = "loading"
+READY = "ready"
+UNLOADED = "unloaded"
+FAILED = "failed"
+
+
+class WarmupManager:
+    """Loads models ahead of the first message and tracks which ones are resident.
+
+    :meth:`preload` sends a generate request without a prompt, which makes
+    Ollama load the model and keep it for its ``keep_alive``, so selecting
+    a model pays the load time in the background instead of on the next
+    reply. A poller reads /api/ps every ``poll_interval`` seconds to learn
+    which models are in memory and how much they use, and ``on_change`` is
+    called whenever that or a model's state changes.
+
+    Pinned models are shared with the client, which sends keep_alive -1 for
+    them so they stay loaded until unpinned; :meth:`unload` frees a model's
+    memory straight away.
+    """
+
+    def __init__(self, client, poll_interval=10, pinned=(), on_change=None):
+        self.poll_interval = poll_interval
+        self.pinned = set(pinned)
+        self.on_change = on_change
+        # model_key -> the /api/ps record of each resident model
+        self.resident = {}
+        # model_key -> why the last load failed
+        self.errors = {}
+        self._loading = {}
+        self._task = None
+        self.client = None
+        self.attach(client)
+
+    @classmethod
+    def from_config(cls, client, config, on_change=None):
+        """Create a manager from the ``warmup`` section of the app config."""
+        warmup = config.get("warmup", {})
+        return cls(
+            client,
+            poll_interval=warmup.get("poll_interval", 10),
+            pinned=warmup.get("pinned", []),
+            on_change=on_change,
+        )
+
+    def attach(self, client):
+        """Load and poll through ``client`` from now on; it keeps the pinned models loaded."""
+        self.client = client
+        client.pinned = self.pinned
+
+    def start(self):
+        """Start polling /api/ps on the running event loop."""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._poll())
+        return self._task
+
+    async def close(self):
+        """Stop polling and cancel loads in progress; loaded models stay loaded."""
+        tasks = list(self._loading.values())
+        if self._task is not None:
+            tasks.append(self._task)
+            self._task = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def state(self, model):
+        """Return ``loading``, ``ready``, ``failed`` or ``unloaded`` for ``model``."""
+        key = model_key(model)
+        if key in self._loading:
+            return LOADING
+        if key in self.resident:
+            return READY
+        if key in self.errors:
+            return FAILED
+        return UNLOADED
+
+    def describe(self, model):
+        """Return the state of ``model`` as a short label, such as ``ready, 4.1 GB``."""
+        state = self.state(model)
+        if state == READY:
+            record = self.resident[model_key(model)]
+            size = record.get("size_vram") or record.get("size") or 0
+            state = f"{state}, {size / 1e9:.1f} GB"
+        elif state == FAILED:
+            return f"{state}: {self.errors[model_key(model)]}"
+        if model in self.pinned:
+            state += ", pinned"
+        return state
+
+    def memory(self):
+        """Return the bytes of GPU memory held by resident models."""
+        return sum(record.get("size_vram", 0) for record in self.resident.values())
+
+    def preload(self, model):
+        """Start loading ``model`` in the background unless it is already loading; returns the task."""
+        task = self._loading.get(model_key(model))
+        if task is None:
+            task = self._start(model)
+        return task
+
+    def pin(self, model):
+        """Keep ``model`` loaded until it is unpinned or unloaded; returns the load task."""
+        self.pinned.add(model)
+        # Loading again replaces the expiry the model was loaded with
+        return self._start(model)
+
+    def unpin(self, model):
+        """Let ``model`` expire after its configured ``keep_alive`` again; returns the load task."""
+        self.pinned.discard(model)
+        return self._start(model)
+
+    async def unload(self, model):
+        """Unpin ``model`` and free its memory now; request errors are raised."""
+        self.pinned.discard(model)
+        key = model_key(model)
+        task = self._loading.pop(key, None)
+        if task is not None:
+            task.cancel()
+        await self.client.unload_model(model)
+        self.resident.pop(key, None)
+        self._changed()
+        await self.refresh()
+
+    async def refresh(self):
+        """Read /api/ps and record the resident models; returns them."""
+        try:
+            models = await self.client.running_models()
+        except (OllamaError, aiohttp.ClientError, asyncio.TimeoutError):
+            # Keep showing the last known state until the server answers
+            return self.resident
+        resident = {model_key(record["name"]): record for record in models}
+        if resident != self.resident:
+            self.resident = resident
+            self._changed()
+        return resident
+
+    def _start(self, model):
+        key = model_key(model)
+        task = asyncio.get_running_loop().create_task(self._load(model))
+        self._loading[key] = task
+        self._changed()
+        return task
+
+    async def _load(self, model):
+        key = model_key(model)
+        task = asyncio.current_task()
+        try:
+            await self.client.load_model(model)
+            self.errors.pop(key, None)
+        except (OllamaError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.errors[key] = str(e) or type(e).__name__
+        finally:
+            # A newer load of the same model may have replaced this one
+            if self._loading.get(key) is task:
+                del self._loading[key]
+        await self.refresh()
+        self._changed()
+
+    async def _poll(self):
+        while True:
+            await self.refresh()
+            await asyncio.sleep(self.poll_interval)
+
+    def _changed(self):
+        if self.on_change is not None:
+            self.on_change()
@@ -1,14 +1,689 @@
+import asyncio
+import json
+import time
+
+import aiohttp
+
+from .host_pool import HostPool
+from .model_catalog import ModelCatalog
+from .response_cache import ResponseCache, is_deterministic
+
+
+def model_key(name):
+    """Return ``name`` with the ``:latest`` tag Ollama gives models named without one."""
+    return name if ":" in name else name + ":latest"
+
+
+class OllamaError(Exception):
+    """Raised when the Ollama server reports an error or returns a bad response."""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        # HTTP status of the response, when there was one
+        self.status = status
+
+
+class OllamaTimeoutError(OllamaError):
+    """Raised when a connect, first-byte or idle timeout expires."""
+
+
 class OllamaClient:
-    def __init__(self, host="http://localhost:11434"):
-        self.host = host
-        self.available_models = []
+    def __init__(self, host="http://localhost:11434", limit=10, limit_per_host=0,
+                 keepalive_timeout=30, dns_cache_ttl=300, connect_timeout=5,
+                 first_byte_timeout=120, idle_timeout=60, cache=None, catalog=None,
+                 pool=None, health_interval=15, keep_alive=None, telemetry=None):
+        # With a HostPool, generation requests are routed across its hosts
+        # and ``host`` is only the default for single-host calls.
+        self.pool = pool
+        if pool is not None:
+            host = next(iter(pool.hosts))
+        self.host = host.rstrip("/")
+        self.health_interval = health_interval
+        self._health_task = None
         self.current_model = None
-        
+
+        # Connection pool settings, applied to every per-host session
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_ttl = dns_cache_ttl
+
+        # Per-phase timeouts in seconds (None disables a phase)
+        self.connect_timeout = connect_timeout
+        self.first_byte_timeout = first_byte_timeout
+        self.idle_timeout = idle_timeout
+
+        self.stats = {
+            "requests": 0,
+            "connections_created": 0,
+            "connections_reused": 0,
+        }
+        self._sessions = {}
+
+        # How long each model stays loaded after a request: model name (with
+        # or without its tag) or "*" to a duration such as "30m" or -1
+        self.keep_alive = dict(keep_alive or {})
+        # Models kept loaded until unpinned; their requests send keep_alive -1
+        self.pinned = set()
+
+        # Optional Telemetry that times every streamed request
+        self.telemetry = telemetry
+
+        # Optional ResponseCache for deterministic generations
+        self.cache = cache
+        self.model_digests = {}
+        # Models not found by the last catalog refresh, so each one costs
+        # one refresh rather than one per request
+        self._digest_misses = set()
+
+        # Installed models; an in-memory catalog with no TTL if none is given
+        self.catalog = catalog if catalog is not None else ModelCatalog(ttl=0)
+        self.available_models = self.catalog.names()
+        self._refresh_task = None
+        # Set once a server turns out not to have the batched /api/embed
+        self._legacy_embeddings = False
+
+    @classmethod
+    def from_config(cls, config):
+        """Create a client from the ``ollama`` section of the app config."""
+        ollama = config.get("ollama", {})
+        connection = ollama.get("connection", {})
+        timeouts = ollama.get("timeouts", {})
+        routing = ollama.get("routing", {})
+        hosts = ollama.get("hosts") or []
+        pool = None
+        if len(hosts) > 1:
+            pool = HostPool(
+                hosts,
+                failure_threshold=routing.get("failure_threshold", 3),
+                cooldown=routing.get("cooldown", 30),
+                hedge_percentile=routing.get("hedge_percentile", 0),
+                hedge_min_samples=routing.get("hedge_min_samples", 20),
+            )
+        return cls(
+            host=hosts[0] if hosts else ollama.get("host", "http://localhost:11434"),
+            pool=pool,
+            health_interval=routing.get("health_interval", 15),
+            limit=connection.get("limit", 10),
+            limit_per_host=connection.get("limit_per_host", 0),
+            keepalive_timeout=connection.get("keepalive_timeout", 30),
+            dns_cache_ttl=connection.get("dns_cache_ttl", 300),
+            connect_timeout=timeouts.get("connect", 5),
+            first_byte_timeout=timeouts.get("first_byte", 120),
+            idle_timeout=timeouts.get("idle", 60),
+            cache=ResponseCache.from_config(config),
+            catalog=ModelCatalog.from_config(config),
+            keep_alive=ollama.get("keep_alive"),
+        )
+
     async def connect(self):
+        """Check that the server, or at least one pooled host, is reachable."""
+        if self.pool is not None:
+            return any((await self.check_hosts()).values())
+        try:
+            await self._get_json("/api/version")
+        except (OllamaError, aiohttp.ClientError):
+            return False
         return True
-        
-    async def list_models(self):
-        return [{"name": "mistral"}, {"name": "llama2"}]
-        
-    async def generate(self, model, prompt, system="", parameters=None):
-        return f"Response to: {prompt}"
+
+    async def list_models(self, refresh=False):
+        """Return the installed models from the catalog.
+
+        An empty catalog, or ``refresh=True``, waits for the server. A stale
+        one is returned as is while a background task refreshes it, so the
+        caller never waits on /api/tags and /api/show round trips.
+        """
+        if refresh or not self.catalog.entries:
+            await self.refresh_models()
+        elif self.catalog.is_stale():
+            self.refresh_models_soon()
+        return self.catalog.models()
+
+    async def refresh_models(self):
+        """Reload the catalog from /api/tags, and /api/show for new digests."""
+        missing = self.catalog.update(await self._fetch_tags())
+        shows = await asyncio.gather(
+            *(self.show_model(name) for name in missing), return_exceptions=True
+        )
+        for name, show in zip(missing, shows):
+            if not isinstance(show, BaseException):
+                self.catalog.set_details(name, show)
+        self.catalog.save()
+        self.available_models = self.catalog.names()
+        # Response cache keys include the digest, so replies cached for a
+        # model that has since been re-pulled are no longer found.
+        self.model_digests = {m["name"]: m["digest"] for m in self.catalog.models()}
+        self._digest_misses.clear()
+        return self.catalog.models()
+
+    def refresh_models_soon(self):
+        """Start a background catalog refresh unless one is already running."""
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.get_running_loop().create_task(self._background_refresh())
+        return self._refresh_task
+
+    async def _background_refresh(self):
+        try:
+            await self.refresh_models()
+        except (OllamaError, aiohttp.ClientError):
+            # Keep serving the stale catalog; the next call retries
+            pass
+
+    async def show_model(self, name):
+        """Return /api/show for ``name`` (details, model_info, parameters...)."""
+        host = self.pool.choose(name) if self.pool is not None else None
+        return await self._post_json("/api/show", {"model": name}, host)
+
+    async def embed(self, model, texts):
+        """Return one embedding vector (a list of floats) per text.
+
+        Sends the whole batch to /api/embed. Servers older than that
+        endpoint get one /api/embeddings request per text instead.
+        """
+        texts = list(texts)
+        host = self.pool.choose(model) if self.pool is not None else None
+        if not self._legacy_embeddings:
+            try:
+                result = await self._post_json("/api/embed", {"model": model, "input": texts}, host)
+                return result["embeddings"]
+            except OllamaError as e:
+                if e.status != 404:
+                    raise
+                self._legacy_embeddings = True
+        results = await asyncio.gather(*(
+            self._post_json("/api/embeddings", {"model": model, "prompt": text}, host)
+            for text in texts
+        ))
+        return [result["embedding"] for result in results]
+
+    async def _fetch_tags(self):
+        """Return the /api/tags models, merged across every pooled host."""
+        if self.pool is None:
+            return (await self._get_json("/api/tags")).get("models", [])
+        replies = await self._probe_hosts()
+        models = {}
+        for reply in replies.values():
+            if not isinstance(reply, BaseException):
+                for model in reply.get("models", []):
+                    models.setdefault(model["name"], model)
+        if all(isinstance(reply, BaseException) for reply in replies.values()):
+            raise next(iter(replies.values()))
+        return list(models.values())
+
+    async def check_hosts(self):
+        """Probe every pooled host with /api/tags; returns ``{url: ok}``.
+
+        Hosts that answer are marked healthy and their model lists updated;
+        hosts that fail are marked down until the pool's cooldown passes.
+        """
+        if self.pool is None:
+            return {self.host: await self.connect()}
+        replies = await self._probe_hosts()
+        return {url: not isinstance(reply, BaseException) for url, reply in replies.items()}
+
+    async def _probe_hosts(self):
+        urls = list(self.pool.hosts)
+        replies = await asyncio.gather(
+            *(self._get_json("/api/tags", url) for url in urls), return_exceptions=True
+        )
+        for url, reply in zip(urls, replies):
+            if isinstance(reply, (OllamaError, aiohttp.ClientError, OSError)):
+                self.pool.mark_down(url)
+            elif isinstance(reply, BaseException):
+                raise reply
+            else:
+                self.pool.set_models(url, [m["name"] for m in reply.get("models", [])])
+                self.pool.record_success(url)
+        return dict(zip(urls, replies))
+
+    def start_health_checks(self):
+        """Probe the pooled hosts every ``health_interval`` seconds in the background."""
+        if self.pool is None or not self.health_interval:
+            return None
+        if self._health_task is None or self._health_task.done():
+            self._health_task = asyncio.get_running_loop().create_task(self._health_loop())
+        return self._health_task
+
+    async def _health_loop(self):
+        while True:
+            await self.check_hosts()
+            await asyncio.sleep(self.health_interval)
+
+    def host_stats(self):
+        """Return per-host request stats keyed by URL."""
+        if self.pool is None:
+            return {self.host: dict(self.stats)}
+        return self.pool.stats()
+
+    def keep_alive_for(self, model):
+        """Return the configured ``keep_alive`` for ``model``, or None for the server default."""
+        if model in self.pinned:
+            return -1
+        for name in (model, model.split(":")[0], "*"):
+            if name in self.keep_alive:
+                return self.keep_alive[name]
+        return None
+
+    async def load_model(self, model, keep_alive=None):
+        """Load ``model`` into memory without generating anything.
+
+        ``keep_alive`` defaults to the configured one; 0 unloads the model.
+        With a host pool the model is loaded on the host that would be
+        chosen for it now.
+        """
+        payload = {"model": model, "stream": False}
+        self._set_keep_alive(payload, keep_alive)
+        host = self.pool.choose(model) if self.pool is not None else None
+        return await self._post_json("/api/generate", payload, host)
+
+    async def unload_model(self, model):
+        """Free the memory ``model`` holds, on every host that may have it loaded."""
+        payload = {"model": model, "stream": False, "keep_alive": 0}
+        if self.pool is None:
+            await self._post_json("/api/generate", payload)
+            return
+        urls = [host.url for host in self.pool.hosts.values() if host.has_model(model)]
+        await asyncio.gather(
+            *(self._post_json("/api/generate", payload, url) for url in urls),
+            return_exceptions=True
+        )
+
+    async def running_models(self):
+        """Return the /api/ps models: those loaded in memory, with their size and expiry.
+
+        With a host pool every host is asked and each model carries the
+        ``host`` it is loaded on; hosts that do not answer are left out.
+        """
+        if self.pool is None:
+            return (await self._get_json("/api/ps")).get("models", [])
+        urls = list(self.pool.hosts)
+        replies = await asyncio.gather(
+            *(self._get_json("/api/ps", url) for url in urls), return_exceptions=True
+        )
+        models = []
+        for url, reply in zip(urls, replies):
+            if isinstance(reply, dict):
+                models.extend(dict(model, host=url) for model in reply.get("models", []))
+        return models
+
+    async def generate(self, model, prompt, system="", parameters=None, context=None,
+                       keep_alive=None):
+        """Generate a completion and return it as one finished string."""
+        tokens = []
+        async for chunk in self.stream_generate(model, prompt, system, parameters,
+                                                context=context, keep_alive=keep_alive):
+            tokens.append(chunk["token"])
+        return "".join(tokens)
+
+    async def stream_generate(self, model, prompt, system="", parameters=None, use_cache=None,
+                              context=None, keep_alive=None):
+        """Stream a completion from /api/generate.
+
+        Yields one dict per NDJSON record with the generated text under
+        ``token``. The last record has ``done`` set and carries Ollama's
+        stats (``total_duration``, ``eval_count``, ``context``...).
+
+        With a cache configured, deterministic requests are answered from it
+        (replayed records have ``cached`` set). ``use_cache=True`` forces the
+        cache for sampled requests too; ``False`` bypasses it.
+
+        ``context`` is the ``context`` of an earlier reply; the prompt then
+        continues that conversation and the server only evaluates the new
+        text. ``keep_alive`` overrides the configured one for ``model``.
+        """
+        payload = {
+            "model": model,
+            "prompt": prompt,
+            "stream": True,
+        }
+        if system:
+            payload["system"] = system
+        if context:
+            payload["context"] = context
+        if parameters:
+            payload["options"] = parameters
+        self._set_keep_alive(payload, keep_alive)
+        async for record in self._cached_stream("/api/generate", payload, use_cache):
+            record["token"] = record.get("response", "")
+            yield record
+
+    async def stream_chat(self, model, messages, parameters=None, use_cache=None,
+                          keep_alive=None):
+        """Stream a chat completion from /api/chat.
+
+        ``messages`` is a list of ``{"role": ..., "content": ...}`` dicts.
+        Yields records and uses the cache the same way as :meth:`stream_generate`.
+        """
+        payload = {
+            "model": model,
+            "messages": messages,
+            "stream": True,
+        }
+        if parameters:
+            payload["options"] = parameters
+        self._set_keep_alive(payload, keep_alive)
+        async for record in self._cached_stream("/api/chat", payload, use_cache):
+            record["token"] = record.get("message", {}).get("content", "")
+            yield record
+
+    def _set_keep_alive(self, payload, keep_alive):
+        if keep_alive is None:
+            keep_alive = self.keep_alive_for(payload["model"])
+        if keep_alive is not None:
+            payload["keep_alive"] = keep_alive
+
+    async def close(self):
+        """Close every pooled HTTP session."""
+        for task in (self._refresh_task, self._health_task):
+            if task is not None:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        self._refresh_task = self._health_task = None
+        sessions, self._sessions = self._sessions, {}
+        for session in sessions.values():
+            if not session.closed:
+                await session.close()
+
+    def _get_session(self, host=None):
+        """Return the long-lived session for ``host``, creating it on first use."""
+        host = host or self.host
+        session = self._sessions.get(host)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+                ttl_dns_cache=self.dns_cache_ttl,
+            )
+            # First-byte and idle timeouts are enforced per request in _stream
+            # and _request_json, so the session itself only bounds connection
+            # setup.
+            timeout = aiohttp.ClientTimeout(
+                total=None,
+                connect=self.connect_timeout,
+                sock_connect=self.connect_timeout,
+            )
+            session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=timeout,
+                trace_configs=[self._trace_config()],
+            )
+            self._sessions[host] = session
+        return session
+
+    def _trace_config(self):
+        trace = aiohttp.TraceConfig()
+
+        async def on_request_start(session, context, params):
+            self.stats["requests"] += 1
+
+        async def on_connection_create_end(session, context, params):
+            self.stats["connections_created"] += 1
+
+        async def on_connection_reuseconn(session, context, params):
+            self.stats["connections_reused"] += 1
+
+        trace.on_request_start.append(on_request_start)
+        trace.on_connection_create_end.append(on_connection_create_end)
+        trace.on_connection_reuseconn.append(on_connection_reuseconn)
+        return trace
+
+    async def _get_json(self, path, host=None):
+        return await self._request_json("GET", path, host)
+
+    async def _post_json(self, path, payload, host=None):
+        return await self._request_json("POST", path, host, json=payload)
+
+    async def _request_json(self, method, path, host=None, **kwargs):
+        """Send a request and return its JSON body.
+
+        The session sets no total timeout, so the first-byte timeout bounds
+        the whole exchange here: the wait for headers as well as the body.
+        """
+        host = host or self.host
+        session = self._get_session(host)
+
+        async def fetch():
+            async with session.request(method, host + path, **kwargs) as response:
+                if response.status != 200:
+                    raise OllamaError(await self._error_message(response), response.status)
+                return await response.json()
+
+        try:
+            return await asyncio.wait_for(fetch(), self.first_byte_timeout)
+        except asyncio.TimeoutError as e:
+            raise OllamaTimeoutError(f"Timed out waiting for {path}") from e
+
+    async def _model_digest(self, model):
+        """Return the digest of ``model``, looking it up once if unknown.
+
+        /api/tags lists models with their tag, so ``mistral`` is found as
+        ``mistral:latest``.
+        """
+        digest = self._known_digest(model)
+        if digest is None and model_key(model) not in self._digest_misses:
+            try:
+                await self.refresh_models()
+            except (OllamaError, aiohttp.ClientError):
+                return None
+            digest = self._known_digest(model)
+            if digest is None:
+                self._digest_misses.add(model_key(model))
+        return digest
+
+    def _known_digest(self, model):
+        digest = self.model_digests.get(model)
+        return digest if digest is not None else self.model_digests.get(model_key(model))
+
+    async def _cached_stream(self, path, payload, use_cache=None):
+        """Like :meth:`_stream`, but served from and stored into the cache."""
+        cache = self.cache
+        if cache is None or use_cache is False or (
+            use_cache is None and not is_deterministic(payload.get("options"))
+        ):
+            if cache is not None:
+                cache.stats["bypassed"] += 1
+            async for record in self._routed_stream(path, payload):
+                yield record
+            return
+
+        digest = await self._model_digest(payload["model"])
+        # How long the model stays loaded does not change the response
+        request = {k: v for k, v in payload.items() if k != "keep_alive"}
+        key = cache.make_key(payload["model"], digest, dict(request, path=path))
+        records = cache.get(key)
+        if records is not None:
+            for record in records:
+                yield dict(record, cached=True)
+            return
+
+        records = []
+        async for record in self._routed_stream(path, payload):
+            records.append(dict(record))
+            yield record
+        # Only complete streams are stored; a cancelled one never gets here
+        if records and records[-1].get("done"):
+            cache.put(key, records)
+
+    async def _routed_stream(self, path, payload):
+        """Stream from the least loaded pooled host, with failover and hedging.
+
+        Until the first record arrives, a host that fails is replaced by the
+        next candidate. If the first record takes longer than the pool's
+        hedge delay, a duplicate request goes to another host; the first to
+        produce a record is kept and the other is cancelled.
+        """
+        pool = self.pool
+        if pool is None:
+            async for record in self._traced_stream(path, payload):
+                yield record
+            return
+
+        model = payload["model"]
+        tried = set()
+        pending = {}
+        winner = None
+
+        def launch(hedge=False):
+            url = pool.choose(model, exclude=tried)
+            if url is None:
+                return False
+            tried.add(url)
+            # Count the request against the host now, so requests started
+            # in the same tick see each other's load
+            pool.started(url)
+            if hedge:
+                pool.hosts[url].stats["hedges"] += 1
+            stream = self._host_stream(path, payload, url)
+            pending[asyncio.ensure_future(stream.__anext__())] = (url, stream, hedge)
+            return True
+
+        try:
+            if not launch():
+                raise OllamaError(f"No host has model '{model}'")
+            delay = pool.hedge_delay()
+            error = None
+            while winner is None:
+                done, _ = await asyncio.wait(
+                    pending, timeout=delay, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    # Slow first token: hedge once on another host
+                    delay = None
+                    launch(hedge=True)
+                    continue
+                for task in done:
+                    url, stream, hedge = pending.pop(task)
+                    try:
+                        first = task.result()
+                    except StopAsyncIteration:
+                        first = None
+                    except (OllamaError, aiohttp.ClientError) as e:
+                        pool.finished(url)
+                        error = e
+                        continue
+                    winner = (url, stream, first)
+                    if hedge:
+                        pool.hosts[url].stats["hedges_won"] += 1
+                    break
+                if winner is None and not pending and not launch():
+                    raise error
+        finally:
+            # Cancel the losing requests; their streams close the responses
+            for task, (url, stream, hedge) in pending.items():
+                task.cancel()
+            for task, (url, stream, hedge) in pending.items():
+                await asyncio.gather(task, return_exceptions=True)
+                await stream.aclose()
+                pool.finished(url)
+
+        url, stream, first = winner
+        try:
+            if first is None:
+                return
+            yield first
+            async for record in stream:
+                yield record
+        finally:
+            await stream.aclose()
+            pool.finished(url)
+
+    async def _host_stream(self, path, payload, url):
+        """:meth:`_stream` from one pooled host, updating its latency and health."""
+        pool = self.pool
+        started = time.monotonic()
+        first = True
+        try:
+            async for record in self._traced_stream(path, payload, url):
+                if first:
+                    pool.record_ttft(url, time.monotonic() - started)
+                    first = False
+                yield record
+            pool.record_success(url)
+        except (OllamaTimeoutError, aiohttp.ClientError):
+            pool.record_failure(url)
+            raise
+        except OllamaError:
+            pool.hosts[url].stats["errors"] += 1
+            raise
+        except (asyncio.CancelledError, GeneratorExit):
+            pool.hosts[url].stats["cancelled"] += 1
+            raise
+
+    async def _traced_stream(self, path, payload, host=None):
+        """:meth:`_stream`, timed into the telemetry when there is one."""
+        if self.telemetry is None:
+            async for record in self._stream(path, payload, host):
+                yield record
+            return
+        trace = self.telemetry.begin(path, payload["model"], host or self.host)
+        final = None
+        status = "cancelled"
+        try:
+            async for record in self._stream(path, payload, host):
+                trace.token(record.get("response") or record.get("message", {}).get("content"))
+                if record.get("done"):
+                    final = record
+                yield record
+        except (OllamaError, aiohttp.ClientError):
+            status = "error"
+            raise
+        finally:
+            trace.finish(final, "ok" if final is not None else status)
+
+    async def _stream(self, path, payload, host=None):
+        """POST ``payload`` to ``path`` and yield the parsed NDJSON records."""
+        host = host or self.host
+        session = self._get_session(host)
+        try:
+            response = await asyncio.wait_for(
+                session.post(host + path, json=payload), self.first_byte_timeout
+            )
+        except asyncio.TimeoutError as e:
+            raise OllamaTimeoutError(f"Timed out waiting for {path} to respond") from e
+        done = False
+        try:
+            if response.status != 200:
+                raise OllamaError(await self._error_message(response), response.status)
+            # Records arrive one per line; parse each as soon as it is complete
+            # instead of waiting for the whole body. The first record is bounded
+            # by the first-byte timeout, the gaps after it by the idle timeout.
+            timeout = self.first_byte_timeout
+            while True:
+                try:
+                    line = await asyncio.wait_for(response.content.readline(), timeout)
+                except asyncio.TimeoutError as e:
+                    raise OllamaTimeoutError(
+                        f"No data from {path} for {timeout} seconds"
+                    ) from e
+                if not line:
+                    break
+                timeout = self.idle_timeout
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError as e:
+                    raise OllamaError(f"Invalid stream record: {line[:200]!r}") from e
+                if "error" in record:
+                    raise OllamaError(record["error"])
+                done = bool(record.get("done"))
+                yield record
+                if done:
+                    break
+        finally:
+            if done:
+                response.release()
+            else:
+                # Abandoned or failed stream: drop the connection so the
+                # server stops generating for a reader that is gone.
+                response.close()
+
+    @staticmethod
+    async def _error_message(response):
+        text = await response.text()
+        try:
+            return json.loads(text)["error"]
+        except (ValueError, KeyError, TypeError):
+            return f"{response.status} {response.reason}: {text[:200]}"
@@ -0,0 +1,231 @@
+import asyncio
+import heapq
+import itertools
+import json
+from collections import defaultdict
+
+# Priority classes; lower runs first
+INTERACTIVE = 0
+NORMAL = 1
+BACKGROUND = 2
+
+
+def request_key(*parts):
+    """Return a key identifying a request by its JSON-serializable parts."""
+    return json.dumps(parts, sort_keys=True, separators=(",", ":"))
+
+
+class Flight:
+    """One upstream request and the records it has produced so far."""
+
+    def __init__(self, key, priority, group):
+        self.key = key
+        self.priority = priority
+        self.group = group
+        self.records = []
+        self.done = False
+        self.error = None
+        self.waiters = 0
+        self.task = None
+        # Future resolved when the flight gets a slot; None once running
+        self.slot = None
+        self.changed = asyncio.Event()
+
+    def notify(self):
+        event, self.changed = self.changed, asyncio.Event()
+        event.set()
+
+
+class FlightStream:
+    """Async iterator over the records of a :class:`Flight`.
+
+    Every follower replays the records produced before it joined, then
+    receives new ones as they arrive.
+    """
+
+    def __init__(self, flight):
+        self.flight = flight
+        self.index = 0
+        self.closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        flight = self.flight
+        try:
+            while not self.closed:
+                changed = flight.changed
+                if self.index < len(flight.records):
+                    self.index += 1
+                    return flight.records[self.index - 1]
+                if flight.done:
+                    self.close()
+                    if flight.error is not None:
+                        raise flight.error
+                    break
+                await changed.wait()
+        except asyncio.CancelledError:
+            self.close()
+            raise
+        raise StopAsyncIteration
+
+    def close(self):
+        """Stop following; cancels the request if no one else follows it."""
+        if self.closed:
+            return
+        self.closed = True
+        flight = self.flight
+        flight.waiters -= 1
+        if not flight.waiters and not flight.done:
+            flight.task.cancel()
+
+    async def aclose(self):
+        self.close()
+
+
+class RequestScheduler:
+    """Admission control in front of OllamaClient.
+
+    Requests wait for one of ``max_per_host`` slots per host and are
+    admitted by priority class, then age. Identical requests that overlap
+    share one upstream stream, and every caller receives all of its
+    records. Background requests tagged with a ``group`` are cancelled by
+    :meth:`supersede` when something newer in that group makes them moot.
+
+    Requests routed by a host pool (``host=None``) share ``max_per_host``
+    slots per pooled host.
+    """
+
+    def __init__(self, max_per_host=2, host_count=1):
+        self.max_per_host = max_per_host
+        self.host_count = host_count
+        self.stats = {
+            "submitted": 0,
+            "coalesced": 0,
+            "queued": 0,
+            "superseded": 0,
+        }
+        self._flights = {}
+        self._active = defaultdict(int)
+        self._queues = defaultdict(list)
+        self._seq = itertools.count()
+
+    @classmethod
+    def from_config(cls, config):
+        """Create a scheduler from the ``scheduler`` section of the app config."""
+        scheduler = cls()
+        scheduler.configure(config)
+        return scheduler
+
+    def configure(self, config):
+        """Apply ``scheduler.max_per_host`` and the size of the ``ollama.hosts`` pool.
+
+        Requests holding a slot keep it; if there are more slots than
+        before, queued requests are admitted straight away.
+        """
+        hosts = config.get("ollama", {}).get("hosts") or []
+        self.max_per_host = config.get("scheduler", {}).get("max_per_host", 2)
+        self.host_count = max(len(hosts), 1)
+        for host in list(self._queues):
+            self._admit(host)
+
+    def stream(self, factory, key=None, priority=INTERACTIVE, group=None, host=None):
+        """Submit ``factory()`` (an async iterator of records) to run once a slot is free.
+
+        Returns a :class:`FlightStream` of its records. The request is queued
+        by this call, not when iteration starts, so it can be superseded
+        straight away. A ``key`` equal to that of a request still in flight
+        joins it instead of starting another; without a key the request is
+        never coalesced. The upstream call is cancelled when every stream
+        following it has been cancelled or closed.
+        """
+        self.stats["submitted"] += 1
+        flight = self._flights.get(key) if key is not None else None
+        if flight is None:
+            flight = Flight(key if key is not None else object(), priority, group)
+            self._flights[flight.key] = flight
+            flight.task = asyncio.get_running_loop().create_task(self._run(flight, factory, host))
+            # A callback rather than a finally in _run, so a flight cancelled
+            # before it ever ran is still finished
+            flight.task.add_done_callback(lambda task: self._finish(flight, task))
+        else:
+            self.stats["coalesced"] += 1
+            if priority < flight.priority:
+                self._promote(flight, priority, host)
+
+        flight.waiters += 1
+        return FlightStream(flight)
+
+    def supersede(self, group):
+        """Cancel the background requests of ``group``; returns how many."""
+        cancelled = 0
+        for flight in list(self._flights.values()):
+            if flight.group == group and flight.priority == BACKGROUND and not flight.done:
+                flight.task.cancel()
+                cancelled += 1
+        self.stats["superseded"] += cancelled
+        return cancelled
+
+    def active(self, host=None):
+        """Return the number of requests holding a slot for ``host``."""
+        return self._active[host]
+
+    def _capacity(self, host):
+        return self.max_per_host * (self.host_count if host is None else 1)
+
+    async def _run(self, flight, factory, host):
+        await self._acquire(flight, host)
+        try:
+            async for record in factory():
+                flight.records.append(record)
+                flight.notify()
+        finally:
+            self._release(host)
+
+    def _finish(self, flight, task):
+        if task.cancelled():
+            flight.error = asyncio.CancelledError()
+        else:
+            flight.error = task.exception()
+        flight.done = True
+        if self._flights.get(flight.key) is flight:
+            del self._flights[flight.key]
+        flight.notify()
+
+    async def _acquire(self, flight, host):
+        queue = self._queues[host]
+        if self._active[host] < self._capacity(host) and not queue:
+            self._active[host] += 1
+            return
+        self.stats["queued"] += 1
+        flight.slot = asyncio.get_running_loop().create_future()
+        heapq.heappush(queue, (flight.priority, next(self._seq), flight.slot))
+        try:
+            await flight.slot
+        except asyncio.CancelledError:
+            if flight.slot.done() and not flight.slot.cancelled():
+                # The slot was handed over just as we were cancelled
+                self._release(host)
+            raise
+        finally:
+            flight.slot = None
+
+    def _release(self, host):
+        self._active[host] -= 1
+        self._admit(host)
+
+    def _admit(self, host):
+        queue = self._queues[host]
+        while queue and self._active[host] < self._capacity(host):
+            _, _, slot = heapq.heappop(queue)
+            if not slot.done():
+                self._active[host] += 1
+                slot.set_result(None)
+
+    def _promote(self, flight, priority, host):
+        flight.priority = priority
+        if flight.slot is not None and not flight.slot.done():
+            # Queue it again at the new priority; the old entry is skipped
+            # because its future will already be resolved
+            heapq.heappush(self._queues[host], (priority, next(self._seq), flight.slot))
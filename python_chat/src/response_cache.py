@@ -0,0 +1,172 @@
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+
+def is_deterministic(parameters):
+    """Return True when ``parameters`` make Ollama's sampling reproducible.
+
+    That is greedy decoding (temperature 0 or top_k 1) or a fixed seed.
+    """
+    parameters = parameters or {}
+    if parameters.get("temperature") == 0 or parameters.get("top_k") == 1:
+        return True
+    seed = parameters.get("seed")
+    return seed is not None and seed >= 0
+
+
+class ResponseCache:
+    """Two-tier cache of complete generation streams.
+
+    Entries are the list of stream records for one request, keyed by a
+    hash of the model, its digest and the request. Recent entries live in
+    an in-memory LRU; every entry is also written to a size-bounded
+    directory so it survives restarts. Entries older than ``ttl`` seconds
+    are treated as misses.
+    """
+
+    def __init__(self, directory=None, max_entries=256, max_disk_bytes=100 * 1024 * 1024,
+                 ttl=24 * 60 * 60):
+        self.directory = Path(directory) if directory else None
+        self.max_entries = max_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.ttl = ttl
+        self.stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "expired": 0,
+            "bypassed": 0,
+            "stores": 0,
+            "memory_evictions": 0,
+            "disk_evictions": 0,
+        }
+        self._memory = OrderedDict()
+        self._disk_bytes = 0
+        if self.directory is not None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._disk_bytes = sum(p.stat().st_size for p in self.directory.glob("*/*.json"))
+
+    @classmethod
+    def from_config(cls, config):
+        """Create a cache from the ``cache`` section, or None when it is disabled."""
+        cache = config.get("cache", {})
+        if not cache.get("enabled"):
+            return None
+        return cls(
+            directory=Path(config.get("save_path", "saved_chats")) / "response_cache",
+            max_entries=cache.get("max_entries", 256),
+            max_disk_bytes=int(cache.get("max_disk_mb", 100) * 1024 * 1024),
+            ttl=cache.get("ttl", 24 * 60 * 60),
+        )
+
+    @staticmethod
+    def make_key(model, digest, request):
+        """Return a stable key for ``request`` (a JSON-serializable dict)."""
+        blob = json.dumps([model, digest, request], sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """Return the cached records for ``key``, or None."""
+        entry = self._memory.get(key)
+        if entry is not None:
+            if self._expired(entry):
+                del self._memory[key]
+                if self.directory is not None:
+                    self._remove_file(self._path(key))
+                self.stats["expired"] += 1
+                self.stats["misses"] += 1
+                return None
+            self._memory.move_to_end(key)
+            self.stats["memory_hits"] += 1
+            return entry["records"]
+
+        entry = self._read_disk(key)
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+        self._remember(key, entry)
+        self.stats["disk_hits"] += 1
+        return entry["records"]
+
+    def put(self, key, records):
+        """Store the complete stream ``records`` under ``key``."""
+        entry = {"created": time.time(), "records": records}
+        self._remember(key, entry)
+        self._write_disk(key, entry)
+        self.stats["stores"] += 1
+
+    def clear(self):
+        """Drop every entry from both tiers."""
+        self._memory.clear()
+        if self.directory is not None:
+            for path in self.directory.glob("*/*.json"):
+                path.unlink()
+        self._disk_bytes = 0
+
+    def _expired(self, entry):
+        return self.ttl is not None and time.time() - entry["created"] > self.ttl
+
+    def _remember(self, key, entry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.stats["memory_evictions"] += 1
+
+    def _path(self, key):
+        return self.directory / key[:2] / f"{key}.json"
+
+    def _read_disk(self, key):
+        if self.directory is None:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if self._expired(entry):
+            self._remove_file(path)
+            self.stats["expired"] += 1
+            return None
+        # Touch the file so disk eviction is least-recently-used too
+        os.utime(path)
+        return entry
+
+    def _write_disk(self, key, entry):
+        if self.directory is None:
+            return
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        data = json.dumps(entry, separators=(",", ":")).encode("utf-8")
+        if len(data) > self.max_disk_bytes:
+            return
+        if path.exists():
+            self._remove_file(path)
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        self._disk_bytes += len(data)
+        if self._disk_bytes > self.max_disk_bytes:
+            self._evict_disk()
+
+    def _evict_disk(self):
+        files = sorted(self.directory.glob("*/*.json"), key=lambda p: p.stat().st_mtime)
+        for path in files:
+            if self._disk_bytes <= self.max_disk_bytes:
+                break
+            self._remove_file(path)
+            self.stats["disk_evictions"] += 1
+
+    def _remove_file(self, path):
+        try:
+            size = path.stat().st_size
+            path.unlink()
+        except OSError:
+            return
+        self._disk_bytes -= size
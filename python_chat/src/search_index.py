@@ -0,0 +1,268 @@
+import argparse
+import asyncio
+import re
+import sqlite3
+import sys
+import threading
+from pathlib import Path
+
+# Markers placed around matched terms in snippets; callers swap them for
+# whatever highlighting their output supports (see highlight()).
+MATCH_START = "\x02"
+MATCH_END = "\x03"
+
+SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    content, content='messages', content_rowid='id', tokenize='unicode61', prefix='2 3'
+);
+CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF content ON messages BEGIN
+    INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content);
+END;
+CREATE TABLE IF NOT EXISTS imported_files (
+    path TEXT PRIMARY KEY,
+    mtime REAL NOT NULL,
+    session_id INTEGER NOT NULL
+);
+"""
+
+ROLE_PREFIXES = {
+    "You: ": "user",
+    "Assistant: ": "assistant",
+}
+
+
+def build_query(text):
+    """Turn free text typed by a user into a safe FTS5 query.
+
+    Every word must match, and the last one is treated as a prefix so
+    results show up while it is still being typed.
+    """
+    words = re.findall(r"\w+", text)
+    if not words:
+        return ""
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+def make_snippet(content, text, context=60):
+    """Return the part of ``content`` around the first match of ``text``.
+
+    Matched words are wrapped in MATCH_START/MATCH_END, using the same
+    rules as build_query (the last word matches as a prefix).
+    """
+    words = re.findall(r"\w+", text)
+    if not words:
+        return content[:2 * context]
+    alternatives = [re.escape(word) + r"\b" for word in words[:-1]]
+    alternatives.append(re.escape(words[-1]) + r"\w*")
+    pattern = re.compile(r"\b(?:" + "|".join(alternatives) + ")", re.IGNORECASE)
+    match = pattern.search(content)
+    start = 0 if match is None else max(match.start() - context, 0)
+    end = min(start + 2 * context + (match.end() - match.start() if match else 0), len(content))
+    # Cut at word boundaries
+    if start > 0:
+        space = content.find(" ", start)
+        start = space + 1 if 0 <= space < (match.start() if match else end) else start
+    if end < len(content):
+        space = content.rfind(" ", start, end)
+        end = space if space > (match.end() if match else start) else end
+    snippet = pattern.sub(lambda m: MATCH_START + m.group(0) + MATCH_END, content[start:end])
+    return ("..." if start > 0 else "") + snippet + ("..." if end < len(content) else "")
+
+
+def highlight(snippet, start, end, escape=None):
+    """Replace the match markers in ``snippet`` with ``start``/``end``."""
+    if escape is not None:
+        snippet = escape(snippet)
+    return snippet.replace(MATCH_START, start).replace(MATCH_END, end)
+
+
+def parse_transcript(text):
+    """Split an exported text transcript into ``(role, content)`` pairs.
+
+    Lines starting with a role prefix open a new message; other lines
+    continue the previous one, or are system messages at the very start.
+    """
+    messages = []
+    for line in text.splitlines():
+        for prefix, role in ROLE_PREFIXES.items():
+            if line.startswith(prefix):
+                messages.append([role, line[len(prefix):]])
+                break
+        else:
+            if messages and messages[-1][0] != "system":
+                messages[-1][1] += "\n" + line
+            elif line.strip():
+                messages.append(["system", line])
+    return [(role, content) for role, content in messages]
+
+
+class SearchIndex:
+    """Full-text index over every message in a :class:`SessionStore`.
+
+    The index is an FTS5 table kept in step with the ``messages`` table by
+    triggers, so it is updated as messages are saved and checkpointed.
+    :meth:`search_async` queries it from a worker thread on a read-only
+    connection of its own, which WAL lets run alongside the store's writes.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.conn = store.conn
+        self._reader = None
+        self._reader_lock = threading.Lock()
+        exists = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'messages_fts'"
+        ).fetchone()
+        self.conn.executescript(SCHEMA)
+        if not exists:
+            # Index history written before the index existed
+            self.rebuild()
+
+    def rebuild(self):
+        """Rebuild the whole index from the messages table."""
+        self.conn.execute("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')")
+
+    def search(self, text, limit=20):
+        """Return the best matches for ``text``, best first.
+
+        Each result has the message ``id``, ``session_id``, ``role``, a
+        ``snippet`` with matches wrapped in MATCH_START/MATCH_END, and its
+        bm25 ``rank`` (lower is better).
+
+        Every match is ranked, however old, and FTS5 keeps only the best
+        ``limit`` as it goes, so memory is bounded by ``limit``. Time still
+        grows with the number of matches, about a microsecond each.
+        """
+        return self._search(self.conn, text, limit)
+
+    async def search_async(self, text, limit=20):
+        """:meth:`search` in a worker thread, so a slow query never blocks the caller's loop."""
+        return await asyncio.to_thread(self._search_reader, text, limit)
+
+    def close(self):
+        """Close the read-only connection of :meth:`search_async`."""
+        with self._reader_lock:
+            if self._reader is not None:
+                self._reader.close()
+                self._reader = None
+
+    def _search_reader(self, text, limit):
+        with self._reader_lock:
+            if self._reader is None:
+                uri = Path(self.store.path).resolve().as_uri() + "?mode=ro"
+                self._reader = sqlite3.connect(uri, uri=True, check_same_thread=False)
+                self._reader.row_factory = sqlite3.Row
+            return self._search(self._reader, text, limit)
+
+    def _search(self, conn, text, limit):
+        query = build_query(text)
+        if not query:
+            return []
+        rows = conn.execute(
+            "SELECT m.id, m.session_id, m.role, m.created_at, m.content, f.rank "
+            "FROM (SELECT rowid AS id, rank FROM messages_fts WHERE messages_fts MATCH ? "
+            "      ORDER BY rank LIMIT ?) AS f "
+            "JOIN messages m ON m.id = f.id ORDER BY f.rank",
+            (query, limit),
+        )
+        results = []
+        for row in rows:
+            result = dict(row)
+            result["snippet"] = make_snippet(result.pop("content"), text)
+            results.append(result)
+        return results
+
+    def import_transcript(self, path):
+        """Import an exported ``.txt`` transcript as a session.
+
+        Returns the number of messages imported; files that have not changed
+        since they were last imported are skipped and return 0.
+        """
+        path = Path(path).resolve()
+        mtime = path.stat().st_mtime
+        previous = self.conn.execute(
+            "SELECT mtime, session_id FROM imported_files WHERE path = ?", (str(path),)
+        ).fetchone()
+        if previous is not None and previous["mtime"] == mtime:
+            return 0
+
+        messages = parse_transcript(path.read_text(encoding="utf-8", errors="replace"))
+        with self.store.transaction():
+            if previous is not None:
+                self.conn.execute("DELETE FROM sessions WHERE id = ?", (previous["session_id"],))
+            session_id = self.conn.execute(
+                "INSERT INTO sessions (title, created_at, updated_at) VALUES (?, ?, ?)",
+                (path.name, mtime, mtime),
+            ).lastrowid
+            self.conn.executemany(
+                "INSERT INTO messages (session_id, role, content, created_at) VALUES (?, ?, ?, ?)",
+                [(session_id, role, content, mtime) for role, content in messages],
+            )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO imported_files (path, mtime, session_id) VALUES (?, ?, ?)",
+                (str(path), mtime, session_id),
+            )
+        return len(messages)
+
+    def reindex(self, paths):
+        """Import every ``.txt`` transcript found under ``paths``.
+
+        Returns ``(files, messages)`` counts of what was (re)imported.
+        """
+        files = messages = 0
+        for root in paths:
+            root = Path(root)
+            candidates = [root] if root.is_file() else sorted(root.rglob("*.txt"))
+            for path in candidates:
+                count = self.import_transcript(path)
+                if count:
+                    files += 1
+                    messages += count
+        return files, messages
+
+
+def main(argv=None):
+    """Command line entry point: ``python -m src.search_index``."""
+    from .config import load_settings
+    from .session_store import SessionStore
+
+    parser = argparse.ArgumentParser(description="Search or reindex saved chats.")
+    parser.add_argument("--db", help="session database (default: <save_path>/chats.db)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    reindex = commands.add_parser("reindex", help="import exported chat_history.txt files")
+    reindex.add_argument("paths", nargs="+", help="transcript files or directories")
+    commands.add_parser("rebuild", help="rebuild the index from stored messages")
+    search = commands.add_parser("search", help="search saved messages")
+    search.add_argument("query")
+    search.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    store = SessionStore(args.db) if args.db else SessionStore.from_config(load_settings())
+    index = SearchIndex(store)
+    try:
+        if args.command == "reindex":
+            files, messages = index.reindex(args.paths)
+            print(f"Imported {messages} messages from {files} files")
+        elif args.command == "rebuild":
+            index.rebuild()
+            print("Index rebuilt")
+        else:
+            for result in index.search(args.query, args.limit):
+                snippet = highlight(result["snippet"], "**", "**").replace("\n", " ")
+                print(f"[{result['session_id']}:{result['id']}] {result['role']}: {snippet}")
+    finally:
+        store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
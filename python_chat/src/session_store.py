@@ -0,0 +1,220 @@
+import sqlite3
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    title TEXT NOT NULL DEFAULT '',
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    session_id INTEGER NOT NULL REFERENCES sessions(id) ON DELETE CASCADE,
+    role TEXT NOT NULL,
+    model TEXT,
+    content TEXT NOT NULL DEFAULT '',
+    created_at REAL NOT NULL,
+    finalized INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS messages_by_session ON messages(session_id, id);
+CREATE TABLE IF NOT EXISTS attachments (
+    message_id INTEGER NOT NULL REFERENCES messages(id) ON DELETE CASCADE,
+    key TEXT NOT NULL,
+    name TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS attachments_by_message ON attachments(message_id);
+"""
+
+
+class SessionStore:
+    """Append-only chat history in SQLite.
+
+    Messages are written one row at a time as they are finalized, and a
+    message that is still streaming is checkpointed in place, so nothing
+    is ever rewritten wholesale. The database runs in WAL mode so appends
+    stay cheap however large the history grows.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.path), isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(SCHEMA)
+
+    @classmethod
+    def from_config(cls, config):
+        """Open the store under the configured ``save_path``."""
+        return cls(Path(config.get("save_path", "saved_chats")) / "chats.db")
+
+    def close(self):
+        self.conn.close()
+
+    @contextmanager
+    def transaction(self):
+        """Group several statements into one atomic write."""
+        self.conn.execute("BEGIN")
+        try:
+            yield self.conn
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    def create_session(self, title=""):
+        """Start a new session and return its id."""
+        now = time.time()
+        cursor = self.conn.execute(
+            "INSERT INTO sessions (title, created_at, updated_at) VALUES (?, ?, ?)",
+            (title, now, now),
+        )
+        return cursor.lastrowid
+
+    def get_session(self, session_id):
+        """Return one session as a dict, or None."""
+        row = self.conn.execute(
+            "SELECT id, title, created_at, updated_at FROM sessions WHERE id = ?", (session_id,)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def rename_session(self, session_id, title):
+        self.conn.execute("UPDATE sessions SET title = ? WHERE id = ?", (title, session_id))
+
+    def latest_session(self):
+        """Return the id of the most recently updated session, or None."""
+        row = self.conn.execute(
+            "SELECT id FROM sessions ORDER BY updated_at DESC, id DESC LIMIT 1"
+        ).fetchone()
+        return row["id"] if row else None
+
+    def list_sessions(self):
+        """Return every session, most recently updated first."""
+        rows = self.conn.execute(
+            "SELECT id, title, created_at, updated_at FROM sessions "
+            "ORDER BY updated_at DESC, id DESC"
+        )
+        return [dict(row) for row in rows]
+
+    def delete_messages(self, session_id):
+        """Remove every message of a session, keeping the session itself."""
+        self.conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+
+    def append_message(self, session_id, role, content, model=None, finalized=True,
+                       attachments=()):
+        """Append a message to a session and return its id.
+
+        ``attachments`` are ``{"key", "name"}`` dicts of images in the
+        attachment cache that were sent with the message.
+        """
+        now = time.time()
+        with self.transaction():
+            cursor = self.conn.execute(
+                "INSERT INTO messages (session_id, role, model, content, created_at, finalized) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (session_id, role, model, content, now, int(finalized)),
+            )
+            self.conn.executemany(
+                "INSERT INTO attachments (message_id, key, name) VALUES (?, ?, ?)",
+                [(cursor.lastrowid, a["key"], a["name"]) for a in attachments],
+            )
+            self.conn.execute(
+                "UPDATE sessions SET updated_at = ? WHERE id = ?", (now, session_id)
+            )
+        return cursor.lastrowid
+
+    def get_attachments(self, message_ids):
+        """Return ``{message id: [attachment key, ...]}`` for messages that have any."""
+        message_ids = list(message_ids)
+        attachments = {}
+        for start in range(0, len(message_ids), 500):
+            batch = message_ids[start:start + 500]
+            rows = self.conn.execute(
+                "SELECT message_id, key FROM attachments "
+                f"WHERE message_id IN ({', '.join('?' * len(batch))}) ORDER BY rowid",
+                batch,
+            )
+            for row in rows:
+                attachments.setdefault(row["message_id"], []).append(row["key"])
+        return attachments
+
+    def checkpoint_message(self, message_id, content):
+        """Save the text streamed so far into a message that is not final yet."""
+        self.conn.execute(
+            "UPDATE messages SET content = ? WHERE id = ? AND finalized = 0",
+            (content, message_id),
+        )
+
+    def finalize_message(self, message_id, content):
+        """Write a streamed message's final text and mark it complete."""
+        self.conn.execute(
+            "UPDATE messages SET content = ?, finalized = 1 WHERE id = ?",
+            (content, message_id),
+        )
+
+    def count_messages(self, session_id):
+        row = self.conn.execute(
+            "SELECT COUNT(*) FROM messages WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return row[0]
+
+    def iter_messages(self, session_id, batch_size=500):
+        """Yield every message of a session, oldest first, ``batch_size`` rows at a time."""
+        after = 0
+        while True:
+            rows = self.conn.execute(
+                "SELECT id, role, model, content, created_at, finalized FROM messages "
+                "WHERE session_id = ? AND id > ? ORDER BY id LIMIT ?",
+                (session_id, after, batch_size),
+            ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield dict(row)
+            after = rows[-1]["id"]
+
+    def load_after(self, after_id, limit=500):
+        """Return up to ``limit`` finalized messages of any session with ids above ``after_id``."""
+        rows = self.conn.execute(
+            "SELECT id, session_id, role, content FROM messages "
+            "WHERE id > ? AND finalized = 1 ORDER BY id LIMIT ?",
+            (after_id, limit),
+        )
+        return [dict(row) for row in rows]
+
+    def get_messages(self, message_ids):
+        """Return the messages with the given ids, in that order; missing ids are skipped."""
+        message_ids = list(message_ids)
+        if not message_ids:
+            return []
+        rows = self.conn.execute(
+            "SELECT id, session_id, role, model, content, created_at FROM messages "
+            f"WHERE id IN ({', '.join('?' * len(message_ids))})",
+            message_ids,
+        )
+        by_id = {row["id"]: dict(row) for row in rows}
+        return [by_id[message_id] for message_id in message_ids if message_id in by_id]
+
+    def load_recent(self, session_id, limit=200, before_id=None):
+        """Return up to ``limit`` messages older than ``before_id``, oldest first.
+
+        Without ``before_id`` this is the tail of the session; pass the id of
+        the oldest loaded message to page further back.
+        """
+        query = (
+            "SELECT id, role, model, content, created_at, finalized FROM messages "
+            "WHERE session_id = ?"
+        )
+        params = [session_id]
+        if before_id is not None:
+            query += " AND id < ?"
+            params.append(before_id)
+        query += " ORDER BY id DESC LIMIT ?"
+        params.append(limit)
+        rows = self.conn.execute(query, params).fetchall()
+        return [dict(row) for row in reversed(rows)]
@@ -0,0 +1,101 @@
+from kivy.metrics import dp
+from kivy.uix.boxlayout import BoxLayout
+from kivy.uix.button import Button
+from kivy.uix.recycleboxlayout import RecycleBoxLayout
+from kivy.uix.recycleview import RecycleView
+from kivy.uix.recycleview.views import RecycleDataViewBehavior
+
+UNTITLED = 'New chat'
+ACTIVE_COLOR = (0.35, 0.55, 0.85, 1)
+INACTIVE_COLOR = (1, 1, 1, 1)
+
+
+def session_label(title, generating=False):
+    """Return the text shown for a session, marked while it is generating."""
+    label = title or UNTITLED
+    return f"{label} ..." if generating else label
+
+
+class SessionRow(RecycleDataViewBehavior, Button):
+    """One saved session in the sidebar; instances are recycled as the list scrolls."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.shorten = True
+        self.halign = 'left'
+        self.session_id = None
+        self.sidebar = None
+        self.bind(size=lambda row, size: setattr(row, 'text_size', (size[0] - dp(12), None)))
+
+    def refresh_view_attrs(self, rv, index, data):
+        self.sidebar = rv
+        self.session_id = data['session_id']
+        self.text = data['text']
+        self.background_color = ACTIVE_COLOR if data['active'] else INACTIVE_COLOR
+        return super().refresh_view_attrs(rv, index, {})
+
+    def on_release(self):
+        self.sidebar.open_session(self.session_id)
+
+
+class SessionSidebar(RecycleView):
+    """Every saved session, newest first; ``on_select(session_id)`` opens one.
+
+    Rows are recycled, so the sidebar costs the same with a thousand saved
+    sessions as with ten.
+    """
+
+    def __init__(self, on_select=None, **kwargs):
+        super().__init__(**kwargs)
+        self.on_select = on_select
+        layout = RecycleBoxLayout(
+            orientation='vertical',
+            size_hint_y=None,
+            default_size=(None, dp(36)),
+            default_size_hint=(1, None),
+            spacing=dp(2)
+        )
+        layout.bind(minimum_height=layout.setter('height'))
+        self.add_widget(layout)
+        self.viewclass = SessionRow
+
+    def set_sessions(self, sessions, active_id=None, generating=()):
+        """Show ``sessions`` from :meth:`SessionStore.list_sessions`."""
+        self.data = [
+            {
+                'session_id': session['id'],
+                'text': session_label(session['title'], session['id'] in generating),
+                'active': session['id'] == active_id,
+            }
+            for session in sessions
+        ]
+
+    def open_session(self, session_id):
+        if self.on_select is not None:
+            self.on_select(session_id)
+
+
+class TabBar(BoxLayout):
+    """The open sessions as tabs; ``on_select`` and ``on_close`` get a session id."""
+
+    def __init__(self, on_select=None, on_close=None, **kwargs):
+        kwargs.setdefault('orientation', 'horizontal')
+        super().__init__(**kwargs)
+        self.on_select = on_select
+        self.on_close = on_close
+
+    def set_tabs(self, tabs, active_id=None):
+        """Show ``tabs``, a list of ``(session_id, title, generating)``."""
+        self.clear_widgets()
+        for session_id, title, generating in tabs:
+            tab = BoxLayout(orientation='horizontal')
+            color = ACTIVE_COLOR if session_id == active_id else INACTIVE_COLOR
+            title_btn = Button(text=session_label(title, generating), shorten=True,
+                               background_color=color)
+            title_btn.bind(size=lambda btn, size: setattr(btn, 'text_size', (size[0] - dp(8), None)))
+            title_btn.bind(on_release=lambda btn, s=session_id: self.on_select(s))
+            close_btn = Button(text='x', size_hint_x=None, width=dp(28), background_color=color)
+            close_btn.bind(on_release=lambda btn, s=session_id: self.on_close(s))
+            tab.add_widget(title_btn)
+            tab.add_widget(close_btn)
+            self.add_widget(tab)
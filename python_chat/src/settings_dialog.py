@@ -1,4 +1,3 @@
-from kivy.app import App
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.button import Button
 from kivy.uix.label import Label
@@ -7,8 +6,9 @@ from kivy.uix.checkbox import CheckBox
 from kivy.uix.popup import Popup
 from kivy.uix.gridlayout import GridLayout
 from kivy.metrics import dp
-import json
-import os
+
+from .config import DEFAULT_CONFIG, load_settings as load_config, save_settings as save_config
+from .settings_store import SettingsError, parse_endpoints
 
 class SettingsDialog(Popup):
     def __init__(self, settings=None, callback=None, **kwargs):
@@ -17,14 +17,9 @@ class SettingsDialog(Popup):
         self.size_hint = (0.8, 0.8)
         self.auto_dismiss = False
         
-        self.default_settings = {
-            "api_endpoint": "http://localhost:11434/api",
-            "api_key": "",
-            "model_name": "llama2",
-            "use_local_model": True
-        }
+        self.default_settings = dialog_values(DEFAULT_CONFIG)
         
-        self.settings = settings if settings else self.default_settings.copy()
+        self.settings = settings if settings else load_settings()
         self.callback = callback
         self._init_ui()
 
@@ -45,7 +40,7 @@ class SettingsDialog(Popup):
             padding=dp(10)
         )
         
-        # API Endpoint
+        # API Endpoint; several hosts may be given, separated by commas
         form.add_widget(Label(
             text="API Endpoint:",
             halign="right",
@@ -138,9 +133,13 @@ class SettingsDialog(Popup):
         }
         
         if self._validate_settings(settings):
-            # Save settings
+            # Save settings; the settings store writes the file in the background
+            try:
+                save_config(config_changes(settings))
+            except SettingsError as e:
+                self._show_error(str(e))
+                return
             self.settings = settings
-            self._save_settings_to_file(settings)
             
             # Call the callback if provided
             if self.callback:
@@ -151,9 +150,15 @@ class SettingsDialog(Popup):
 
     def _validate_settings(self, settings):
         """Validate settings before saving"""
-        if not settings["api_endpoint"]:
+        endpoints = parse_endpoints(settings["api_endpoint"])
+        if not endpoints:
             self._show_error("API Endpoint is required")
             return False
+
+        for endpoint in endpoints:
+            if not endpoint.startswith(("http://", "https://")):
+                self._show_error(f"Invalid API Endpoint: {endpoint}")
+                return False
         
         if not settings["model_name"]:
             self._show_error("Model Name is required")
@@ -175,27 +180,30 @@ class SettingsDialog(Popup):
         )
         error_popup.open()
 
-    def _save_settings_to_file(self, settings):
-        """Save settings to a JSON file"""
-        try:
-            os.makedirs("settings", exist_ok=True)
-            with open("settings/config.json", "w") as f:
-                json.dump(settings, f, indent=4)
-        except Exception as e:
-            print(f"Error saving settings: {e}")
+def dialog_values(config):
+    """Return the dialog fields for the app settings ``config``"""
+    ollama = config.get("ollama", {})
+    hosts = ollama.get("hosts") or [ollama.get("host", "http://localhost:11434")]
+    return {
+        "api_endpoint": ", ".join(hosts),
+        "api_key": ollama.get("api_key", ""),
+        "model_name": config.get("model", ""),
+        "use_local_model": ollama.get("use_local_model", True)
+    }
 
-def load_settings():
-    """Load settings from file or return defaults"""
-    try:
-        if os.path.exists("settings/config.json"):
-            with open("settings/config.json", "r") as f:
-                return json.load(f)
-    except Exception as e:
-        print(f"Error loading settings: {e}")
-    
+def config_changes(values):
+    """Return the app settings changes for the dialog fields ``values``"""
+    hosts = parse_endpoints(values["api_endpoint"])
     return {
-        "api_endpoint": "http://localhost:11434/api",
-        "api_key": "",
-        "model_name": "llama2",
-        "use_local_model": True
+        "model": values["model_name"],
+        "ollama": {
+            "host": hosts[0],
+            "hosts": hosts if len(hosts) > 1 else [],
+            "api_key": values["api_key"],
+            "use_local_model": values["use_local_model"]
+        }
     }
+
+def load_settings():
+    """Return the dialog fields for the saved settings"""
+    return dialog_values(load_config())
@@ -0,0 +1,330 @@
+import copy
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers import Observer
+
+from .config import DEFAULT_CONFIG, SETTINGS_PATH
+
+
+class SettingsError(ValueError):
+    """Raised when settings do not match the schema."""
+
+
+def _url(value):
+    return isinstance(value, str) and value.startswith(("http://", "https://"))
+
+
+def _non_negative(value):
+    return value >= 0
+
+
+# Checks beyond "same type as the default", by dotted path; '*' matches any key
+CONSTRAINTS = {
+    'theme': (lambda value: value in ('light', 'dark'), "must be 'light' or 'dark'"),
+    'ollama.host': (_url, "must be an http(s) URL"),
+    'ollama.hosts': (lambda value: all(_url(host) for host in value), "must be http(s) URLs"),
+    'ollama.timeouts.*': (_non_negative, "must not be negative"),
+    'ollama.connection.*': (_non_negative, "must not be negative"),
+    'context.*': (_non_negative, "must not be negative"),
+    'scheduler.max_per_host': (lambda value: value >= 1, "must be at least 1"),
+    'embeddings.batch_size': (lambda value: value >= 1, "must be at least 1"),
+    'embeddings.nprobe': (lambda value: value >= 1, "must be at least 1"),
+    'workspace.max_memory_mb': (lambda value: value > 0, "must be positive"),
+    'workspace.resident_messages': (lambda value: value >= 1, "must be at least 1"),
+    'warmup.poll_interval': (lambda value: value > 0, "must be positive"),
+    'telemetry.window': (lambda value: value >= 1, "must be at least 1"),
+    'telemetry.prometheus_port': (lambda value: 0 <= value <= 65535, "must be a port number or 0"),
+    'attachments.max_side': (lambda value: value >= 32, "must be at least 32"),
+    'attachments.quality': (lambda value: 1 <= value <= 95, "must be between 1 and 95"),
+    'attachments.thumbnail_size': (lambda value: value >= 16, "must be at least 16"),
+    'attachments.workers': (lambda value: value >= 1, "must be at least 1"),
+    'attachments.cache_entries': (lambda value: value >= 1, "must be at least 1"),
+    'model': (bool, "must not be empty"),
+}
+
+# Keys written by the settings dialog before settings were unified
+LEGACY_KEYS = {
+    'api_endpoint': ('ollama', 'hosts'),
+    'api_key': ('ollama', 'api_key'),
+    'model_name': ('model',),
+    'use_local_model': ('ollama', 'use_local_model'),
+}
+
+
+def parse_endpoints(text):
+    """Split a comma-separated list of API endpoints into host URLs."""
+    hosts = [endpoint.strip().rstrip("/") for endpoint in text.split(",") if endpoint.strip()]
+    # Endpoints may be given as the /api URL rather than the host
+    return [host[:-len("/api")] if host.endswith("/api") else host for host in hosts]
+
+
+def deep_merge(base, overrides):
+    """Return a copy of ``base`` with ``overrides`` merged in, recursing into dicts."""
+    merged = copy.deepcopy(base)
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = deep_merge(merged[key], value)
+        else:
+            merged[key] = copy.deepcopy(value)
+    return merged
+
+
+def validate(settings, defaults=DEFAULT_CONFIG, path=""):
+    """Return a list of ``(dotted path, message)`` schema violations.
+
+    Every value must have the type of its default (any number may replace
+    a number) and pass the CONSTRAINTS for its path. Keys without a
+    default are allowed.
+    """
+    problems = []
+    for key, value in settings.items():
+        dotted = f"{path}{key}"
+        if key not in defaults:
+            continue
+        default = defaults[key]
+        if isinstance(default, dict):
+            if not isinstance(value, dict):
+                problems.append((dotted, "must be a mapping"))
+            else:
+                problems.extend(validate(value, default, dotted + "."))
+            continue
+        numeric = (int, float)
+        if isinstance(default, bool) or not isinstance(default, numeric):
+            ok = isinstance(value, type(default))
+        else:
+            ok = isinstance(value, numeric) and not isinstance(value, bool)
+        if not ok:
+            problems.append((dotted, f"must be {type(default).__name__}"))
+            continue
+        constraint = CONSTRAINTS.get(dotted) or CONSTRAINTS.get(f"{path}*")
+        if constraint is not None and not constraint[0](value):
+            problems.append((dotted, constraint[1]))
+    return problems
+
+
+def migrate_legacy(data):
+    """Move flat settings written by the old settings dialog into their sections."""
+    data = dict(data)
+    for key, path in LEGACY_KEYS.items():
+        if key not in data:
+            continue
+        value = data.pop(key)
+        if key == 'api_endpoint':
+            value = parse_endpoints(value)
+            if len(value) == 1:
+                path, value = ('ollama', 'host'), value[0]
+        section = data
+        for part in path[:-1]:
+            section = section.setdefault(part, {})
+        section.setdefault(path[-1], value)
+    return data
+
+
+def _drop(data, dotted):
+    *parents, last = dotted.split(".")
+    for part in parents:
+        data = data[part]
+    del data[last]
+
+
+class SettingsStore:
+    """The one place settings are read from and written to.
+
+    The file at ``path`` holds only what differs from DEFAULT_CONFIG. It is
+    read once; :meth:`get` returns the cached, merged and validated
+    settings. :meth:`update` applies changes in memory right away and
+    writes the file from a background thread once no change has arrived
+    for ``debounce`` seconds, through a temporary file and a rename so a
+    crash never leaves it half written.
+
+    Edits made to the file by hand are picked up through watchdog and
+    passed to subscribers. ``dispatch`` runs subscriber callbacks; the app
+    hands it a function that moves them onto the UI thread.
+    """
+
+    def __init__(self, path=SETTINGS_PATH, defaults=DEFAULT_CONFIG, debounce=0.5,
+                 dispatch=None, watch=True):
+        self.path = Path(path)
+        self.defaults = defaults
+        self.debounce = debounce
+        self.dispatch = dispatch or (lambda callback: callback())
+        # Values dropped from the file because they broke the schema
+        self.errors = []
+        self._subscribers = []
+        self._lock = threading.Condition()
+        self._pending = None
+        self._deadline = 0
+        self._written = None
+        self._closed = False
+        self._writer = None
+        self._observer = None
+        self._overrides = self._read()
+        self._settings = deep_merge(defaults, self._overrides)
+        if watch:
+            self._start_watching()
+
+    def get(self):
+        """Return the current settings.
+
+        The same dict is returned until settings change; treat it as read-only
+        and use :meth:`update` to change anything.
+        """
+        return self._settings
+
+    def update(self, changes):
+        """Merge ``changes`` (a nested dict) into the settings and save them soon.
+
+        Raises SettingsError, and changes nothing, if the result would not
+        match the schema.
+        """
+        overrides = deep_merge(self._overrides, changes)
+        problems = validate(overrides, self.defaults)
+        if problems:
+            raise SettingsError("; ".join(f"{path} {message}" for path, message in problems))
+        self._overrides = overrides
+        self._settings = deep_merge(self.defaults, overrides)
+        self._save_soon(overrides)
+        self._notify()
+        return self._settings
+
+    def subscribe(self, callback):
+        """Call ``callback(settings)`` after every change; returns an unsubscribe function."""
+        self._subscribers.append(callback)
+        return lambda: self._subscribers.remove(callback)
+
+    def flush(self):
+        """Write any pending change now, on the calling thread."""
+        with self._lock:
+            pending, self._pending = self._pending, None
+        if pending is not None:
+            self._write(pending)
+
+    def close(self):
+        """Stop watching and writing, saving anything still pending."""
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+            self._observer = None
+        with self._lock:
+            self._closed = True
+            self._lock.notify()
+        if self._writer is not None:
+            self._writer.join()
+        self.flush()
+
+    def reload(self):
+        """Re-read the file; subscribers are told if the settings changed."""
+        overrides = self._read()
+        if overrides == self._overrides:
+            return False
+        self._overrides = overrides
+        self._settings = deep_merge(self.defaults, overrides)
+        self._notify()
+        return True
+
+    def _read(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            self.errors = [(str(self.path), str(e))]
+            return {}
+        if not isinstance(data, dict):
+            self.errors = [(str(self.path), "must hold a JSON object")]
+            return {}
+        data = migrate_legacy(data)
+        self.errors = validate(data, self.defaults)
+        for dotted, message in self.errors:
+            # Fall back to the default for anything invalid
+            _drop(data, dotted)
+        return data
+
+    def _notify(self):
+        settings = self._settings
+        for callback in list(self._subscribers):
+            self.dispatch(lambda callback=callback: callback(settings))
+
+    def _save_soon(self, overrides):
+        with self._lock:
+            self._pending = overrides
+            self._deadline = time.monotonic() + self.debounce
+            if self._writer is None:
+                self._writer = threading.Thread(
+                    target=self._write_loop, name="settings-writer", daemon=True
+                )
+                self._writer.start()
+            self._lock.notify()
+
+    def _write_loop(self):
+        while True:
+            with self._lock:
+                while not self._closed:
+                    if self._pending is not None:
+                        delay = self._deadline - time.monotonic()
+                        if delay <= 0:
+                            break
+                        self._lock.wait(delay)
+                    else:
+                        self._lock.wait()
+                if self._closed:
+                    return
+                pending, self._pending = self._pending, None
+            self._write(pending)
+
+    def _write(self, overrides):
+        data = json.dumps(overrides, indent=4, sort_keys=True).encode("utf-8")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(f".{self.path.name}.tmp")
+        with open(tmp, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        self._written = data
+        os.replace(tmp, self.path)
+
+    def _start_watching(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._observer = Observer()
+        self._observer.schedule(_SettingsFileHandler(self), str(self.path.parent))
+        self._observer.daemon = True
+        self._observer.start()
+
+    def _on_file_changed(self):
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return
+        if data == self._written:
+            # Our own write coming back
+            return
+        self.dispatch(self.reload)
+
+
+class _SettingsFileHandler(FileSystemEventHandler):
+    def __init__(self, store):
+        self.store = store
+
+    def on_any_event(self, event):
+        paths = [getattr(event, "src_path", None), getattr(event, "dest_path", None)]
+        if any(p and Path(p).name == self.store.path.name for p in paths):
+            self.store._on_file_changed()
+
+
+_stores = {}
+
+
+def get_settings_store(path=SETTINGS_PATH, **kwargs):
+    """Return the shared store for ``path``, creating it on first use."""
+    key = Path(path).resolve()
+    store = _stores.get(key)
+    if store is None or store._closed:
+        store = _stores[key] = SettingsStore(path, **kwargs)
+    return store
@@ -0,0 +1,48 @@
+import json
+import os
+import time
+
+
+class StartupProbe:
+    """Times the phases of a cold start.
+
+    Marks are seconds since the probe was created, which is when this
+    module is first imported; main.py imports it before anything else.
+    When ``CHATBOX_STARTUP_PROFILE`` names a file, the marks are written
+    there as JSON once the first frame has been drawn.
+    """
+
+    def __init__(self, start=None):
+        self.start = time.perf_counter() if start is None else start
+        self.marks = {}
+
+    def mark(self, name):
+        """Record that phase ``name`` finished now; returns its time."""
+        self.marks[name] = time.perf_counter() - self.start
+        return self.marks[name]
+
+    def on_first_frame(self, callback=None):
+        """Mark ``first_frame`` when the window first flips, then call ``callback``."""
+        from kivy.core.window import Window
+
+        def flipped(*args):
+            Window.unbind(on_flip=flipped)
+            self.mark("first_frame")
+            self.write_report()
+            if callback is not None:
+                callback()
+
+        Window.bind(on_flip=flipped)
+
+    def report(self):
+        return dict(self.marks)
+
+    def write_report(self, path=None):
+        path = path or os.environ.get("CHATBOX_STARTUP_PROFILE")
+        if not path:
+            return
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, indent=2)
+
+
+probe = StartupProbe()
@@ -0,0 +1,302 @@
+import contextvars
+import json
+import time
+from collections import deque
+from pathlib import Path
+
+from .host_pool import percentile
+
+# Fields of Ollama's final stream record kept with each request; durations
+# are in nanoseconds
+SERVER_FIELDS = (
+    "total_duration",
+    "load_duration",
+    "prompt_eval_count",
+    "prompt_eval_duration",
+    "eval_count",
+    "eval_duration",
+)
+
+# Rolling metrics kept per model and host, with their Prometheus help text
+METRICS = {
+    "ttft": ("seconds", "Time from sending a request to its first token"),
+    "gap": ("seconds", "Time between consecutive tokens"),
+    "duration": ("seconds", "Time from sending a request to its last record"),
+    "load": ("seconds", "Time the server spent loading the model"),
+    "prompt_rate": ("tokens_per_second", "Prompt tokens evaluated per second"),
+    "eval_rate": ("tokens_per_second", "Tokens generated per second"),
+}
+
+PERCENTILES = (50, 95, 99)
+
+# What requests started in the current context are for, such as "reply" or
+# "title"; the task a request runs in inherits it from the code that queued it
+request_kind = contextvars.ContextVar("request_kind", default="reply")
+
+
+class RollingSummary:
+    """The last ``window`` samples of a metric, plus the count and sum of all of them."""
+
+    def __init__(self, window=500):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.sum = 0.0
+
+    def add(self, value):
+        self.samples.append(value)
+        self.count += 1
+        self.sum += value
+
+    def percentiles(self):
+        """Return ``{pct: value}`` over the window, or None with no samples."""
+        if not self.samples:
+            return None
+        return {pct: percentile(self.samples, pct) for pct in PERCENTILES}
+
+
+class RequestTrace:
+    """Client-side timing of one streamed request.
+
+    Call :meth:`token` with the text of every record as it arrives and
+    :meth:`finish` once with the final record, if there was one.
+    """
+
+    def __init__(self, telemetry, path, model, host, kind="reply"):
+        self.telemetry = telemetry
+        self.path = path
+        self.model = model
+        self.host = host
+        self.kind = kind
+        self.started = time.perf_counter()
+        self.first = None
+        self.last = None
+        self.tokens = 0
+        self.gaps = []
+
+    def token(self, text):
+        if not text:
+            return
+        now = time.perf_counter()
+        if self.first is None:
+            self.first = now
+        else:
+            self.gaps.append(now - self.last)
+        self.last = now
+        self.tokens += 1
+
+    def rate(self):
+        """Return the tokens per second received so far."""
+        if self.tokens < 2:
+            return 0.0
+        return (self.tokens - 1) / (self.last - self.first)
+
+    def finish(self, final=None, status="ok"):
+        """Record the request as ``ok``, ``error`` or ``cancelled``; returns the record."""
+        gaps = sorted(self.gaps)
+        record = {
+            "time": time.time(),
+            "path": self.path,
+            "kind": self.kind,
+            "model": self.model,
+            "host": self.host,
+            "status": status,
+            "ttft": self.first - self.started if self.first is not None else None,
+            "duration": time.perf_counter() - self.started,
+            "tokens": self.tokens,
+            "gap_p50": percentile(gaps, 50) if gaps else None,
+            "gap_max": gaps[-1] if gaps else None,
+        }
+        for field in SERVER_FIELDS:
+            if final and field in final:
+                record[field] = final[field]
+        return self.telemetry.record(record, self.gaps, self)
+
+
+class Telemetry:
+    """Timing of every generation request, summarized per model and host.
+
+    Each finished request becomes a record with the client-side time to
+    first token and inter-token gaps next to the durations Ollama reports
+    in its final record. The last ``max_records`` records are kept for
+    :meth:`export_jsonl`, and every record is appended to ``jsonl_path``
+    as it finishes when that is set. Rolling windows of ``window`` samples
+    per model and host give the p50/p95/p99 of each metric in
+    :data:`METRICS`; :meth:`prometheus` renders them in the Prometheus
+    text format. ``on_record(record)`` is called after each request.
+    """
+
+    def __init__(self, window=500, gap_window=10000, max_records=1000, jsonl_path=None,
+                 on_record=None):
+        self.window = window
+        # Every token adds a gap, so gaps get a window of their own
+        self.gap_window = gap_window
+        self.records = deque(maxlen=max_records)
+        self.jsonl_path = Path(jsonl_path) if jsonl_path else None
+        self.on_record = on_record
+        self.active = set()
+        self.requests = {}
+        # (model, host) -> {metric: RollingSummary}
+        self._summaries = {}
+        self._jsonl = None
+
+    @classmethod
+    def from_config(cls, config, on_record=None):
+        """Create the telemetry from the ``telemetry`` section of the app config."""
+        telemetry = config.get("telemetry", {})
+        return cls(
+            window=telemetry.get("window", 500),
+            jsonl_path=telemetry.get("jsonl_path") or None,
+            on_record=on_record,
+        )
+
+    def begin(self, path, model, host):
+        """Start timing a request of the current :data:`request_kind`; returns its trace."""
+        trace = RequestTrace(self, path, model, host, request_kind.get())
+        self.active.add(trace)
+        return trace
+
+    def record(self, record, gaps=(), trace=None):
+        """Add a finished request to the records and rolling windows."""
+        self.active.discard(trace)
+        self.records.append(record)
+        key = (record["model"], record["host"])
+        outcome = key + (record["status"],)
+        self.requests[outcome] = self.requests.get(outcome, 0) + 1
+        summaries = self._summaries.get(key)
+        if summaries is None:
+            summaries = self._summaries[key] = {
+                metric: RollingSummary(self.gap_window if metric == "gap" else self.window)
+                for metric in METRICS
+            }
+        for metric, value in derived(record).items():
+            summaries[metric].add(value)
+        for gap in gaps:
+            summaries["gap"].add(gap)
+        if self.jsonl_path is not None:
+            if self._jsonl is None:
+                self.jsonl_path.parent.mkdir(parents=True, exist_ok=True)
+                self._jsonl = open(self.jsonl_path, "a", encoding="utf-8")
+            self._jsonl.write(json.dumps(record) + "\n")
+            self._jsonl.flush()
+        if self.on_record is not None:
+            self.on_record(record)
+        return record
+
+    def live_rate(self, kind=None):
+        """Return the tokens per second being received across requests in flight.
+
+        ``kind`` limits it to requests of that :data:`request_kind`.
+        """
+        return sum(trace.rate() for trace in self.active if kind in (None, trace.kind))
+
+    def percentiles(self, model=None, host=None):
+        """Return ``{metric: {pct: value}}`` over the requests of ``model`` and ``host``.
+
+        Either may be None to combine all of them; metrics without samples
+        are left out.
+        """
+        merged = {}
+        for (m, h), summaries in self._summaries.items():
+            if model not in (None, m) or host not in (None, h):
+                continue
+            for metric, summary in summaries.items():
+                merged.setdefault(metric, []).extend(summary.samples)
+        return {metric: {pct: percentile(values, pct) for pct in PERCENTILES}
+                for metric, values in merged.items() if values}
+
+    def export_jsonl(self, path):
+        """Write the kept records to ``path``, one JSON object per line; returns how many."""
+        records = list(self.records)
+        with open(path, "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+        return len(records)
+
+    def prometheus(self):
+        """Return the metrics in the Prometheus text exposition format."""
+        lines = [
+            "# HELP ollama_chat_requests_total Generation requests by outcome",
+            "# TYPE ollama_chat_requests_total counter",
+        ]
+        for (model, host, status), count in sorted(self.requests.items()):
+            lines.append(f"ollama_chat_requests_total{labels(model, host, status=status)} {count}")
+        for metric, (unit, help_text) in METRICS.items():
+            name = f"ollama_chat_{metric}_{unit}"
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} summary")
+            for (model, host), summaries in sorted(self._summaries.items()):
+                summary = summaries[metric]
+                for pct, value in (summary.percentiles() or {}).items():
+                    lines.append(f"{name}{labels(model, host, quantile=pct / 100)} {value:.6g}")
+                lines.append(f"{name}_count{labels(model, host)} {summary.count}")
+                lines.append(f"{name}_sum{labels(model, host)} {summary.sum:.6g}")
+        return "\n".join(lines) + "\n"
+
+    def close(self):
+        if self._jsonl is not None:
+            self._jsonl.close()
+            self._jsonl = None
+
+
+def derived(record):
+    """Return the :data:`METRICS` samples of one request record, in seconds and tokens/s."""
+    values = {}
+    if record.get("ttft") is not None:
+        values["ttft"] = record["ttft"]
+    if record["status"] == "ok":
+        values["duration"] = record["duration"]
+    if "load_duration" in record:
+        values["load"] = record["load_duration"] / 1e9
+    if record.get("prompt_eval_duration") and "prompt_eval_count" in record:
+        values["prompt_rate"] = record["prompt_eval_count"] / (record["prompt_eval_duration"] / 1e9)
+    if record.get("eval_duration") and "eval_count" in record:
+        values["eval_rate"] = record["eval_count"] / (record["eval_duration"] / 1e9)
+    return values
+
+
+def labels(model, host, **extra):
+    """Return a Prometheus label set such as ``{model="mistral",host="..."}``."""
+    pairs = dict(model=model, host=host, **extra)
+    return "{" + ",".join(f'{key}="{escape(value)}"' for key, value in pairs.items()) + "}"
+
+
+def escape(value):
+    """Escape a Prometheus label value."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class MetricsServer:
+    """Serves ``telemetry.prometheus()`` at ``/metrics`` on a local port."""
+
+    def __init__(self, telemetry, port, host="127.0.0.1"):
+        self.telemetry = telemetry
+        self.port = port
+        self.host = host
+        self._runner = None
+
+    async def start(self):
+        """Start serving on the running event loop; returns the metrics URL."""
+        # aiohttp is imported only when metrics are served, to keep startup light
+        from aiohttp import web
+
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle_metrics)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+        return f"http://{self.host}:{self.port}/metrics"
+
+    async def handle_metrics(self, request):
+        from aiohttp import web
+
+        return web.Response(
+            text=self.telemetry.prometheus(),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+        )
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
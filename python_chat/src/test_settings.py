@@ -4,7 +4,12 @@ from kivy.uix.button import Button
 from kivy.uix.label import Label
 from kivy.uix.scrollview import ScrollView
 from kivy.core.window import Window
-from settings_dialog import SettingsDialog, load_settings
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.settings_dialog import SettingsDialog, load_settings
 
 class TestSettingsApp(App):
     """Test application demonstrating the settings dialog usage"""
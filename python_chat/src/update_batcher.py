@@ -0,0 +1,36 @@
+from kivy.clock import Clock
+
+
+class UpdateBatcher:
+    """Coalesce streamed text deltas into at most one UI update per frame.
+
+    Deltas are buffered per key (usually a message index) and handed to
+    ``on_flush`` as one ``{key: text}`` dict on the next frame, or after
+    ``interval`` seconds when it is non-zero. However fast tokens arrive,
+    the widget tree is touched at most once per flush.
+    """
+
+    def __init__(self, on_flush, interval=0):
+        self.on_flush = on_flush
+        self.interval = interval
+        self._pending = {}
+        self._trigger = Clock.create_trigger(self.flush, interval)
+
+    def push(self, key, delta):
+        """Buffer ``delta`` for ``key`` and schedule a flush."""
+        if not delta:
+            return
+        self._pending.setdefault(key, []).append(delta)
+        self._trigger()
+
+    def flush(self, *args):
+        """Hand every buffered delta to ``on_flush`` now."""
+        self._trigger.cancel()
+        pending, self._pending = self._pending, {}
+        if pending:
+            self.on_flush({key: "".join(parts) for key, parts in pending.items()})
+
+    def discard(self):
+        """Drop buffered deltas without flushing them."""
+        self._trigger.cancel()
+        self._pending = {}
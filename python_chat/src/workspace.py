@@ -0,0 +1,256 @@
+import time
+from collections import OrderedDict
+
+from .message_model import Message, MessageBodies
+
+# Bytes counted for each message record on top of its body: the slotted
+# Message with its id, timestamp and row height
+RECORD_OVERHEAD = 160
+
+
+def records_from_rows(rows, attachments=None):
+    """Return MessageList records for messages loaded from the session store.
+
+    ``attachments`` maps message ids to their attachment keys, as returned
+    by :meth:`SessionStore.get_attachments`.
+    """
+    attachments = attachments or {}
+    return [
+        Message(row["role"], row["content"], id=row["id"], model=row["model"],
+                created_at=row["created_at"], attachments=attachments.get(row["id"]))
+        for row in rows
+    ]
+
+
+class ChatSession:
+    """One open chat: its message model and any generation streaming into it.
+
+    While the session is shown its records live in the MessageList ``view``;
+    otherwise in ``records``, with no widgets at all. Messages are addressed
+    by key, as with :meth:`MessageList.append_message`, whether the session
+    is shown or not, so a reply keeps streaming into a session in the
+    background.
+
+    Saved messages are attached to ``bodies``, which keeps only the most
+    recently used message bodies in memory.
+    """
+
+    def __init__(self, session_id, title="", bodies=None):
+        self.session_id = session_id
+        self.title = title
+        self.bodies = bodies
+        self.records = []
+        # Records prepended above key 0
+        self.offset = 0
+        self.scroll_y = 0
+        self.view = None
+        self.has_older_history = False
+        self.paged_out = False
+        self.generation_task = None
+        # (message id, streamed parts) while a reply is being generated
+        self.streaming = None
+        self.last_used = time.monotonic()
+
+    @property
+    def data(self):
+        """The message records, oldest first."""
+        return self.view.data if self.view is not None else self.records
+
+    def is_generating(self):
+        return self.generation_task is not None and not self.generation_task.done()
+
+    def append(self, role, text, **fields):
+        """Append a message record and return its key."""
+        if self.view is not None:
+            return self.view.append_message(role, text, **fields)
+        self.records.append(Message(role, text, **fields))
+        return len(self.records) - 1 - self.offset
+
+    def extend(self, key, delta):
+        """Append ``delta`` to the text of the message with ``key``."""
+        if self.view is not None:
+            self.view.extend_message(key, delta)
+        else:
+            self.records[key + self.offset]["text"] += delta
+
+    def get(self, key):
+        """Return the record of the message with ``key``."""
+        if self.view is not None:
+            return self.view.get_message(key)
+        return self.records[key + self.offset]
+
+    def mark_saved(self, record):
+        """Let the body of ``record`` be paged out; it is final in the session store."""
+        if self.bodies is not None:
+            self.bodies.attach(record)
+
+    def prepend(self, records):
+        """Insert older records above the current ones."""
+        self._attach(records)
+        if self.view is not None:
+            self.view.prepend_messages(records)
+        else:
+            self.records[0:0] = records
+            self.offset += len(records)
+
+    def replace(self, records, has_older_history=False):
+        """Replace every record, for example with a page reloaded from the store."""
+        self.has_older_history = has_older_history
+        self.paged_out = False
+        self._forget()
+        self._attach(records)
+        if self.view is not None:
+            self.view.load_records(records)
+            self.view.scroll_to_bottom()
+        else:
+            self.records = records
+            self.offset = 0
+            self.scroll_y = 0
+
+    def show(self, view):
+        """Hand the records to ``view``, which builds rows for the visible ones."""
+        view.load_records(self.records, self.offset, self.scroll_y)
+        self.view = view
+        self.records = []
+        self.last_used = time.monotonic()
+
+    def hide(self):
+        """Take the records back from the view, leaving it empty for another session."""
+        view, self.view = self.view, None
+        self.scroll_y = view.scroll_y
+        self.records, self.offset = view.unload_records()
+        self.last_used = time.monotonic()
+
+    def page_out(self):
+        """Drop the records; they are reloaded from the session store when shown again."""
+        self._forget()
+        self.records = []
+        self.offset = 0
+        self.scroll_y = 0
+        self.has_older_history = False
+        self.paged_out = True
+
+    def memory(self):
+        """Return an estimate of the bytes the records and their resident bodies take."""
+        return sum(record.memory() + RECORD_OVERHEAD for record in self.data)
+
+    def _attach(self, records):
+        if self.bodies is not None:
+            for record in records:
+                if record.id is not None:
+                    self.bodies.attach(record)
+
+    def _forget(self):
+        if self.bodies is not None:
+            self.bodies.forget(self.data)
+
+
+class Workspace:
+    """The open chat sessions, in tab order, and the one that is shown.
+
+    Only the shown session has widgets. The others keep just their records,
+    and once all open sessions together hold more than ``max_bytes`` of
+    them, the least recently shown idle ones are paged out: their records
+    are dropped and the latest page is read back from the session store
+    when they are shown again. Messages are saved as they are finalized,
+    so nothing is lost; a session that is generating is never paged out.
+
+    Within the open sessions, at most ``resident_messages`` saved message
+    bodies are kept in memory; see :class:`MessageBodies`.
+    """
+
+    def __init__(self, store, page_size=200, max_bytes=64 * 2**20, resident_messages=2000):
+        self.store = store
+        self.page_size = page_size
+        self.max_bytes = max_bytes
+        self.bodies = MessageBodies(self.load_bodies, resident_messages)
+        self.sessions = OrderedDict()
+        self.active = None
+        self.stats = {"paged_out": 0, "paged_in": 0}
+
+    @classmethod
+    def from_config(cls, store, config):
+        """Create a workspace from the ``storage`` and ``workspace`` settings."""
+        workspace = cls(store)
+        workspace.configure(config)
+        return workspace
+
+    def configure(self, config):
+        """Apply the ``storage`` and ``workspace`` settings of the app config."""
+        self.page_size = config.get("storage", {}).get("history_page_size", 200)
+        workspace = config.get("workspace", {})
+        self.max_bytes = int(workspace.get("max_memory_mb", 64) * 2**20)
+        self.bodies.max_resident = workspace.get("resident_messages", 2000)
+        self.enforce()
+
+    def load_bodies(self, message_ids):
+        """Return ``{id: text}`` for saved messages whose bodies were paged out."""
+        return {row["id"]: row["content"] for row in self.store.get_messages(message_ids)}
+
+    def __contains__(self, session_id):
+        return session_id in self.sessions
+
+    def open(self, session_id):
+        """Return the open session ``session_id``, opening it from the store if needed."""
+        session = self.sessions.get(session_id)
+        if session is None:
+            row = self.store.get_session(session_id)
+            session = ChatSession(session_id, row["title"] if row else "", self.bodies)
+            self.sessions[session_id] = session
+            self.load(session)
+        return session
+
+    def load(self, session):
+        """Replace the records of ``session`` with its latest page from the store."""
+        rows = self.store.load_recent(session.session_id, self.page_size)
+        session.replace(self.records(rows), len(rows) == self.page_size)
+
+    def records(self, rows):
+        """Return the records for rows of the session store, with their attachments."""
+        return records_from_rows(rows, self.store.get_attachments(row["id"] for row in rows))
+
+    def show(self, session_id, view):
+        """Show ``session_id`` in ``view`` instead of the current session; returns it."""
+        session = self.open(session_id)
+        if session is not self.active:
+            if self.active is not None:
+                self.active.hide()
+            if session.paged_out:
+                self.load(session)
+                self.stats["paged_in"] += 1
+            session.show(view)
+            self.active = session
+        self.enforce()
+        return session
+
+    def close(self, session_id):
+        """Close the tab of ``session_id``; returns the session, or None if it was not open."""
+        session = self.sessions.pop(session_id, None)
+        if session is not None and session is self.active:
+            session.hide()
+            self.active = None
+        if session is not None:
+            self.bodies.forget(session.data)
+        return session
+
+    def memory(self):
+        """Return the estimated bytes of records held by open sessions."""
+        return sum(session.memory() for session in self.sessions.values())
+
+    def enforce(self):
+        """Page out the least recently shown idle sessions until under ``max_bytes``."""
+        total = self.memory()
+        if total <= self.max_bytes:
+            return
+        idle = sorted(
+            (s for s in self.sessions.values()
+             if s is not self.active and not s.paged_out and s.streaming is None
+             and not s.is_generating()),
+            key=lambda s: s.last_used,
+        )
+        for session in idle:
+            if total <= self.max_bytes:
+                break
+            total -= session.memory()
+            session.page_out()
+            self.stats["paged_out"] += 1
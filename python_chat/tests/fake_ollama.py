@@ -0,0 +1,264 @@
+"""Local stand-in for an Ollama server, for tests and benchmarks.
+
+Implements enough of the API for OllamaClient: /api/version, /api/tags,
+/api/show, /api/ps, /api/generate, /api/chat, /api/embed and /api/embeddings,
+with a configurable token rate, first-token delay, jitter and error injection. It can also run on its own:
+
+    python tests/fake_ollama.py --port 11434 --token-rate 50
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+import zlib
+
+from aiohttp import web
+
+DEFAULT_MODELS = [
+    {"name": "mistral", "digest": "sha256:mistral", "size": 4109865159,
+     "details": {"family": "llama", "parameter_size": "7B", "quantization_level": "Q4_0"},
+     "context_length": 32768},
+    {"name": "llama2", "digest": "sha256:llama2", "size": 3826793677,
+     "details": {"family": "llama", "parameter_size": "7B", "quantization_level": "Q4_0"},
+     "context_length": 4096},
+]
+
+EMBEDDING_DIM = 64
+
+
+def embed(text, dim=EMBEDDING_DIM):
+    """Return a bag-of-words vector, so texts sharing words are similar."""
+    vector = [0.0] * dim
+    for word in re.findall(r"\w+", text.lower()):
+        vector[zlib.crc32(word.encode()) % dim] += 1.0
+    return vector
+
+
+class FakeOllama:
+    """Configurable fake Ollama HTTP server.
+
+    ``token_rate`` is tokens per second per stream (0 streams as fast as
+    possible), ``first_token_delay`` is the simulated prefill time,
+    ``jitter`` is the relative random variation applied to every delay and
+    ``error_rate`` is the fraction of generation requests that fail with a
+    500. ``num_tokens`` is the reply length unless the request sets
+    ``options.num_predict``. ``load_delay`` is how long a generate request
+    with no prompt takes to load a model.
+    """
+
+    def __init__(self, models=None, token_rate=0, first_token_delay=0.0, jitter=0.0,
+                 error_rate=0.0, num_tokens=20, seed=None):
+        self.models = models if models is not None else [dict(m) for m in DEFAULT_MODELS]
+        self.token_rate = token_rate
+        self.first_token_delay = first_token_delay
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.num_tokens = num_tokens
+        self.random = random.Random(seed)
+        self.requests = []
+        self.active = 0
+        self.max_active = 0
+        self.cancelled = 0
+        # False to behave like servers that predate the batched /api/embed
+        self.batch_embeddings = True
+        self.load_delay = 0.0
+        # Loaded model name -> the keep_alive it was last used with
+        self.loaded = {}
+        self.app = web.Application()
+        self.app.router.add_get("/api/version", self.handle_version)
+        self.app.router.add_get("/api/tags", self.handle_tags)
+        self.app.router.add_post("/api/show", self.handle_show)
+        self.app.router.add_get("/api/ps", self.handle_ps)
+        self.app.router.add_post("/api/generate", self.handle_generate)
+        self.app.router.add_post("/api/chat", self.handle_chat)
+        self.app.router.add_post("/api/embed", self.handle_embed)
+        self.app.router.add_post("/api/embeddings", self.handle_embeddings)
+        self._runner = None
+        self.url = None
+
+    async def start(self, host="127.0.0.1", port=0):
+        """Start serving; returns the base URL."""
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        self.url = f"http://{host}:{port}"
+        return self.url
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def _installed(self, model):
+        """Return True if ``model`` is listed, with or without its ``:latest`` tag."""
+        names = {m["name"] for m in self.models}
+        return model in names or f"{model}:latest" in names
+
+    def _delay(self, seconds):
+        if self.jitter:
+            seconds *= 1 + self.random.uniform(-self.jitter, self.jitter)
+        return max(seconds, 0)
+
+    async def handle_version(self, request):
+        return web.json_response({"version": "0.0.0-fake"})
+
+    async def handle_tags(self, request):
+        self.requests.append(("/api/tags", None))
+        models = [{k: v for k, v in m.items() if k != "context_length"} for m in self.models]
+        return web.json_response({"models": models})
+
+    async def handle_show(self, request):
+        body = await request.json()
+        self.requests.append(("/api/show", body))
+        for model in self.models:
+            if model["name"] == body.get("model"):
+                return web.json_response({
+                    "details": model.get("details", {}),
+                    "model_info": {"llama.context_length": model.get("context_length", 2048)},
+                    "parameters": "",
+                })
+        return web.json_response({"error": f"model '{body.get('model')}' not found"}, status=404)
+
+    async def handle_ps(self, request):
+        self.requests.append(("/api/ps", None))
+        sizes = {m["name"]: m.get("size", 0) for m in self.models}
+        models = []
+        for name, keep_alive in self.loaded.items():
+            # Ollama reports a model kept forever as expiring in the far future
+            expires = "2318-01-01T00:00:00Z" if keep_alive == -1 else "2030-01-01T00:00:00Z"
+            models.append({"name": f"{name}:latest", "model": f"{name}:latest",
+                           "size": sizes[name], "size_vram": sizes[name], "expires_at": expires})
+        return web.json_response({"models": models})
+
+    async def handle_generate(self, request):
+        body = await request.json()
+        if not body.get("prompt") and "context" not in body:
+            return await self._load(body)
+        return await self._stream(request, "/api/generate", body, lambda token: {"response": token})
+
+    async def handle_chat(self, request):
+        body = await request.json()
+        return await self._stream(
+            request, "/api/chat", body,
+            lambda token: {"message": {"role": "assistant", "content": token}},
+        )
+
+    async def handle_embed(self, request):
+        body = await request.json()
+        self.requests.append(("/api/embed", body))
+        if not self.batch_embeddings:
+            raise web.HTTPNotFound()
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        return web.json_response({"model": body["model"], "embeddings": [embed(text) for text in inputs]})
+
+    async def handle_embeddings(self, request):
+        body = await request.json()
+        self.requests.append(("/api/embeddings", body))
+        return web.json_response({"embedding": embed(body["prompt"])})
+
+    async def _load(self, body):
+        """A generate request with no prompt only loads, or with keep_alive 0 unloads, the model."""
+        self.requests.append(("/api/generate", body))
+        model = body.get("model")
+        if not self._installed(model):
+            return web.json_response({"error": f"model '{model}' not found"}, status=404)
+        if body.get("keep_alive") == 0:
+            self.loaded.pop(model, None)
+            reason = "unload"
+        else:
+            await asyncio.sleep(self._delay(self.load_delay))
+            self.loaded[model] = body.get("keep_alive")
+            reason = "load"
+        return web.json_response({"model": model, "response": "", "done": True, "done_reason": reason})
+
+    async def _stream(self, request, path, body, make_record):
+        self.requests.append((path, body))
+        if not self._installed(body.get("model")):
+            return web.json_response({"error": f"model '{body.get('model')}' not found"}, status=404)
+        if self.error_rate and self.random.random() < self.error_rate:
+            return web.json_response({"error": "injected failure"}, status=500)
+        self.loaded[body["model"]] = body.get("keep_alive")
+
+        count = body.get("options", {}).get("num_predict") or self.num_tokens
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await response.prepare(request)
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        started = time.perf_counter_ns()
+        try:
+            await asyncio.sleep(self._delay(self.first_token_delay))
+            prefilled = time.perf_counter_ns()
+            for i in range(count):
+                if i and self.token_rate:
+                    await asyncio.sleep(self._delay(1 / self.token_rate))
+                record = dict(make_record(f"tok{i} "), model=body["model"], done=False)
+                await response.write(json.dumps(record).encode() + b"\n")
+            finished = time.perf_counter_ns()
+            prompt_tokens = len(json.dumps(body.get("messages") or body.get("prompt", ""))) // 4
+            final = dict(
+                make_record(""),
+                model=body["model"],
+                done=True,
+                total_duration=finished - started,
+                load_duration=0,
+                prompt_eval_count=prompt_tokens,
+                prompt_eval_duration=prefilled - started,
+                eval_count=count,
+                eval_duration=finished - prefilled,
+            )
+            if path == "/api/generate":
+                # The conversation so far: the context sent, then this turn
+                final["context"] = list(body.get("context") or []) + list(range(prompt_tokens + count))
+            await response.write(json.dumps(final).encode() + b"\n")
+            await response.write_eof()
+        except ConnectionResetError:
+            # The client went away mid-stream
+            self.cancelled += 1
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        finally:
+            self.active -= 1
+        return response
+
+
+async def _serve(args):
+    server = FakeOllama(
+        token_rate=args.token_rate,
+        first_token_delay=args.first_token_delay,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        num_tokens=args.num_tokens,
+    )
+    url = await server.start(args.host, args.port)
+    print(f"Fake Ollama listening on {url}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--token-rate", type=float, default=50)
+    parser.add_argument("--first-token-delay", type=float, default=0.2)
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--num-tokens", type=int, default=100)
+    try:
+        asyncio.run(_serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,124 @@
+import pytest
+import pytest_asyncio
+import asyncio
+import base64
+import io
+import os
+import sys
+
+from PIL import Image
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.attachments import AttachmentPipeline, prepare_image
+from src.session_store import SessionStore
+
+
+def photo(path, size=(4000, 3000), color=(200, 30, 30)):
+    Image.new('RGB', size, color).save(path, 'JPEG')
+    return path
+
+
+@pytest_asyncio.fixture
+async def pipeline(tmp_path):
+    pipeline = AttachmentPipeline(tmp_path / 'cache', max_side=672, workers=2)
+    yield pipeline
+    pipeline.close()
+
+
+class TestPrepareImage:
+    def test_downscales_and_writes_thumbnail(self, tmp_path):
+        """Test a large photo is fitted in max_side, re-encoded as JPEG and thumbnailed."""
+        result = prepare_image(str(photo(tmp_path / 'big.jpg')), tmp_path / 'out.jpg',
+                               tmp_path / 'thumb.png', 672, 85, 96)
+        assert (result['width'], result['height']) == (672, 504)
+        with Image.open(io.BytesIO(base64.b64decode(result['image']))) as image:
+            assert image.format == 'JPEG' and image.size == (672, 504)
+        with Image.open(tmp_path / 'thumb.png') as thumbnail:
+            assert max(thumbnail.size) == 96
+
+
+class TestAttachmentPipeline:
+    @pytest.mark.asyncio
+    async def test_same_image_is_processed_once(self, tmp_path, pipeline):
+        """Test re-attaching an image, or a copy of it, comes from the content-addressed cache."""
+        first = photo(tmp_path / 'a.jpg')
+        copy = tmp_path / 'copy.jpg'
+        copy.write_bytes(first.read_bytes())
+        attachment = await pipeline.prepare(first)
+        again = await pipeline.prepare(copy)
+        assert attachment['key'] == again['key'] and again['name'] == 'copy.jpg'
+        assert os.path.exists(attachment['thumbnail'])
+        assert pipeline.stats == {'memory_hits': 1, 'disk_hits': 0, 'processed': 1}
+
+    @pytest.mark.asyncio
+    async def test_cache_survives_restart(self, tmp_path, pipeline):
+        """Test a new pipeline finds images prepared by an earlier one on disk."""
+        attachment = await pipeline.prepare(photo(tmp_path / 'a.jpg'))
+        later = AttachmentPipeline(tmp_path / 'cache', max_side=672)
+        try:
+            assert (await later.prepare(tmp_path / 'a.jpg'))['image'] == attachment['image']
+            assert later.stats['disk_hits'] == 1 and later.stats['processed'] == 0
+            assert await later.images([attachment['key'], 'missing']) == [attachment['image']]
+        finally:
+            later.close()
+
+    @pytest.mark.asyncio
+    async def test_batch_with_a_bad_file(self, tmp_path, pipeline):
+        """Test a batch attaches every readable image and reports the others."""
+        (tmp_path / 'notes.jpg').write_text('not an image')
+        paths = [photo(tmp_path / 'a.jpg'), photo(tmp_path / 'b.jpg', color=(0, 0, 255)),
+                 tmp_path / 'notes.jpg', tmp_path / 'gone.png']
+        attachments, errors = await pipeline.prepare_many(paths)
+        assert [a['name'] for a in attachments] == ['a.jpg', 'b.jpg']
+        assert len(errors) == 2 and 'notes.jpg' in errors[0] and 'gone.png' in errors[1]
+
+    @pytest.mark.asyncio
+    async def test_thumbnail_size_is_part_of_the_key(self, tmp_path, pipeline):
+        """Test changing the thumbnail size makes new thumbnails instead of reusing old ones."""
+        path = photo(tmp_path / 'a.jpg')
+        small = await pipeline.prepare(path)
+        larger = AttachmentPipeline(tmp_path / 'cache', max_side=672, thumbnail_size=48)
+        try:
+            attachment = await larger.prepare(path)
+            assert attachment['key'] != small['key'] and larger.stats['processed'] == 1
+            with Image.open(attachment['thumbnail']) as thumbnail:
+                assert max(thumbnail.size) == 48
+        finally:
+            larger.close()
+
+    @pytest.mark.asyncio
+    async def test_unwritable_cache_is_reported(self, tmp_path):
+        """Test a cache that cannot be written to fails the attachment with a message."""
+        (tmp_path / 'cache').write_text('a file where the cache directory should be')
+        pipeline = AttachmentPipeline(tmp_path / 'cache', workers=1)
+        try:
+            attachments, errors = await pipeline.prepare_many([photo(tmp_path / 'a.jpg')])
+            assert attachments == [] and len(errors) == 1 and 'Cannot save a.jpg' in errors[0]
+        finally:
+            pipeline.close()
+
+    @pytest.mark.asyncio
+    async def test_concurrent_attaches_share_the_work(self, tmp_path, pipeline):
+        """Test the same image attached twice at once is processed once."""
+        path = photo(tmp_path / 'a.jpg')
+        await asyncio.gather(pipeline.prepare(path), pipeline.prepare(path))
+        assert pipeline.stats['processed'] == 1
+
+
+class TestStoredAttachments:
+    def test_attachments_are_saved_with_the_message(self, tmp_path):
+        """Test attachment keys are stored per message and removed with it."""
+        store = SessionStore(tmp_path / 'chats.db')
+        try:
+            session = store.create_session()
+            message_id = store.append_message(
+                session, 'user', 'What is this?',
+                attachments=[{'key': 'k1', 'name': 'a.jpg'}, {'key': 'k2', 'name': 'b.jpg'}]
+            )
+            other = store.append_message(session, 'assistant', 'A cat')
+            assert store.get_attachments([message_id, other]) == {message_id: ['k1', 'k2']}
+            store.delete_messages(session)
+            assert store.get_attachments([message_id]) == {}
+        finally:
+            store.close()
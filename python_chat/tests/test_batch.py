@@ -0,0 +1,210 @@
+import pytest
+import pytest_asyncio
+import argparse
+import asyncio
+import io
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src import batch
+from src.batch import BatchRunner, InvalidJob, load_done, parse_prompt, trim_partial_line
+from src.ollama_client import OllamaClient
+from tests.fake_ollama import FakeOllama
+
+
+@pytest_asyncio.fixture
+async def fake():
+    server = FakeOllama(seed=0)
+    await server.start()
+    yield server
+    await server.close()
+
+
+@pytest_asyncio.fixture
+async def client(fake):
+    client = OllamaClient(host=fake.url)
+    yield client
+    await client.close()
+
+
+def prompts(*jobs):
+    return io.StringIO("".join(json.dumps(job) + "\n" for job in jobs))
+
+
+def results(out):
+    return [json.loads(line) for line in out.getvalue().splitlines()]
+
+
+class TestParsing:
+    def test_parse_prompt(self):
+        """Test JSON jobs keep their fields and plain lines become prompts."""
+        assert parse_prompt('{"id": "a", "prompt": "hi"}\n', 0) == {'id': 'a', 'prompt': 'hi', 'index': 0}
+        assert parse_prompt('Why is the sky blue?\n', 4) == {
+            'prompt': 'Why is the sky blue?', 'id': 5, 'index': 4}
+        assert parse_prompt('  \n', 1) is None
+        with pytest.raises(InvalidJob) as error:
+            parse_prompt('{"model": "mistral"}', 2)
+        assert error.value.job_id == 3
+        with pytest.raises(InvalidJob):
+            parse_prompt('{"prompt": "hi", "options": [1]}', 3)
+
+    def test_load_done_ignores_failures_and_torn_lines(self, tmp_path):
+        """Test resuming skips only jobs that succeeded."""
+        path = tmp_path / 'out.jsonl'
+        path.write_text('{"id": 1, "ok": true}\n{"id": 2, "ok": false}\n{"id": 3, "o')
+        assert load_done(path) == {1}
+        assert load_done(tmp_path / 'missing.jsonl') == set()
+
+    def test_trim_partial_line(self, tmp_path):
+        """Test a torn last line is cut off and complete files are left alone."""
+        path = tmp_path / 'out.jsonl'
+        path.write_text('{"id": 1, "ok": true}\n{"id": 2, "o')
+        trim_partial_line(path)
+        assert path.read_text() == '{"id": 1, "ok": true}\n'
+        trim_partial_line(path)
+        assert path.read_text() == '{"id": 1, "ok": true}\n'
+        path.write_text('{"id": 1')
+        trim_partial_line(path)
+        assert path.read_text() == ''
+        trim_partial_line(tmp_path / 'missing.jsonl')
+
+
+class TestBatchRunner:
+    @pytest.mark.asyncio
+    async def test_concurrency_is_bounded(self, fake, client):
+        """Test no more than ``concurrency`` requests are in flight."""
+        fake.token_rate = 200
+        out = io.StringIO()
+        runner = BatchRunner(client, 'mistral', concurrency=3)
+        summary = await runner.run(prompts(*({'prompt': f'p{i}'} for i in range(9))), out)
+        assert fake.max_active == 3
+        assert summary['ok'] == 9 and summary['failed'] == 0
+        assert summary['tokens_per_s'] > 0
+        assert summary['latency_p50'] <= summary['latency_p99']
+        assert sorted(r['id'] for r in results(out)) == list(range(1, 10))
+
+    @pytest.mark.asyncio
+    async def test_results_stream_as_they_finish(self, client):
+        """Test a quick job is written before a slow one started earlier."""
+        out = io.StringIO()
+        jobs = prompts({'id': 'slow', 'prompt': 'x', 'options': {'num_predict': 400}},
+                       {'id': 'fast', 'prompt': 'x', 'options': {'num_predict': 1}})
+        runner = BatchRunner(client, 'mistral', concurrency=2)
+        await runner.run(jobs, out)
+        assert [r['id'] for r in results(out)] == ['fast', 'slow']
+
+    @pytest.mark.asyncio
+    async def test_ordered_output(self, client):
+        """Test --ordered holds results back until earlier lines are written."""
+        out = io.StringIO()
+        jobs = prompts({'id': 'slow', 'prompt': 'x', 'options': {'num_predict': 400}},
+                       {'id': 'fast', 'prompt': 'x', 'options': {'num_predict': 1}})
+        await BatchRunner(client, 'mistral', concurrency=2, ordered=True).run(jobs, out)
+        assert [r['id'] for r in results(out)] == ['slow', 'fast']
+
+    @pytest.mark.asyncio
+    async def test_retries(self, fake, client):
+        """Test failed requests are retried and a job that keeps failing is reported."""
+        fake.error_rate = 1.0
+        out = io.StringIO()
+        runner = BatchRunner(client, 'mistral', retries=2, backoff=0)
+        summary = await runner.run(prompts({'id': 1, 'prompt': 'x'}), out)
+        [result] = results(out)
+        assert result['ok'] is False and result['attempts'] == 3
+        assert 'injected failure' in result['error']
+        assert summary['failed'] == 1
+
+        fake.error_rate = 0.5
+        out = io.StringIO()
+        runner = BatchRunner(client, 'mistral', retries=10, backoff=0)
+        summary = await runner.run(prompts(*({'prompt': f'p{i}'} for i in range(6))), out)
+        assert summary['ok'] == 6
+        assert max(r['attempts'] for r in results(out)) > 1
+
+    @pytest.mark.asyncio
+    async def test_client_errors_are_not_retried(self, fake, client):
+        """Test a request the server rejects, such as an unknown model, fails at once."""
+        out = io.StringIO()
+        runner = BatchRunner(client, 'mistral', retries=3, backoff=10)
+        summary = await runner.run(prompts({'id': 1, 'model': 'missing', 'prompt': 'x'}), out)
+        [result] = results(out)
+        assert result['ok'] is False and result['attempts'] == 1
+        assert 'not found' in result['error']
+        assert summary['failed'] == 1
+
+    @pytest.mark.asyncio
+    async def test_invalid_jobs_are_reported(self, client):
+        """Test a JSON line that is not a job fails alone, in order, and the run goes on."""
+        out = io.StringIO()
+        jobs = prompts({'id': 'a', 'prompt': 'x', 'options': {'num_predict': 50}},
+                       {'id': 3}, {'id': 'c', 'prompt': 'x', 'options': None},
+                       {'id': 'd', 'prompt': 'x', 'options': 'fast'})
+        summary = await BatchRunner(client, 'mistral', concurrency=2, ordered=True).run(jobs, out)
+        assert [(r['id'], r['ok']) for r in results(out)] == [
+            ('a', True), (3, False), ('c', True), ('d', False)]
+        assert "needs 'prompt' or 'messages'" in results(out)[1]['error']
+        assert "'options' must be an object" in results(out)[3]['error']
+        assert summary['ok'] == 2 and summary['failed'] == 2
+
+    @pytest.mark.asyncio
+    async def test_chat_jobs(self, fake, client):
+        """Test jobs with ``messages`` go to /api/chat with their own model."""
+        out = io.StringIO()
+        job = {'id': 1, 'model': 'llama2', 'messages': [{'role': 'user', 'content': 'hi'}]}
+        await BatchRunner(client, 'mistral').run(prompts(job), out)
+        assert results(out)[0]['model'] == 'llama2'
+        assert fake.requests[-1][0] == '/api/chat'
+
+
+class TestCommandLine:
+    @pytest.mark.asyncio
+    async def test_configured_parameters_are_sent(self, fake, tmp_path):
+        """Test ``ollama.parameters`` from the config reach every batch request."""
+        source = tmp_path / 'prompts.jsonl'
+        source.write_text('first\n{"prompt": "second", "options": {"temperature": 0.9}}\n')
+        args = argparse.Namespace(input=str(source), output=str(tmp_path / 'out.jsonl'),
+                                  model='mistral', host=fake.url, concurrency=1, retries=0,
+                                  backoff=0, ordered=True, resume=False)
+        config = {'ollama': {'parameters': {'temperature': 0.2, 'num_ctx': 4096}}}
+        summary = await batch.run_batch(args, config)
+        assert summary['ok'] == 2
+        options = [body['options'] for path, body in fake.requests]
+        assert options == [{'temperature': 0.2, 'num_ctx': 4096},
+                           {'temperature': 0.9, 'num_ctx': 4096}]
+
+    def test_resume(self, tmp_path, monkeypatch, capsys):
+        """Test a resumed run appends only the jobs that had not succeeded, after the last whole line."""
+        monkeypatch.setattr(batch.OllamaClient, 'from_config',
+                            classmethod(lambda cls, config: OllamaClient(host=config['ollama']['host'])))
+        monkeypatch.setattr('src.config.load_settings', lambda: {'model': 'mistral'})
+        source = tmp_path / 'prompts.jsonl'
+        source.write_text("first\nsecond\nthird\n")
+        output = tmp_path / 'out.jsonl'
+        # The earlier run was killed while writing job 3
+        output.write_text('{"id": 1, "ok": true, "response": "done before"}\n'
+                          '{"id": 2, "ok": false, "error": "boom"}\n'
+                          '{"id": 3, "ok": tr')
+
+        async def serve():
+            server = FakeOllama()
+            await server.start()
+            return server
+
+        # main() runs its own event loop; the fake server shares it
+        loop = asyncio.new_event_loop()
+        fake = loop.run_until_complete(serve())
+        try:
+            monkeypatch.setattr(batch.asyncio, 'run', loop.run_until_complete)
+            argv = [str(source), '-o', str(output), '--resume', '--host', fake.url]
+            assert batch.main(argv) == 0
+        finally:
+            loop.run_until_complete(fake.close())
+            loop.close()
+
+        lines = [json.loads(line) for line in output.read_text().splitlines()]
+        assert [(r['id'], r['ok']) for r in lines] == [(1, True), (2, False), (2, True), (3, True)]
+        assert len(fake.requests) == 2
+        assert '2 ok, 0 failed' in capsys.readouterr().err
@@ -0,0 +1,214 @@
+"""End-to-end latency and throughput benchmarks.
+
+Run with ``pytest -m slow tests/test_benchmarks.py``. Results are written
+to ``$CHATBOX_BENCHMARK_OUTPUT`` (default ``.benchmarks/<commit>.json``)
+so runs can be compared across commits.
+"""
+import pytest
+import pytest_asyncio
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from kivy.clock import Clock
+
+from src.message_list import MessageList
+from src.message_model import Message, MessageBodies
+from src.ollama_client import OllamaClient, OllamaError
+from tests.fake_ollama import FakeOllama
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+pytestmark = pytest.mark.slow
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    index = min(int(round(pct / 100 * (len(values) - 1))), len(values) - 1)
+    return values[index]
+
+
+def summarize(samples):
+    return {
+        "n": len(samples),
+        "mean": statistics.fmean(samples),
+        "p50": percentile(samples, 50),
+        "p95": percentile(samples, 95),
+        "max": max(samples),
+    }
+
+
+@pytest.fixture(scope="module")
+def results():
+    """Collect benchmark results and write them out once the module is done."""
+    collected = {}
+    yield collected
+    commit = git_commit()
+    path = os.environ.get("CHATBOX_BENCHMARK_OUTPUT") or os.path.join(
+        ROOT, ".benchmarks", f"{commit}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({
+            "commit": commit,
+            "timestamp": time.time(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "results": collected,
+        }, f, indent=2, sort_keys=True)
+
+
+async def stream_timed(client, prompt="Hi", model="mistral"):
+    """Stream one reply and return (time to first token, tokens, total time)."""
+    started = time.perf_counter()
+    first = None
+    tokens = 0
+    async for record in client.stream_generate(model, prompt):
+        if record.get("token"):
+            if first is None:
+                first = time.perf_counter() - started
+            tokens += 1
+    return first, tokens, time.perf_counter() - started
+
+
+@pytest_asyncio.fixture
+async def fake():
+    server = FakeOllama(seed=0)
+    await server.start()
+    yield server
+    await server.close()
+
+
+@pytest_asyncio.fixture
+async def client(fake):
+    client = OllamaClient(host=fake.url)
+    yield client
+    await client.close()
+
+
+class TestClientBenchmarks:
+    """Test latency and throughput of OllamaClient against the fake server."""
+
+    @pytest.mark.asyncio
+    async def test_time_to_first_token(self, fake, client, results):
+        """Test time-to-first-token tracks the server's prefill delay."""
+        fake.first_token_delay = 0.02
+        fake.jitter = 0.2
+        fake.num_tokens = 5
+        samples = []
+        for _ in range(20):
+            first, _, _ = await stream_timed(client)
+            samples.append(first)
+        results["ttft_seconds"] = summarize(samples)
+        assert min(samples) >= 0.02 * 0.8
+        # Client overhead on top of the simulated prefill stays small
+        assert statistics.median(samples) < 0.02 + 0.05
+
+    @pytest.mark.asyncio
+    async def test_tokens_per_second(self, fake, client, results):
+        """Test the client keeps up with a fast unthrottled stream."""
+        fake.num_tokens = 2000
+        await stream_timed(client)  # warm up the connection
+        runs = [await stream_timed(client) for _ in range(3)]
+        rates = [tokens / total for _, tokens, total in runs]
+        results["tokens_per_second"] = summarize(rates)
+        assert all(tokens == 2000 for _, tokens, _ in runs)
+        assert statistics.median(rates) > 1000
+
+    @pytest.mark.asyncio
+    async def test_concurrency_scaling(self, fake, client, results):
+        """Test aggregate throughput grows with concurrent streams."""
+        fake.token_rate = 200
+        fake.num_tokens = 40
+        scaling = {}
+        for concurrency in (1, 4, 16):
+            started = time.perf_counter()
+            runs = await asyncio.gather(*(stream_timed(client) for _ in range(concurrency)))
+            elapsed = time.perf_counter() - started
+            scaling[str(concurrency)] = {
+                "aggregate_tokens_per_second": sum(tokens for _, tokens, _ in runs) / elapsed,
+                "ttft_p50": percentile([first for first, _, _ in runs], 50),
+            }
+        results["concurrency_scaling"] = scaling
+        single = scaling["1"]["aggregate_tokens_per_second"]
+        assert fake.max_active >= 10
+        assert scaling["4"]["aggregate_tokens_per_second"] > 2.5 * single
+        assert scaling["16"]["aggregate_tokens_per_second"] > 6 * single
+
+    @pytest.mark.asyncio
+    async def test_error_injection(self, fake, client, results):
+        """Test injected failures surface as errors without leaking connections."""
+        fake.error_rate = 0.5
+        failures = 0
+        for _ in range(20):
+            try:
+                await stream_timed(client)
+            except OllamaError:
+                failures += 1
+        results["injected_error_rate"] = failures / 20
+        assert 0 < failures < 20
+        assert fake.active == 0
+
+
+class TestTranscriptBenchmarks:
+    """Test the cost of appending to the transcript as it grows."""
+
+    def test_append_cost(self, results):
+        """Test an append to a long transcript costs about the same as to a short one."""
+        message_list = MessageList(size=(400, 300))
+        Clock.tick()
+
+        def timed_appends(count=50):
+            samples = []
+            for i in range(count):
+                started = time.perf_counter()
+                message_list.append_message('assistant', f'reply {i} ' * 10)
+                message_list.refresh_views()
+                samples.append(time.perf_counter() - started)
+            return samples
+
+        short = timed_appends()
+        message_list.data.extend(
+            {'role': 'user', 'text': f'message {i}', 'height': 32} for i in range(10000)
+        )
+        message_list.refresh_views()
+        long = timed_appends()
+        results["transcript_append_seconds"] = {
+            "short": summarize(short),
+            "long": summarize(long),
+        }
+        assert statistics.median(long) < max(10 * statistics.median(short), 0.01)
+
+    def test_long_session_memory(self, results):
+        """Test a 100k-message session fits in tens of MB with its bodies paged out."""
+        bodies = MessageBodies(lambda ids: {i: "" for i in ids}, max_resident=2000)
+        tracemalloc.start()
+        messages = []
+        for i in range(100000):
+            message = Message('user' if i % 2 else 'assistant', f'message {i} ' * 50, id=i + 1000,
+                              model=None if i % 2 else 'mistral', created_at=1.7e9 + i)
+            bodies.attach(message)
+            messages.append(message)
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results["long_session_memory_mb"] = {"current": current / 2**20, "peak": peak / 2**20}
+        assert bodies.resident() == 2000
+        assert current < 40 * 2**20
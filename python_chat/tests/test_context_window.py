@@ -0,0 +1,64 @@
+import pytest
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.context_window import (
+    ContextWindow, REPLY_PRIMING_TOKENS, TOKENS_PER_MESSAGE, estimate_tokens
+)
+
+
+def message(content, role='user'):
+    return {'role': role, 'content': content}
+
+
+class CountingTokenizer:
+    """Token counter that records how often it is called."""
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, text):
+        self.calls += 1
+        return len(text.split())
+
+
+class TestContextWindow:
+    def test_keeps_newest_messages_within_budget(self):
+        """Test the oldest messages are dropped first once the budget is used."""
+        window = ContextWindow(max_tokens=40, reserve_tokens=10, count_tokens=CountingTokenizer())
+        history = [message('one two three four five six') for _ in range(5)]
+        history.append(message('latest'))
+        selected, tokens = window.build(history)
+        assert selected[-1]['content'] == 'latest'
+        # 3 priming + (4 + 1) for the latest + (4 + 6) per older message
+        assert len(selected) == 3
+        assert tokens == REPLY_PRIMING_TOKENS + 5 + 2 * 10
+        assert tokens <= window.max_tokens - window.reserve_tokens
+
+    def test_counts_are_memoized(self):
+        """Test repeated builds do not re-tokenize history."""
+        counter = CountingTokenizer()
+        window = ContextWindow(count_tokens=counter)
+        history = [message(f'message {i}') for i in range(100)]
+        window.build(history)
+        window.build(history + [message('new')])
+        assert counter.calls == 101
+
+    def test_system_prompt_and_message_cap(self):
+        """Test the system prompt is always first and max_messages is honoured."""
+        window = ContextWindow(max_messages=2, count_tokens=CountingTokenizer())
+        selected, tokens = window.build([message('a'), message('b'), message('c')], system='be brief')
+        assert [m['content'] for m in selected] == ['be brief', 'b', 'c']
+        assert tokens == REPLY_PRIMING_TOKENS + 3 * TOKENS_PER_MESSAGE + 2 + 1 + 1
+
+    def test_newest_message_is_kept_even_if_too_long(self):
+        """Test an oversized newest message is still sent."""
+        window = ContextWindow(max_tokens=10, reserve_tokens=5, count_tokens=CountingTokenizer())
+        selected, _ = window.build([message('word ' * 50)])
+        assert len(selected) == 1
+
+    def test_estimate_tokens(self):
+        """Test the estimate splits long words and counts punctuation."""
+        assert estimate_tokens('hello, world') == 5
+        assert estimate_tokens('') == 0
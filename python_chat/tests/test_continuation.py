@@ -0,0 +1,132 @@
+import pytest
+import pytest_asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.context_window import ContextWindow
+from src.continuation import ContinuationStore, history_digest
+from src.ollama_client import OllamaClient
+from tests.fake_ollama import FakeOllama
+
+
+def user(text):
+    return {'role': 'user', 'content': text}
+
+
+def assistant(text):
+    return {'role': 'assistant', 'content': text}
+
+
+@pytest.fixture
+def store():
+    return ContinuationStore(ContextWindow(max_tokens=4096, reserve_tokens=512))
+
+
+@pytest_asyncio.fixture
+async def fake():
+    server = FakeOllama(seed=0)
+    server.num_tokens = 8
+    await server.start()
+    yield server
+    await server.close()
+
+
+class TestPlan:
+    def test_first_turn_is_a_plain_prompt(self, store):
+        """Test a new session sends its one message as the prompt, with no context."""
+        turn = store.plan(1, 'mistral', [user('Hello')])
+        assert turn['prompt'] == 'Hello'
+        assert turn['context'] is None
+        assert store.stats['turns_full'] == 1
+
+    def test_unedited_history_continues(self, store):
+        """Test the next turn sends only the new message along with the saved context."""
+        store.update(1, 'mistral', [user('Hello')], 'Hi there', [1, 2, 3, 4])
+        turn = store.plan(1, 'mistral', [user('Hello'), assistant('Hi there'), user('More')])
+        assert turn['prompt'] == 'More'
+        assert turn['context'] == [1, 2, 3, 4]
+        assert store.stats == {'turns_continued': 1, 'turns_full': 0, 'tokens_saved': 4}
+
+    def test_edited_history_falls_back_to_full_prompt(self, store):
+        """Test a changed earlier message, another model or another session gets a full prompt."""
+        store.update(1, 'mistral', [user('Hello')], 'Hi there', [1, 2, 3])
+        edited = [user('Hello'), assistant('Hi, edited'), user('More')]
+        turn = store.plan(1, 'mistral', edited)
+        assert turn['context'] is None
+        assert turn['prompt'] == 'User: Hello\n\nAssistant: Hi, edited\n\nUser: More'
+        history = [user('Hello'), assistant('Hi there'), user('More')]
+        assert store.plan(1, 'llama2', history)['context'] is None
+        assert store.plan(2, 'mistral', history)['context'] is None
+
+    def test_full_context_falls_back(self):
+        """Test context that would overflow the window is dropped for a trimmed prompt."""
+        store = ContinuationStore(ContextWindow(max_tokens=100, reserve_tokens=20))
+        store.update(1, 'mistral', [user('Hello')], 'Hi', list(range(78)))
+        turn = store.plan(1, 'mistral', [user('Hello'), assistant('Hi'), user('one two three')])
+        assert turn['context'] is None
+
+    def test_retrieved_notes(self, store):
+        """Test system messages go into ``system`` in full prompts and ahead of the message otherwise."""
+        note = {'role': 'system', 'content': 'Paris is in France'}
+        turn = store.plan(1, 'mistral', [note, user('Capital?')])
+        assert (turn['system'], turn['prompt']) == ('Paris is in France', 'Capital?')
+        store.update(1, 'mistral', [note, user('Capital?')], 'Paris', [1, 2])
+        turn = store.plan(1, 'mistral', [note, user('Capital?'), assistant('Paris'), user('Sure?')])
+        assert turn['context'] == [1, 2]
+        assert turn['prompt'] == 'Paris is in France\n\nSure?'
+
+    def test_sessions_are_bounded(self):
+        """Test only the most recently used sessions keep their context."""
+        store = ContinuationStore(ContextWindow(), max_sessions=2)
+        for session_id in (1, 2, 3):
+            store.update(session_id, 'mistral', [user('Hello')], 'Hi', [1])
+        history = [user('Hello'), assistant('Hi'), user('Again')]
+        assert store.plan(1, 'mistral', history)['context'] is None
+        assert store.plan(3, 'mistral', history)['context'] == [1]
+        store.forget(3)
+        assert store.plan(3, 'mistral', history)['context'] is None
+
+    def test_digest_ignores_system_messages(self):
+        """Test only user and assistant turns identify a history."""
+        assert history_digest([{'role': 'system', 'content': 'x'}, user('a')]) == history_digest([user('a')])
+        assert history_digest([user('a')]) != history_digest([assistant('a')])
+
+
+class TestOllamaContinuation:
+    @pytest.mark.asyncio
+    async def test_context_and_keep_alive_are_sent(self, fake):
+        """Test the second turn sends the returned context and prefills only the new message."""
+        client = OllamaClient(host=fake.url, keep_alive={'mistral': '30m', '*': '5m'})
+        store = ContinuationStore(ContextWindow())
+        history = [user('Tell me about the sea ' * 20)]
+        contexts = []
+        try:
+            for text in ('And the mountains?', 'And the sky?'):
+                turn = store.plan(1, 'mistral', history)
+                records = [r async for r in client.stream_generate(
+                    'mistral', turn['prompt'], turn['system'], context=turn['context'])]
+                reply = ''.join(r['token'] for r in records)
+                contexts.append(records[-1]['context'])
+                store.update(1, 'mistral', history, reply, contexts[-1])
+                history = history + [assistant(reply), user(text)]
+        finally:
+            await client.close()
+
+        (_, first), (_, second) = fake.requests
+        assert 'context' not in first
+        assert second['context'] == contexts[0]
+        assert second['prompt'] == 'And the mountains?'
+        assert first['keep_alive'] == second['keep_alive'] == '30m'
+        assert store.stats['tokens_saved'] == len(second['context'])
+        assert records[-1]['prompt_eval_count'] < len(second['context'])
+
+    def test_keep_alive_per_model(self):
+        """Test keep_alive is looked up by full name, then without the tag, then '*'."""
+        client = OllamaClient(keep_alive={'llama2': -1, 'mistral:7b': '1h', '*': '5m'})
+        assert client.keep_alive_for('mistral:7b') == '1h'
+        assert client.keep_alive_for('llama2:13b') == -1
+        assert client.keep_alive_for('phi') == '5m'
+        assert OllamaClient().keep_alive_for('phi') is None
+
@@ -0,0 +1,179 @@
+import pytest
+import pytest_asyncio
+import asyncio
+import json
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.embedding_index import EmbeddingIndex, EmbeddingIndexer
+from src.ollama_client import OllamaClient, OllamaError
+from tests.fake_ollama import FakeOllama, embed
+
+
+@pytest.fixture
+def vectors():
+    return np.random.default_rng(0).normal(size=(50, 16)).astype(np.float32)
+
+
+def make_index(tmp_path, **kwargs):
+    return EmbeddingIndex(tmp_path / 'embeddings', 'nomic-embed-text', **kwargs)
+
+
+class TestEmbeddingIndex:
+    def test_nearest_neighbours(self, tmp_path, vectors):
+        """Test a query returns the most similar messages first, by cosine similarity."""
+        index = make_index(tmp_path)
+        index.add(list(range(100, 150)), vectors)
+        results = index.search(vectors[7] * 3 + 0.01 * vectors[8], k=3)
+        assert results[0][0] == 107
+        assert results[0][1] == pytest.approx(1, abs=1e-3)
+        assert [score for _, score in results] == sorted((score for _, score in results), reverse=True)
+        assert 107 not in [i for i, _ in index.search(vectors[7], k=3, exclude={107})]
+
+    def test_reopen_and_grow(self, tmp_path, vectors):
+        """Test rows survive a restart and the files grow past their first capacity."""
+        index = make_index(tmp_path, capacity=4)
+        for start in range(0, 50, 10):
+            index.add(list(range(start, start + 10)), vectors[start:start + 10])
+        index.close()
+        reopened = make_index(tmp_path)
+        assert len(reopened) == 50 and 49 in reopened
+        assert json.loads((tmp_path / 'embeddings' / 'meta.json').read_text())['count'] == 50
+        assert reopened.search(vectors[42])[0][0] == 42
+
+    def test_replacing_a_vector(self, tmp_path, vectors):
+        """Test adding an id again overwrites its row."""
+        index = make_index(tmp_path)
+        index.add([1, 2], vectors[:2])
+        index.add([1], vectors[5:6])
+        assert len(index) == 2
+        assert index.search(vectors[5], k=1)[0][0] == 1
+
+    def test_new_model_starts_over(self, tmp_path, vectors):
+        """Test vectors from a different embedding model are discarded."""
+        make_index(tmp_path).add([1], vectors[:1])
+        other = EmbeddingIndex(tmp_path / 'embeddings', 'mxbai-embed-large')
+        assert len(other) == 0
+
+    def test_quantized(self, tmp_path, vectors):
+        """Test int8 storage ranks like float32 at a quarter of the size."""
+        full = make_index(tmp_path / 'full')
+        small = make_index(tmp_path / 'small', quantize=True)
+        for index in (full, small):
+            index.add(list(range(50)), vectors)
+        full_ids = [i for i, _ in full.search(vectors[3], k=5)]
+        small_ids = [i for i, _ in small.search(vectors[3], k=5)]
+        assert small_ids[0] == full_ids[0] == 3
+        assert len(set(full_ids) & set(small_ids)) >= 4
+        assert small._vectors.dtype == np.int8
+
+    def test_approximate_index(self, tmp_path):
+        """Test large indexes are clustered and still find close matches."""
+        rng = np.random.default_rng(1)
+        centers = rng.normal(size=(20, 32))
+        data = (centers[rng.integers(0, 20, 2000)] + 0.1 * rng.normal(size=(2000, 32)))
+        index = make_index(tmp_path, ivf_threshold=1000, nprobe=4)
+        index.add(list(range(2000)), data)
+        assert index.centroids is not None and len(index.centroids) == 44
+        hits = sum(index.search(data[i], k=1)[0][0] == i for i in range(0, 2000, 50))
+        assert hits >= 38
+        reopened = make_index(tmp_path, ivf_threshold=1000, nprobe=4)
+        assert reopened.centroids is not None
+
+
+class TestEmbeddingIndexer:
+    @pytest.mark.asyncio
+    async def test_batches_and_backfill(self, tmp_path):
+        """Test queued messages go first, then older ones missing from the index."""
+        index = make_index(tmp_path)
+        batches = []
+
+        async def embed_texts(texts):
+            batches.append(list(texts))
+            return [embed(text) for text in texts]
+
+        old = [{'id': i, 'content': f'old message {i}'} for i in range(1, 6)]
+        source = lambda after, limit: [row for row in old if row['id'] > after][:limit]
+        indexer = EmbeddingIndexer(index, embed_texts, source=source, batch_size=3)
+        index.add([2], [embed('old message 2')])
+        indexer.submit(10, 'new message')
+        indexer.submit(11, '   ')
+        # One backfill page per batch, so the loop is never held for long
+        assert await indexer.run_once() == 2
+        assert batches[0] == ['new message', 'old message 1']
+        assert await indexer.run_once() == 3
+        assert await indexer.run_once() == 0
+        assert len(index) == 6
+
+    @pytest.mark.asyncio
+    async def test_backfill_resumes_where_it_stopped(self, tmp_path):
+        """Test a later launch carries on from the saved cursor instead of rereading history."""
+        index = make_index(tmp_path)
+        old = [{'id': i, 'content': f'old message {i}'} for i in range(1, 6)]
+        reads = []
+
+        def source(after, limit):
+            reads.append(after)
+            return [row for row in old if row['id'] > after][:limit]
+
+        embed_texts = lambda texts: asyncio.sleep(0, [embed(t) for t in texts])
+        indexer = EmbeddingIndexer(index, embed_texts, source=source, batch_size=3)
+        assert await indexer.run_once() == 3
+        index.close()
+        index = make_index(tmp_path)
+        assert index.backfill_after == 3
+        indexer = EmbeddingIndexer(index, embed_texts, source=source, batch_size=3)
+        assert await indexer.run_once() == 2
+        assert reads == [0, 3]
+
+    @pytest.mark.asyncio
+    async def test_failed_batch_is_retried(self, tmp_path):
+        """Test messages stay queued when embedding fails."""
+        index = make_index(tmp_path)
+
+        async def failing(texts):
+            raise OllamaError("model 'nomic-embed-text' not found", 404)
+
+        indexer = EmbeddingIndexer(index, failing)
+        indexer.submit(1, 'hello')
+        with pytest.raises(OllamaError):
+            await indexer.run_once()
+        indexer.embed = lambda texts: asyncio.sleep(0, [embed(t) for t in texts])
+        assert await indexer.run_once() == 1
+        assert 1 in index
+
+
+class TestClientEmbeddings:
+    @pytest_asyncio.fixture
+    async def fake(self):
+        server = FakeOllama()
+        await server.start()
+        yield server
+        await server.close()
+
+    @pytest.mark.asyncio
+    async def test_batched_endpoint(self, fake):
+        """Test a batch of texts is embedded with one request."""
+        client = OllamaClient(host=fake.url)
+        try:
+            vectors = await client.embed('nomic-embed-text', ['a b', 'c'])
+        finally:
+            await client.close()
+        assert vectors == [embed('a b'), embed('c')]
+        assert [path for path, _ in fake.requests] == ['/api/embed']
+
+    @pytest.mark.asyncio
+    async def test_legacy_endpoint(self, fake):
+        """Test servers without /api/embed get one /api/embeddings request per text."""
+        fake.batch_embeddings = False
+        client = OllamaClient(host=fake.url)
+        try:
+            assert await client.embed('nomic-embed-text', ['a', 'b']) == [embed('a'), embed('b')]
+            await client.embed('nomic-embed-text', ['c'])
+        finally:
+            await client.close()
+        assert [path for path, _ in fake.requests] == ['/api/embed'] + ['/api/embeddings'] * 3
@@ -0,0 +1,160 @@
+import pytest
+import io
+import json
+import os
+import sys
+import threading
+import tracemalloc
+import zipfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.exporter import ExportCancelled, ExportJob, format_for, write_chunks
+from src.session_store import SessionStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SessionStore(tmp_path / 'chats.db')
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def session_id(store):
+    session_id = store.create_session('Greetings')
+    store.append_message(session_id, 'system', 'Welcome')
+    store.append_message(session_id, 'user', 'Hello <script>alert(1)</script>')
+    store.append_message(session_id, 'assistant', 'Hi **there**\n\n```\nx < 1\n```', model='mistral')
+    return session_id
+
+
+class TestFormats:
+    def test_markdown(self, store, session_id, tmp_path):
+        """Test the Markdown export has a title and one section per message."""
+        dest = tmp_path / 'out' / 'chat.md'
+        ExportJob(store.path, [session_id], dest).run()
+        text = dest.read_text()
+        assert text.startswith("# Greetings\n\n**System:**\n\nWelcome\n\n**You:**\n\nHello")
+        assert text.endswith("**Assistant:**\n\nHi **there**\n\n```\nx < 1\n```\n\n")
+
+    def test_jsonl(self, store, session_id, tmp_path):
+        """Test the JSONL export is the session record followed by its messages."""
+        dest = tmp_path / 'chat.jsonl'
+        ExportJob(store.path, [session_id], dest).run()
+        records = [json.loads(line) for line in dest.read_text().splitlines()]
+        assert [r['type'] for r in records] == ['session', 'message', 'message', 'message']
+        assert records[0]['title'] == 'Greetings'
+        assert records[3]['model'] == 'mistral'
+
+    def test_html_is_self_contained_and_escaped(self, store, session_id, tmp_path):
+        """Test the HTML export renders Markdown but not raw HTML from messages."""
+        dest = tmp_path / 'chat.html'
+        ExportJob(store.path, [session_id], dest).run()
+        page = dest.read_text()
+        assert '<style>' in page and '<link' not in page
+        assert '<script>' not in page
+        assert '&lt;script&gt;' in page
+        assert '<strong>there</strong>' in page
+        assert '<code>x &lt; 1' in page
+
+    def test_html_drops_unsafe_links(self, store, tmp_path):
+        """Test javascript: and data: URLs lose their target while web links keep it."""
+        session_id = store.create_session('Links')
+        store.append_message(session_id, 'assistant',
+                             '[a](javascript:alert(1)) [b](&#106;avascript:alert(1)) '
+                             '![c](data:text/html;base64,PHNjcmlwdD4=) [d][1] [e](https://example.com)'
+                             '\n\n[1]: JavaScript:alert(2)')
+        dest = tmp_path / 'links.html'
+        ExportJob(store.path, [session_id], dest).run()
+        page = dest.read_text()
+        assert 'script:' not in page.lower() and 'data:' not in page
+        assert '<a>a</a> <a>b</a> <img alt="c" /> <a>d</a>' in page
+        assert '<a href="https://example.com">e</a>' in page
+
+    def test_text_matches_transcript(self, store, session_id, tmp_path):
+        """Test the text export uses the transcript format the search index imports."""
+        dest = tmp_path / 'chat.txt'
+        ExportJob(store.path, [session_id], dest).run()
+        assert dest.read_text().startswith("Welcome\nYou: Hello")
+
+    def test_unknown_format(self):
+        """Test unsupported extensions are refused up front."""
+        with pytest.raises(ValueError):
+            format_for('chat.docx')
+
+
+class TestExportJob:
+    def test_writes_fixed_size_chunks(self):
+        """Test output reaches the file in chunk-sized writes."""
+        writes = []
+
+        class Stream(io.BytesIO):
+            def write(self, data):
+                writes.append(len(data))
+                return super().write(data)
+
+        write_chunks(['a' * 7, 'b' * 5, 'c'], Stream(), chunk_size=4)
+        assert writes == [4, 4, 4, 1]
+
+    def test_archive_of_sessions(self, store, session_id, tmp_path):
+        """Test several sessions go into one zip with a file per session."""
+        other = store.create_session()
+        store.append_message(other, 'user', 'Second chat')
+        dest = tmp_path / 'chats.zip'
+        ExportJob(store.path, [session_id, other], dest, fmt='jsonl').run()
+        with zipfile.ZipFile(dest) as archive:
+            names = archive.namelist()
+            assert names == [f'{session_id:05d}-greetings.jsonl', f'{other:05d}-chat.jsonl']
+            assert 'Second chat' in archive.read(names[1]).decode()
+
+    def test_background_progress_and_done(self, store, session_id, tmp_path):
+        """Test a started job reports progress from its worker thread, then finishes."""
+        progress = []
+        finished = threading.Event()
+        results = []
+
+        def done(error):
+            results.append((threading.current_thread().name, error))
+            finished.set()
+
+        job = ExportJob(store.path, [session_id], tmp_path / 'chat.md',
+                        on_progress=lambda done, total: progress.append((done, total)),
+                        on_done=done, progress_interval=0)
+        job.start()
+        assert finished.wait(5)
+        assert results == [('export', None)]
+        assert progress[0] == (0, 3)
+        assert progress[-1] == (3, 3)
+
+    def test_cancel_leaves_nothing_behind(self, store, session_id, tmp_path):
+        """Test a cancelled export stops and removes its partial output."""
+        dest = tmp_path / 'chat.md'
+        job = ExportJob(store.path, [session_id], dest, batch_size=1,
+                        on_progress=lambda done, total: done == 1 and job.cancel(),
+                        progress_interval=0)
+        with pytest.raises(ExportCancelled):
+            job.run()
+        assert job.done == 1
+        assert not dest.exists()
+        assert not any(name.endswith('.part') for name in os.listdir(tmp_path))
+
+    def test_memory_does_not_grow_with_chat_length(self, store, tmp_path):
+        """Test exporting a large chat keeps only a batch of messages in memory."""
+        session_id = store.create_session('Big')
+        body = 'x' * 2000
+        with store.transaction():
+            for i in range(1500):
+                store.conn.execute(
+                    "INSERT INTO messages (session_id, role, content, created_at) VALUES (?, ?, ?, 0)",
+                    (session_id, 'user' if i % 2 else 'assistant', body),
+                )
+        dest = tmp_path / 'big.jsonl'
+        tracemalloc.start()
+        try:
+            ExportJob(store.path, [session_id], dest, batch_size=100).run()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        assert dest.stat().st_size > 3_000_000
+        assert peak < 2_000_000
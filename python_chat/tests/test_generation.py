@@ -0,0 +1,442 @@
+import pytest
+import asyncio
+import os
+import sys
+
+# Add the parent directory to sys.path to import the application modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from main import TITLE_PROMPT, ChatApp
+
+class FakeStreamingClient:
+    """Ollama client stand-in that streams a fixed reply."""
+    def __init__(self, tokens=('Mock', ' ', 'response')):
+        self.tokens = tokens
+        self.host = 'http://fake'
+        self.closed_stream = False
+
+    async def stream_chat(self, model, messages, parameters=None):
+        for token in self.tokens:
+            await asyncio.sleep(0)
+            yield {'token': token, 'done': False}
+        yield {'token': '', 'done': True}
+
+    async def close(self):
+        pass
+
+class StallingClient(FakeStreamingClient):
+    """Client whose stream never finishes until it is cancelled."""
+    async def stream_chat(self, model, messages, parameters=None):
+        try:
+            yield {'token': 'partial', 'done': False}
+            await asyncio.sleep(3600)
+        finally:
+            self.closed_stream = True
+
+@pytest.fixture
+def chat_app(tmp_path, monkeypatch):
+    """Create a real ChatApp with its widget tree and a fake Ollama client."""
+    monkeypatch.chdir(tmp_path)
+    app = ChatApp()
+    app.build()
+    app.ollama_client = FakeStreamingClient()
+    yield app
+    for task in app.background_tasks:
+        task.cancel()
+    app.session_store.close()
+
+class TestGeneration:
+    @pytest.mark.asyncio
+    async def test_send_message_streams_reply(self, chat_app):
+        """Test sending a message schedules a generation that streams into the transcript."""
+        chat_app.message_input.text = 'Hello'
+        chat_app.send_message(None)
+        await chat_app.generation_task
+        assert chat_app.chat_history() == [
+            {'role': 'user', 'content': 'Hello'},
+            {'role': 'assistant', 'content': 'Mock response'},
+        ]
+        assert chat_app.stop_button.disabled
+
+    @pytest.mark.asyncio
+    async def test_stop_generation(self, chat_app):
+        """Test Stop cancels the in-flight stream and keeps the partial reply."""
+        chat_app.ollama_client = StallingClient()
+        chat_app.message_input.text = 'Hello'
+        chat_app.send_message(None)
+        task = chat_app.generation_task
+        await asyncio.sleep(0.01)
+        assert not chat_app.stop_button.disabled
+        chat_app.stop_generation()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert chat_app.ollama_client.closed_stream
+        assert chat_app.chat_history()[-1] == {'role': 'assistant', 'content': 'partial'}
+        assert not chat_app.send_button.disabled
+
+    @pytest.mark.asyncio
+    async def test_conversation_is_saved(self, chat_app):
+        """Test both sides of the exchange are in the session store and reload."""
+        chat_app.message_input.text = 'Hello'
+        chat_app.send_message(None)
+        await chat_app.generation_task
+        rows = chat_app.session_store.load_recent(chat_app.session_id)
+        assert [(r['role'], r['content'], r['finalized']) for r in rows] == [
+            ('user', 'Hello', 1), ('assistant', 'Mock response', 1)
+        ]
+        chat_app.load_history()
+        assert chat_app.chat_history()[-1] == {'role': 'assistant', 'content': 'Mock response'}
+
+class TestBackgroundJobs:
+    @pytest.mark.asyncio
+    async def test_first_reply_names_the_session(self, chat_app):
+        """Test a background request titles a new session after its first reply."""
+        chat_app.message_input.text = 'Hello'
+        chat_app.send_message(None)
+        await chat_app.generation_task
+        await asyncio.gather(*chat_app.background_tasks)
+        assert chat_app.session_store.get_session(chat_app.session_id)['title'] == 'Mock response'
+
+    @pytest.mark.asyncio
+    async def test_new_message_supersedes_title_job(self, chat_app):
+        """Test sending another message cancels the pending title request."""
+        chat_app.message_input.text = 'Hello'
+        chat_app.send_message(None)
+        await chat_app.generation_task
+        chat_app.ollama_client = StallingClient()
+        titles = list(chat_app.background_tasks)
+        chat_app.message_input.text = 'Another'
+        chat_app.send_message(None)
+        results = await asyncio.gather(*titles, return_exceptions=True)
+        assert isinstance(results[0], asyncio.CancelledError)
+        assert chat_app.scheduler.stats['superseded'] == 1
+        chat_app.stop_generation()
+
+class TracingClient(FakeStreamingClient):
+    """Streaming client that times its requests like OllamaClient does."""
+    def __init__(self, telemetry):
+        super().__init__()
+        self.telemetry = telemetry
+
+    async def stream_chat(self, model, messages, parameters=None):
+        trace = self.telemetry.begin('/api/chat', model, self.host)
+        async for record in super().stream_chat(model, messages, parameters):
+            trace.token(record['token'])
+            yield record
+        # Replies run at 20 tokens/s and titles at 100
+        duration = 2 if messages[-1]['content'] != TITLE_PROMPT else 0.4
+        trace.finish({'done': True, 'eval_count': 40, 'eval_duration': duration * 10**9})
+
+class TestStatusBar:
+    @pytest.mark.asyncio
+    async def test_background_requests_keep_the_reply_speed(self, chat_app):
+        """Test a title request is recorded but does not replace the reply's speed."""
+        chat_app.ollama_client = TracingClient(chat_app.telemetry)
+        chat_app.message_input.text = 'Hello'
+        chat_app.send_message(None)
+        await chat_app.generation_task
+        await asyncio.gather(*chat_app.background_tasks)
+        assert [r['kind'] for r in chat_app.telemetry.records] == ['reply', 'title']
+        assert chat_app.stats_label.text.startswith('mistral: 20.0 tokens/s')
+
+    def test_status_and_speed(self, chat_app):
+        """Test statuses show in the status bar and finished requests update the speed."""
+        chat_app.update_status('Cannot reach Ollama', 'error')
+        assert chat_app.status_label.text == 'Cannot reach Ollama'
+        assert tuple(chat_app.status_label.color) == (1, 0.45, 0.45, 1)
+        trace = chat_app.telemetry.begin('/api/chat', 'mistral', 'http://fake')
+        trace.token('Hi')
+        trace.finish({'done': True, 'eval_count': 40, 'eval_duration': 2 * 10**9})
+        assert chat_app.stats_label.text.startswith('mistral: 20.0 tokens/s, first token p50/p95/p99 ')
+
+class TestWorkspace:
+    @pytest.mark.asyncio
+    async def test_sessions_stream_concurrently(self, chat_app):
+        """Test a reply keeps streaming into its session while another one is shown and generating."""
+        first = chat_app.session_id
+        chat_app.message_input.text = 'Hello'
+        chat_app.send_message(None)
+        first_task = chat_app.generation_task
+        chat_app.new_chat()
+        assert chat_app.stop_button.disabled
+        chat_app.message_input.text = 'Other'
+        chat_app.send_message(None)
+        await asyncio.gather(first_task, chat_app.generation_task)
+        assert chat_app.chat_history() == [
+            {'role': 'user', 'content': 'Other'},
+            {'role': 'assistant', 'content': 'Mock response'},
+        ]
+        assert chat_app.workspace.sessions[first].view is None
+        chat_app.open_session(first)
+        assert chat_app.chat_history()[-1] == {'role': 'assistant', 'content': 'Mock response'}
+        assert len(chat_app.tab_bar.children) == 2
+
+    @pytest.mark.asyncio
+    async def test_closing_a_tab_stops_its_generation(self, chat_app):
+        """Test closing a generating tab cancels it, saves the partial reply and shows another tab."""
+        chat_app.ollama_client = StallingClient()
+        first = chat_app.session_id
+        chat_app.new_chat()
+        chat_app.message_input.text = 'Hello'
+        chat_app.send_message(None)
+        task = chat_app.generation_task
+        await asyncio.sleep(0.01)
+        second = chat_app.session_id
+        chat_app.close_tab(second)
+        await asyncio.gather(task, return_exceptions=True)
+        assert task.cancelled() and chat_app.ollama_client.closed_stream
+        assert chat_app.session_id == first and second not in chat_app.workspace
+        rows = chat_app.session_store.load_recent(second)
+        assert rows[-1]['content'] == 'partial' and rows[-1]['finalized'] == 1
+
+class RecordingClient(FakeStreamingClient):
+    """Streaming client that keeps the messages of every request."""
+    def __init__(self):
+        super().__init__()
+        self.requests = []
+
+    async def stream_chat(self, model, messages, parameters=None):
+        self.requests.append(messages)
+        async for record in super().stream_chat(model, messages, parameters):
+            yield record
+
+class TestAttachments:
+    @pytest.mark.asyncio
+    async def test_attached_images_are_sent_and_kept(self, chat_app, tmp_path):
+        """Test a batch of images goes with the next message and again with later turns."""
+        from PIL import Image
+
+        chat_app.ollama_client = client = RecordingClient()
+        paths = []
+        for name, color in (('a.png', 'red'), ('b.png', 'blue')):
+            Image.new('RGB', (2000, 1000), color).save(tmp_path / name)
+            paths.append(str(tmp_path / name))
+        try:
+            await chat_app.attach_files(paths)
+            assert chat_app.attachment_bar.height > 0
+            chat_app.send_message(None)
+            await chat_app.generation_task
+            assert len(client.requests[0][-1]['images']) == 2
+            assert chat_app.pending_attachments == [] and chat_app.attachment_bar.height == 0
+            chat_app.load_history()
+            # Past images are read when the reply is generated, not on the UI thread
+            assert 'images' not in chat_app.chat_history()[0]
+            chat_app.message_input.text = 'And now?'
+            chat_app.send_message(None)
+            await chat_app.generation_task
+            [turn] = [r for r in client.requests if r[-1]['content'] == 'And now?']
+            assert [len(m.get('images', [])) for m in turn] == [2, 0, 0]
+        finally:
+            chat_app.attachments.close()
+
+class GatedClient(FakeStreamingClient):
+    """Streaming client that holds its reply until released and records being closed."""
+    def __init__(self):
+        super().__init__()
+        self.release = asyncio.Event()
+        self.closed = False
+
+    async def stream_chat(self, model, messages, parameters=None):
+        await self.release.wait()
+        async for record in super().stream_chat(model, messages, parameters):
+            yield record
+
+    async def close(self):
+        self.closed = True
+
+class TestHostChanges:
+    @pytest.mark.asyncio
+    async def test_running_reply_outlives_a_host_change(self, chat_app, monkeypatch):
+        """Test new hosts resize the scheduler and the old client is closed after the reply."""
+        old = chat_app.ollama_client = GatedClient()
+        new = FakeStreamingClient()
+
+        async def connect():
+            chat_app.ollama_client = new
+
+        monkeypatch.setattr(chat_app, 'connect_to_ollama', connect)
+        chat_app.message_input.text = 'Hello'
+        chat_app.send_message(None)
+        task = chat_app.generation_task
+        await asyncio.sleep(0.01)
+        hosts = ['http://a:11434', 'http://b:11434']
+        chat_app.on_settings_changed(dict(chat_app.app_config, ollama=dict(
+            chat_app.app_config['ollama'], hosts=hosts)))
+        assert chat_app.scheduler.host_count == 2
+        await asyncio.sleep(0.01)
+        assert chat_app.ollama_client is new and not old.closed
+        old.release.set()
+        await task
+        await asyncio.sleep(0.01)
+        assert old.closed
+        assert chat_app.chat_history()[-1] == {'role': 'assistant', 'content': 'Mock response'}
+
+class WarmupClient(FakeStreamingClient):
+    """Streaming client that loads models instantly and reports them resident."""
+    def __init__(self):
+        super().__init__()
+        self.loaded = []
+
+    async def load_model(self, model, keep_alive=None):
+        await asyncio.sleep(0)
+        self.loaded.append(model)
+
+    async def running_models(self):
+        return [{'name': f'{model}:latest', 'size_vram': 2e9} for model in self.loaded]
+
+class TestModelWarmup:
+    @pytest.mark.asyncio
+    async def test_selected_model_is_preloaded(self, chat_app):
+        """Test the model is loaded at startup and again when another is selected."""
+        chat_app.ollama_client = client = WarmupClient()
+        chat_app.start_warmup()
+        try:
+            await chat_app.warmup.preload(chat_app.app_config['model'])
+            assert client.loaded == [chat_app.app_config['model']]
+            chat_app.on_settings_changed(dict(chat_app.app_config, model='llama2'))
+            assert chat_app.model_button.text == 'llama2 (loading)'
+            await chat_app.warmup.preload('llama2')
+            assert chat_app.model_button.text == 'llama2 (ready, 2.0 GB)'
+        finally:
+            await chat_app.warmup.close()
+
+class EmbeddingClient(FakeStreamingClient):
+    """Streaming client that also embeds text and records what it was sent."""
+    def __init__(self):
+        super().__init__()
+        self.sent = []
+
+    async def stream_chat(self, model, messages, parameters=None):
+        self.sent.append(messages)
+        async for record in super().stream_chat(model, messages, parameters):
+            yield record
+
+    async def embed(self, model, texts):
+        from tests.fake_ollama import embed
+        return [embed(text) for text in texts]
+
+@pytest.fixture
+def semantic_app(tmp_path, monkeypatch):
+    """Create a ChatApp with semantic search and retrieval turned on."""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'settings').mkdir()
+    (tmp_path / 'settings' / 'config.json').write_text(
+        '{"embeddings": {"enabled": true, "retrieval": true}}')
+    app = ChatApp()
+    app.build()
+    app.ollama_client = EmbeddingClient()
+    yield app
+    app._search_trigger.cancel()
+    for task in app.background_tasks:
+        task.cancel()
+    app.session_store.close()
+    app.settings_store.close()
+
+class TestSemanticSearch:
+    @pytest.mark.asyncio
+    async def test_past_messages_are_retrieved_into_the_prompt(self, semantic_app):
+        """Test a similar message from another session is added as context."""
+        store = semantic_app.session_store
+        old_session = store.create_session()
+        old = store.append_message(old_session, 'assistant', 'The capital of France is Paris')
+        store.append_message(old_session, 'assistant', 'Bananas are yellow')
+        assert await semantic_app.embedding_indexer.run_once() == 2
+        semantic_app.message_input.text = 'What is the capital of France?'
+        semantic_app.send_message(None)
+        await semantic_app.generation_task
+        context, question = semantic_app.ollama_client.sent[0]
+        assert context['role'] == 'system'
+        assert 'Paris' in context['content'] and 'Bananas' not in context['content']
+        assert question['content'] == 'What is the capital of France?'
+        assert old in semantic_app.embedding_index
+
+    @pytest.mark.asyncio
+    async def test_semantic_search_mode(self, semantic_app, monkeypatch):
+        """Test the search box can look for messages by meaning."""
+        shown = []
+        monkeypatch.setattr(semantic_app, 'show_search_results', shown.append)
+        store = semantic_app.session_store
+        message_id = store.append_message(store.create_session(), 'user', 'Paris trip plans')
+        semantic_app.index_message(message_id, 'Paris trip plans')
+        await semantic_app.embedding_indexer.run_once()
+        semantic_app.toggle_search_mode()
+        semantic_app.search_input.text = 'plans for paris'
+        assert semantic_app.search_mode == 'semantic'
+        await semantic_app.run_semantic_search('plans for paris')
+        [[result]] = shown
+        assert result['id'] == message_id
+        assert result['snippet'] == '\x02Paris\x03 trip \x02plans\x03'
+
+class TestKeywordSearch:
+    @pytest.mark.asyncio
+    async def test_results_of_stale_queries_are_dropped(self, chat_app, monkeypatch):
+        """Test keyword search runs in the background and only the current query is shown."""
+        shown = []
+        monkeypatch.setattr(chat_app, 'show_search_results', shown.append)
+        store = chat_app.session_store
+        message_id = store.append_message(store.create_session(), 'user', 'Paris trip plans')
+        chat_app.search_input.text = 'paris'
+        chat_app._search_trigger.cancel()
+        await chat_app.run_keyword_search('par')
+        assert shown == []
+        await chat_app.run_keyword_search('paris')
+        [[result]] = shown
+        assert result['id'] == message_id
+        chat_app.search_index.close()
+
+class GeneratingClient(FakeStreamingClient):
+    """Streaming client for /api/generate that returns context tokens like Ollama."""
+    def __init__(self):
+        super().__init__()
+        self.sent = []
+
+    async def stream_generate(self, model, prompt, system="", parameters=None, context=None):
+        self.sent.append((prompt, context))
+        context = list(context or []) + list(range(len(prompt) + len(self.tokens)))
+        for token in self.tokens:
+            await asyncio.sleep(0)
+            yield {'token': token, 'done': False}
+        yield {'token': '', 'done': True, 'prompt_eval_count': len(prompt), 'context': context}
+
+@pytest.fixture
+def continuation_app(tmp_path, monkeypatch):
+    """Create a ChatApp that continues chats from Ollama's context tokens."""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'settings').mkdir()
+    (tmp_path / 'settings' / 'config.json').write_text('{"context": {"continuation": true}}')
+    app = ChatApp()
+    app.build()
+    app.ollama_client = GeneratingClient()
+    yield app
+    for task in app.background_tasks:
+        task.cancel()
+    app.session_store.close()
+    app.settings_store.close()
+
+class TestContinuation:
+    @pytest.mark.asyncio
+    async def test_next_turn_reuses_context(self, continuation_app, monkeypatch):
+        """Test a follow-up sends only the new message and reports the reused tokens."""
+        statuses = []
+        monkeypatch.setattr(continuation_app, 'update_status',
+                            lambda text, status_type='info': statuses.append(text))
+        for text in ('Hello', 'And then?'):
+            continuation_app.message_input.text = text
+            continuation_app.send_message(None)
+            await continuation_app.generation_task
+        (_, first), (prompt, context) = continuation_app.ollama_client.sent
+        assert first is None
+        assert prompt == 'And then?' and len(context) == 8
+        assert statuses[-1] == 'Ready (9 prompt tokens prefilled, 8 reused)'
+
+    @pytest.mark.asyncio
+    async def test_cleared_chat_starts_over(self, continuation_app):
+        """Test clearing the chat drops the saved context."""
+        continuation_app.message_input.text = 'Hello'
+        continuation_app.send_message(None)
+        await continuation_app.generation_task
+        continuation_app.clear_chat()
+        continuation_app.message_input.text = 'Hi again'
+        continuation_app.send_message(None)
+        await continuation_app.generation_task
+        assert continuation_app.ollama_client.sent[-1] == ('Hi again', None)
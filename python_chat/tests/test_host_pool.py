@@ -0,0 +1,136 @@
+import pytest
+import pytest_asyncio
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.config import DEFAULT_CONFIG
+from src.host_pool import HostPool
+from src.ollama_client import OllamaClient
+from src.settings_dialog import parse_endpoints
+from tests.fake_ollama import FakeOllama
+
+
+@pytest_asyncio.fixture
+async def fakes():
+    servers = [FakeOllama(), FakeOllama()]
+    for server in servers:
+        await server.start()
+    yield servers
+    for server in servers:
+        await server.close()
+
+
+def make_client(urls, **pool_options):
+    return OllamaClient(pool=HostPool(urls, **pool_options))
+
+
+async def drain(client, model='mistral'):
+    return [r['token'] async for r in client.stream_generate(model, 'hi')]
+
+
+class TestRouting:
+    @pytest.mark.asyncio
+    async def test_least_outstanding_host_is_chosen(self, fakes):
+        """Test concurrent requests spread across hosts."""
+        for fake in fakes:
+            fake.token_rate = 100
+        client = make_client([f.url for f in fakes])
+        try:
+            await asyncio.gather(*(drain(client) for _ in range(4)))
+        finally:
+            await client.close()
+        assert [f.max_active for f in fakes] == [2, 2]
+        assert [s['requests'] for s in client.host_stats().values()] == [2, 2]
+
+    @pytest.mark.asyncio
+    async def test_only_hosts_with_the_model(self, fakes):
+        """Test requests skip hosts that do not have the model."""
+        fakes[0].models = [m for m in fakes[0].models if m['name'] != 'mistral']
+        client = make_client([f.url for f in fakes])
+        try:
+            await client.list_models(refresh=True)
+            for _ in range(3):
+                await drain(client)
+        finally:
+            await client.close()
+        assert fakes[0].max_active == 0
+        assert fakes[1].max_active == 1
+        assert 'mistral' in client.available_models
+
+    @pytest.mark.asyncio
+    async def test_failover_and_passive_health(self, fakes):
+        """Test a dead host is skipped and taken out of rotation after repeated failures."""
+        dead = fakes[0].url
+        await fakes[0].close()
+        client = make_client([dead, fakes[1].url], failure_threshold=2)
+        try:
+            for _ in range(4):
+                assert await drain(client)
+        finally:
+            await client.close()
+        stats = client.host_stats()
+        assert stats[dead]['healthy'] is False
+        assert stats[dead]['errors'] == 2
+        assert stats[fakes[1].url]['requests'] == 4
+
+    @pytest.mark.asyncio
+    async def test_active_health_check(self, fakes):
+        """Test probing marks unreachable hosts down and records models."""
+        dead = fakes[0].url
+        await fakes[0].close()
+        client = make_client([dead, fakes[1].url])
+        try:
+            assert await client.check_hosts() == {dead: False, fakes[1].url: True}
+            assert await client.connect() is True
+        finally:
+            await client.close()
+        assert client.host_stats()[fakes[1].url]['models'] == ['llama2', 'mistral']
+
+
+class TestHedging:
+    @pytest.mark.asyncio
+    async def test_slow_first_token_is_hedged(self, fakes):
+        """Test a slow host is raced by a second one and the loser is cancelled."""
+        slow, fast = fakes
+        slow.first_token_delay = 1
+        client = make_client([slow.url, fast.url], hedge_percentile=95, hedge_min_samples=1)
+        client.pool.record_ttft(fast.url, 0.05)
+        try:
+            tokens = await asyncio.wait_for(drain(client), 0.8)
+            await asyncio.sleep(0.05)
+        finally:
+            await client.close()
+        assert len(tokens) == fast.num_tokens + 1
+        stats = client.host_stats()
+        assert stats[fast.url]['hedges_won'] == 1
+        assert stats[slow.url]['cancelled'] == 1
+        assert stats[slow.url]['outstanding'] == 0
+
+    @pytest.mark.asyncio
+    async def test_no_hedging_without_samples(self, fakes):
+        """Test hedging waits for enough latency samples."""
+        client = make_client([f.url for f in fakes], hedge_percentile=95, hedge_min_samples=5)
+        try:
+            await drain(client)
+        finally:
+            await client.close()
+        assert client.pool.hedge_delay() is None
+        assert sum(s['hedges'] for s in client.host_stats().values()) == 0
+
+
+class TestHostConfig:
+    def test_hosts_list_builds_a_pool(self):
+        """Test a list of hosts in the config enables the pool."""
+        config = dict(DEFAULT_CONFIG)
+        config['ollama'] = dict(DEFAULT_CONFIG['ollama'], hosts=['http://a:11434', 'http://b:11434/'])
+        client = OllamaClient.from_config(config)
+        assert list(client.pool.hosts) == ['http://a:11434', 'http://b:11434']
+        assert client.host == 'http://a:11434'
+        assert OllamaClient.from_config(DEFAULT_CONFIG).pool is None
+
+    def test_parse_endpoints(self):
+        """Test the settings dialog accepts a comma-separated endpoint list."""
+        assert parse_endpoints("http://a:11434/, http://b:11434,") == ['http://a:11434', 'http://b:11434']
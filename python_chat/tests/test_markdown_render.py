@@ -0,0 +1,138 @@
+import pytest
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import src.markdown_render as markdown_render
+from src.markdown_render import THEMES, MarkdownDocument, MarkdownRenderer, render_inline
+
+REPLY = (
+    "# Title\n"
+    "\n"
+    "Some **bold** and `code`.\n"
+    "\n"
+    "```python\n"
+    "def f():\n"
+    "\n"
+    "    return [1]\n"
+    "```\n"
+    "- one\n"
+    "- two\n"
+)
+
+
+@pytest.fixture
+def parses(monkeypatch):
+    """Count the blocks parsed, rather than served from the cache."""
+    calls = []
+    original = markdown_render.render_block
+
+    def counting(block, palette):
+        calls.append(block)
+        return original(block, palette)
+
+    monkeypatch.setattr(markdown_render, 'render_block', counting)
+    return calls
+
+
+class TestMarkup:
+    def test_inline(self):
+        """Test inline Markdown becomes Kivy markup and other brackets are escaped."""
+        palette = THEMES['dark']
+        assert render_inline('**a** *b* ~~c~~ [d](http://x) [e]', palette) == (
+            "[b]a[/b] [i]b[/i] [s]c[/s] "
+            "[ref=http://x][color=#66b3ff][u]d[/u][/color][/ref] &bl;e&br;"
+        )
+
+    def test_code_span_is_literal(self):
+        """Test Markdown inside a code span is left alone."""
+        markup = render_inline('`**x**`', THEMES['light'])
+        assert markup == "[font=RobotoMono-Regular][color=#c7254e]**x**[/color][/font]"
+
+    def test_blocks(self):
+        """Test headings, lists and quotes are rendered line by line."""
+        markup = MarkdownRenderer(highlight=False).render("## Head\n\n- a\n  - b\n1. c\n\n> q")
+        assert markup == (
+            "[size=19sp][b]Head[/b][/size]\n\n"
+            "  •  a\n      •  b\n  1.  c\n\n"
+            "[color=#9e9e9e][i]│ q[/i][/color]"
+        )
+
+
+class TestMarkdownDocument:
+    def test_blocks_and_open_block(self):
+        """Test a fence keeps its blank lines and the last block stays open."""
+        document = MarkdownDocument()
+        tail = document.feed(REPLY)
+        assert document.blocks == [
+            "# Title",
+            "Some **bold** and `code`.",
+            "```python\ndef f():\n\n    return [1]\n```",
+        ]
+        assert tail == "- one\n- two"
+
+    def test_incremental_feed_matches_full_feed(self):
+        """Test feeding a reply token by token finds the same blocks."""
+        document = MarkdownDocument()
+        for end in range(0, len(REPLY) + 1, 3):
+            tail = document.feed(REPLY[:end])
+        tail = document.feed(REPLY)
+        full = MarkdownDocument()
+        assert full.feed(REPLY) == tail
+        assert full.blocks == document.blocks
+
+    def test_rewritten_text_starts_over(self):
+        """Test text that no longer extends the old text is scanned from scratch."""
+        document = MarkdownDocument()
+        document.feed("one\n\ntwo\n\n")
+        assert document.feed("three\n\nfour") == "four"
+        assert document.blocks == ["three"]
+
+
+class TestMarkdownRenderer:
+    def test_streaming_renders_only_the_open_block(self, parses):
+        """Test completed blocks are parsed once while a message streams."""
+        renderer = MarkdownRenderer(highlight=False)
+        renderer.render("Para one.\n\nPara", key=1)
+        renderer.render("Para one.\n\nPara two", key=1)
+        renderer.render("Para one.\n\nPara two.\n\nThree", key=1)
+        assert parses == ["Para one.", "Para", "Para two", "Para two.", "Three"]
+
+    def test_theme_variants_are_cached(self, parses):
+        """Test switching back to a theme renders nothing again."""
+        renderer = MarkdownRenderer(highlight=False)
+        dark = renderer.render("# T\n\nbody\n", 'dark', key=1)
+        renderer.render("# T\n\nbody\n", 'light', key=1)
+        del parses[:]
+        assert renderer.render("# T\n\nbody\n", 'dark', key=1) == dark
+        assert parses == []
+
+    def test_code_is_highlighted_off_thread(self):
+        """Test a finished code block is shown plain, then highlighted by the worker."""
+        pytest.importorskip('pygments')
+        updated = threading.Event()
+        threads = []
+
+        def dispatch(callback):
+            threads.append(threading.current_thread().name)
+            callback()
+
+        renderer = MarkdownRenderer(on_update=updated.set, dispatch=dispatch)
+        text = "```python\nx = [1]\n```"
+        plain = renderer.render(text)
+        assert plain == "[font=RobotoMono-Regular]x = &bl;1&br;[/font]"
+        assert updated.wait(5)
+        assert threads[0].startswith('highlight')
+        highlighted = renderer.render(text)
+        assert highlighted.startswith("[font=RobotoMono-Regular]")
+        assert "[color=#" in highlighted and "&bl;" in highlighted
+        assert renderer.generation == 1
+        renderer.close()
+
+    def test_open_code_block_is_not_highlighted(self):
+        """Test code still streaming in is not sent to the worker."""
+        renderer = MarkdownRenderer()
+        assert renderer.render("```\nx = 1\n", key=1) == "[font=RobotoMono-Regular]x = 1[/font]"
+        assert renderer._executor is None
@@ -0,0 +1,71 @@
+import pytest
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from kivy.clock import Clock
+
+from src.message_list import MessageList
+
+
+@pytest.fixture
+def message_list():
+    return MessageList(size=(400, 300), message_colors={'user': '#1f6aa5'})
+
+
+class TestMessageList:
+    def test_append_message(self, message_list):
+        """Test messages are stored as records, not concatenated text."""
+        assert message_list.append_message('user', 'Hello') == 0
+        assert message_list.append_message('assistant', 'Hi there') == 1
+        record = message_list.data[1]
+        assert (record.role, record.text, 'id' in record) == ('assistant', 'Hi there', False)
+
+    def test_transcript(self, message_list):
+        """Test the plain-text transcript keeps role prefixes."""
+        message_list.append_message('system', 'Welcome')
+        message_list.append_message('user', 'Hello')
+        assert message_list.transcript() == "Welcome\nYou: Hello\n"
+
+    def test_clear(self, message_list):
+        """Test clearing drops every record."""
+        message_list.append_message('user', 'Hello')
+        message_list.clear()
+        assert message_list.data == []
+        assert message_list.transcript() == ""
+
+    def test_markup_is_escaped(self, message_list):
+        """Test message text cannot inject Kivy markup."""
+        text = message_list.format_message({'role': 'user', 'text': '[b]x[/b]'})
+        assert text == "[b][color=#1f6aa5]You:[/color][/b] &bl;b&br;x&bl;/b&br;"
+
+    def test_only_visible_rows_are_built(self, message_list):
+        """Test a long transcript creates row widgets for the viewport only."""
+        message_list.data = [{'role': 'user', 'text': f'message {i}'} for i in range(2000)]
+        for _ in range(3):
+            Clock.tick()
+        assert message_list.layout.children
+        assert len(message_list.layout.children) < 50
+
+    def test_extend_message(self, message_list):
+        """Test streamed text is appended to one record in place."""
+        index = message_list.append_message('assistant', 'Hel')
+        message_list.extend_message(index, 'lo')
+        assert message_list.data[index]['text'] == 'Hello'
+        assert len(message_list.data) == 1
+
+    def test_keys_survive_prepend(self, message_list):
+        """Test a streaming message keeps its key when older history is prepended."""
+        key = message_list.append_message('assistant', 'Hel')
+        message_list.prepend_messages([{'role': 'user', 'text': 'older'}])
+        message_list.extend_message(key, 'lo')
+        assert message_list.get_message(key)['text'] == 'Hello'
+        assert message_list.data[0]['text'] == 'older'
+
+    def test_assistant_markdown_is_rendered(self, message_list):
+        """Test assistant replies are rendered as Markdown and user text is not."""
+        reply = message_list.format_message({'role': 'assistant', 'text': '**hi**'})
+        assert reply == "[b]Assistant:[/b] [b]hi[/b]"
+        user = message_list.format_message({'role': 'user', 'text': '**hi**'})
+        assert user.endswith(" **hi**")
@@ -0,0 +1,102 @@
+import pytest
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.message_model import Message, MessageBodies
+from src.session_store import SessionStore
+from src.workspace import Workspace
+
+
+class FakeStore:
+    """Body loader that counts its queries."""
+    def __init__(self, bodies):
+        self.bodies = bodies
+        self.queries = []
+
+    def load(self, ids):
+        self.queries.append(list(ids))
+        return {i: self.bodies[i] for i in ids}
+
+
+def saved(count, bodies):
+    messages = [Message('user', f'body {i}', id=i) for i in range(count)]
+    for message in messages:
+        bodies.attach(message)
+    return messages
+
+
+class TestMessage:
+    def test_dict_access(self):
+        """Test records read like the dicts MessageList takes, with unset fields missing."""
+        message = Message('assistant', 'Hi', id=3, model='mistral')
+        assert message['text'] == 'Hi' and message['id'] == 3
+        assert 'model' in message and 'height' not in message
+        assert message.get('height', 32) == 32
+        message['height'] = 40
+        assert message.get('height') == 40
+        with pytest.raises(KeyError):
+            message['size']
+
+    def test_names_are_interned(self):
+        """Test every message shares one copy of each role and model name."""
+        model = ''.join(['mis', 'tral'])
+        first, second = Message('user', 'a', model='mistral'), Message('user', 'b', model=model)
+        assert first.model is second.model
+        assert not hasattr(first, '__dict__')
+
+
+class TestMessageBodies:
+    def test_least_recently_used_bodies_are_paged_out(self):
+        """Test only the most recently used bodies stay in memory and the rest are read back."""
+        store = FakeStore({i: f'body {i}' for i in range(5)})
+        bodies = MessageBodies(store.load, max_resident=3)
+        messages = saved(5, bodies)
+        assert [m.is_resident() for m in messages] == [False, False, True, True, True]
+        assert messages[0].text == 'body 0'
+        assert store.queries == [[0]]
+        assert not messages[2].is_resident()
+        assert bodies.resident() == 3
+        assert bodies.stats == {'paged_out': 3, 'paged_in': 1}
+
+    def test_unsaved_messages_stay_resident(self):
+        """Test a message that was never attached keeps its body however many are paged."""
+        bodies = MessageBodies(FakeStore({}).load, max_resident=1)
+        streaming = Message('assistant', 'partial', id=99)
+        saved(3, bodies)
+        assert streaming.is_resident()
+
+    def test_texts_read_in_batches_without_paging_in(self):
+        """Test reading a whole history loads paged bodies in one query and keeps them out."""
+        store = FakeStore({i: f'body {i}' for i in range(10)})
+        bodies = MessageBodies(store.load, max_resident=2)
+        messages = saved(10, bodies)
+        assert bodies.texts(messages + [{'role': 'system', 'text': 'hi'}]) == (
+            [f'body {i}' for i in range(10)] + ['hi'])
+        assert store.queries == [list(range(8))]
+        assert not messages[0].is_resident()
+
+    def test_forget(self):
+        """Test forgotten messages no longer take a place in the window."""
+        bodies = MessageBodies(FakeStore({}).load, max_resident=2)
+        messages = saved(2, bodies)
+        bodies.forget(messages)
+        assert bodies.resident() == 0
+
+
+class TestWorkspaceBodies:
+    def test_scrolled_to_bodies_come_from_the_store(self, tmp_path):
+        """Test a session's bodies are paged out past the window and read back on access."""
+        store = SessionStore(tmp_path / 'chats.db')
+        try:
+            session_id = store.create_session()
+            for i in range(20):
+                store.append_message(session_id, 'user', f'message {i}')
+            workspace = Workspace(store, resident_messages=5)
+            session = workspace.open(session_id)
+            assert sum(record.is_resident() for record in session.records) == 5
+            assert session.records[0]['text'] == 'message 0'
+            assert workspace.bodies.stats['paged_in'] == 1
+        finally:
+            store.close()
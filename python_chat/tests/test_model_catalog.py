@@ -0,0 +1,137 @@
+import pytest
+import pytest_asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.model_catalog import ModelCatalog, parse_show
+from src.ollama_client import OllamaClient
+from src.response_cache import ResponseCache
+from tests.fake_ollama import FakeOllama
+
+
+@pytest_asyncio.fixture
+async def fake():
+    server = FakeOllama()
+    await server.start()
+    yield server
+    await server.close()
+
+
+@pytest_asyncio.fixture
+async def client(fake, tmp_path):
+    client = OllamaClient(fake.url, catalog=ModelCatalog(tmp_path / 'models.json', ttl=300))
+    yield client
+    await client.close()
+
+
+def show_requests(fake):
+    return [body['model'] for path, body in fake.requests if path == '/api/show']
+
+
+def tag_requests(fake):
+    return sum(path == '/api/tags' for path, body in fake.requests)
+
+
+def generate_requests(fake):
+    return sum(path == '/api/generate' for path, body in fake.requests)
+
+
+class TestParseShow:
+    def test_context_length_and_quantization(self):
+        """Test details are read from model_info and details."""
+        parsed = parse_show({
+            'details': {'quantization_level': 'Q4_K_M', 'family': 'llama'},
+            'model_info': {'general.architecture': 'llama', 'llama.context_length': 8192},
+        })
+        assert parsed['context_length'] == 8192
+        assert parsed['quantization'] == 'Q4_K_M'
+
+    def test_num_ctx_parameter_wins(self):
+        """Test a num_ctx from the Modelfile overrides the architecture default."""
+        parsed = parse_show({
+            'model_info': {'llama.context_length': 8192},
+            'parameters': 'stop "[INST]"\nnum_ctx 16384',
+        })
+        assert parsed['context_length'] == 16384
+
+
+class TestModelCatalog:
+    @pytest.mark.asyncio
+    async def test_list_models_fills_and_saves_catalog(self, client, fake, tmp_path):
+        """Test the first listing asks the server and persists the details."""
+        models = await client.list_models()
+        assert [m['name'] for m in models] == ['llama2', 'mistral']
+        assert client.catalog.get('mistral')['context_length'] == 32768
+        assert client.catalog.get('mistral')['quantization'] == 'Q4_0'
+        assert client.model_digests['mistral'] == 'sha256:mistral'
+
+        saved = ModelCatalog(tmp_path / 'models.json')
+        assert saved.names() == ['llama2', 'mistral']
+        assert saved.get('llama2')['context_length'] == 4096
+
+    @pytest.mark.asyncio
+    async def test_fresh_catalog_is_served_from_cache(self, client, fake):
+        """Test repeated listings within the TTL do not reach the server."""
+        await client.list_models()
+        count = len(fake.requests)
+        await client.list_models()
+        assert len(fake.requests) == count
+
+    @pytest.mark.asyncio
+    async def test_stale_catalog_revalidates_in_background(self, client, fake):
+        """Test a stale catalog is returned at once and refreshed behind it."""
+        await client.list_models()
+        fake.models.append({'name': 'codellama', 'digest': 'sha256:code', 'size': 1})
+        client.catalog.fetched_at -= 301
+        models = await client.list_models()
+        assert 'codellama' not in [m['name'] for m in models]
+        await client.refresh_models_soon()
+        assert 'codellama' in client.available_models
+        assert not client.catalog.is_stale()
+
+    @pytest.mark.asyncio
+    async def test_digest_change_invalidates_details(self, client, fake):
+        """Test only a model whose digest changed is looked up again."""
+        await client.list_models()
+        assert sorted(show_requests(fake)) == ['llama2', 'mistral']
+        fake.models[0]['digest'] = 'sha256:mistral-v2'
+        fake.models[0]['context_length'] = 65536
+        await client.list_models(refresh=True)
+        assert sorted(show_requests(fake)) == ['llama2', 'mistral', 'mistral']
+        assert client.catalog.get('mistral')['context_length'] == 65536
+        assert client.model_digests['mistral'] == 'sha256:mistral-v2'
+
+    @pytest.mark.asyncio
+    async def test_removed_models_are_dropped(self, client, fake):
+        """Test models deleted on the server disappear from the catalog."""
+        await client.list_models()
+        del fake.models[1]
+        await client.list_models(refresh=True)
+        assert client.available_models == ['mistral']
+
+    @pytest.mark.asyncio
+    async def test_cache_digest_for_untagged_names(self, client, fake, tmp_path):
+        """Test "mistral" finds the digest of "mistral:latest" with one catalog fetch."""
+        for model in fake.models:
+            model['name'] += ':latest'
+        client.cache = ResponseCache(tmp_path / 'cache')
+        for _ in range(3):
+            async for _record in client.stream_generate('mistral', 'hi', parameters={'temperature': 0}):
+                pass
+        assert tag_requests(fake) == 1 and generate_requests(fake) == 1
+        assert await client._model_digest('mistral') == 'sha256:mistral'
+        # A re-pulled model misses the cache
+        fake.models[0]['digest'] = 'sha256:mistral-v2'
+        await client.list_models(refresh=True)
+        async for _record in client.stream_generate('mistral', 'hi', parameters={'temperature': 0}):
+            pass
+        assert generate_requests(fake) == 2
+
+    @pytest.mark.asyncio
+    async def test_unknown_model_refreshes_once(self, client, fake):
+        """Test a model missing from the catalog costs one refresh, not one per request."""
+        assert await client._model_digest('gone') is None
+        assert await client._model_digest('gone') is None
+        assert tag_requests(fake) == 1
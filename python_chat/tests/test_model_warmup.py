@@ -0,0 +1,111 @@
+import pytest
+import pytest_asyncio
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.model_warmup import WarmupManager, model_key
+from src.ollama_client import OllamaClient
+from tests.fake_ollama import FakeOllama
+
+
+@pytest_asyncio.fixture
+async def fake():
+    server = FakeOllama(seed=0)
+    await server.start()
+    yield server
+    await server.close()
+
+
+@pytest_asyncio.fixture
+async def client(fake):
+    client = OllamaClient(host=fake.url, keep_alive={'*': '10m'})
+    yield client
+    await client.close()
+
+
+@pytest_asyncio.fixture
+async def warmup(client):
+    changes = []
+    manager = WarmupManager(client, poll_interval=0.01, on_change=lambda: changes.append(1))
+    manager.changes = changes
+    yield manager
+    await manager.close()
+
+
+class TestWarmupManager:
+    def test_model_key(self):
+        """Test names without a tag match the ``:latest`` names /api/ps reports."""
+        assert model_key('mistral') == 'mistral:latest'
+        assert model_key('llama2:13b') == 'llama2:13b'
+
+    @pytest.mark.asyncio
+    async def test_preload_reports_loading_then_ready(self, fake, warmup):
+        """Test a preload is a prompt-less request and the model shows as resident after it."""
+        fake.load_delay = 0.05
+        task = warmup.preload('mistral')
+        assert warmup.preload('mistral') is task
+        assert warmup.state('mistral') == 'loading'
+        await task
+        assert warmup.state('mistral') == 'ready'
+        assert warmup.describe('mistral') == 'ready, 4.1 GB'
+        assert warmup.memory() == 4109865159
+        [(path, body)] = [r for r in fake.requests if r[0] == '/api/generate']
+        assert body == {'model': 'mistral', 'stream': False, 'keep_alive': '10m'}
+        assert warmup.changes
+
+    @pytest.mark.asyncio
+    async def test_failed_preload(self, warmup):
+        """Test a model the server does not have is reported as failed."""
+        await warmup.preload('missing')
+        assert warmup.state('missing') == 'failed'
+        assert 'not found' in warmup.describe('missing')
+
+    @pytest.mark.asyncio
+    async def test_pinned_models_stay_loaded(self, fake, client, warmup):
+        """Test pinning reloads with keep_alive -1 and later requests keep it pinned."""
+        await warmup.pin('llama2')
+        assert fake.loaded['llama2'] == -1
+        async for _ in client.stream_chat('llama2', [{'role': 'user', 'content': 'hi'}]):
+            pass
+        assert fake.requests[-1][1]['keep_alive'] == -1
+        assert warmup.describe('llama2') == 'ready, 3.8 GB, pinned'
+        await warmup.unpin('llama2')
+        assert fake.loaded['llama2'] == '10m'
+
+    @pytest.mark.asyncio
+    async def test_unload(self, fake, warmup):
+        """Test unloading frees the model and unpins it."""
+        await warmup.pin('mistral')
+        await warmup.unload('mistral')
+        assert fake.loaded == {}
+        assert fake.requests[-2][1]['keep_alive'] == 0
+        assert warmup.state('mistral') == 'unloaded'
+        assert 'mistral' not in warmup.pinned
+
+    @pytest.mark.asyncio
+    async def test_polling_notices_models_loaded_elsewhere(self, fake, warmup):
+        """Test the poller picks up models loaded by other clients and keeps the last state on errors."""
+        warmup.start()
+        fake.loaded['llama2'] = '5m'
+        for _ in range(100):
+            if warmup.state('llama2') == 'ready':
+                break
+            await asyncio.sleep(0.01)
+        assert warmup.state('llama2') == 'ready'
+        await fake.close()
+        await warmup.refresh()
+        assert warmup.state('llama2') == 'ready'
+
+    @pytest.mark.asyncio
+    async def test_attach_moves_pins_to_a_new_client(self, fake, warmup):
+        """Test a replacement client keeps sending keep_alive -1 for pinned models."""
+        warmup.pinned.add('mistral')
+        other = OllamaClient(host=fake.url)
+        try:
+            warmup.attach(other)
+            assert other.keep_alive_for('mistral') == -1
+        finally:
+            await other.close()
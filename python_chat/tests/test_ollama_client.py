@@ -0,0 +1,187 @@
+import pytest
+import pytest_asyncio
+import asyncio
+import json
+import os
+import sys
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.config import DEFAULT_CONFIG
+from src.ollama_client import OllamaClient, OllamaError, OllamaTimeoutError
+from src.response_cache import ResponseCache
+
+
+def ndjson(*records):
+    return "".join(json.dumps(r) + "\n" for r in records).encode()
+
+
+async def handle_generate(request):
+    body = await request.json()
+    assert body["stream"] is True
+    response = web.StreamResponse()
+    await response.prepare(request)
+    for word in ["Hello", ", ", "world"]:
+        await response.write(ndjson({"response": word, "done": False}))
+    await response.write(ndjson({"response": "", "done": True, "eval_count": 3, "context": [1, 2, 3]}))
+    return response
+
+
+async def handle_chat(request):
+    body = await request.json()
+    if body["model"] == "missing":
+        return web.json_response({"error": "model 'missing' not found"}, status=404)
+    response = web.StreamResponse()
+    await response.prepare(request)
+    await response.write(ndjson(
+        {"message": {"role": "assistant", "content": "Hi"}, "done": False},
+        {"message": {"role": "assistant", "content": ""}, "done": True, "eval_count": 1},
+    ))
+    return response
+
+
+@pytest_asyncio.fixture
+async def ollama_server():
+    app = web.Application()
+    app.router.add_post('/api/generate', handle_generate)
+    app.router.add_post('/api/chat', handle_chat)
+    server = TestServer(app)
+    await server.start_server()
+    yield server
+    await server.close()
+
+
+@pytest_asyncio.fixture
+async def client(ollama_server):
+    client = OllamaClient(str(ollama_server.make_url('/')))
+    yield client
+    await client.close()
+
+
+class TestStreaming:
+    @pytest.mark.asyncio
+    async def test_stream_generate_yields_tokens_then_stats(self, client):
+        """Test tokens arrive one record at a time, followed by the stats record."""
+        records = [r async for r in client.stream_generate('mistral', 'hi')]
+        assert [r['token'] for r in records] == ["Hello", ", ", "world", ""]
+        assert records[-1]['done'] is True
+        assert records[-1]['eval_count'] == 3
+
+    @pytest.mark.asyncio
+    async def test_generate_joins_stream(self, client):
+        """Test the non-streaming call still returns one finished string."""
+        assert await client.generate('mistral', 'hi') == "Hello, world"
+
+    @pytest.mark.asyncio
+    async def test_stream_chat(self, client):
+        """Test chat records are normalized to the same token field."""
+        records = [r async for r in client.stream_chat('mistral', [{'role': 'user', 'content': 'hi'}])]
+        assert [r['token'] for r in records] == ["Hi", ""]
+
+    @pytest.mark.asyncio
+    async def test_stream_error(self, client):
+        """Test server errors surface as OllamaError."""
+        with pytest.raises(OllamaError, match="not found"):
+            async for _ in client.stream_chat('missing', []):
+                pass
+
+
+class TestConnectionPool:
+    @pytest.mark.asyncio
+    async def test_connections_are_reused(self, client):
+        """Test a burst of sequential requests shares one keep-alive connection."""
+        for _ in range(3):
+            await client.generate('mistral', 'hi')
+        assert client.stats['requests'] == 3
+        assert client.stats['connections_created'] == 1
+        assert client.stats['connections_reused'] == 2
+
+    @pytest.mark.asyncio
+    async def test_one_session_per_host(self, client):
+        """Test the session is created once and dropped on close."""
+        session = client._get_session()
+        assert client._get_session() is session
+        await client.close()
+        assert session.closed
+
+    @pytest.mark.asyncio
+    async def test_first_byte_timeout(self, client):
+        """Test a server that never sends a record trips the first-byte timeout."""
+        client.first_byte_timeout = 0.05
+
+        async def stall(request):
+            response = web.StreamResponse()
+            await response.prepare(request)
+            await asyncio.sleep(1)
+            return response
+
+        app = web.Application()
+        app.router.add_post('/api/generate', stall)
+        server = TestServer(app)
+        await server.start_server()
+        try:
+            client.host = str(server.make_url('')).rstrip('/')
+            with pytest.raises(OllamaTimeoutError):
+                await client.generate('mistral', 'hi')
+        finally:
+            await server.close()
+
+    @pytest.mark.asyncio
+    async def test_first_byte_timeout_for_headers(self, client):
+        """Test a JSON request whose response headers never arrive times out."""
+        client.first_byte_timeout = 0.05
+
+        async def stall(request):
+            await asyncio.sleep(1)
+            return web.json_response({'models': []})
+
+        app = web.Application()
+        app.router.add_get('/api/tags', stall)
+        app.router.add_post('/api/show', stall)
+        server = TestServer(app)
+        await server.start_server()
+        try:
+            client.host = str(server.make_url('')).rstrip('/')
+            with pytest.raises(OllamaTimeoutError):
+                await client._get_json('/api/tags')
+            with pytest.raises(OllamaTimeoutError):
+                await client.show_model('mistral')
+        finally:
+            await server.close()
+
+    def test_from_config(self):
+        """Test pool and timeout settings are read from the config."""
+        client = OllamaClient.from_config(DEFAULT_CONFIG)
+        assert client.host == DEFAULT_CONFIG['ollama']['host']
+        assert client.limit == DEFAULT_CONFIG['ollama']['connection']['limit']
+        assert client.idle_timeout == DEFAULT_CONFIG['ollama']['timeouts']['idle']
+
+
+class TestResponseCaching:
+    @pytest.mark.asyncio
+    async def test_deterministic_requests_are_replayed(self, client, tmp_path):
+        """Test a repeated temperature-0 request is replayed without reaching the server."""
+        client.cache = ResponseCache(tmp_path / 'cache')
+        client.model_digests['mistral'] = 'sha256:abc'
+        first = [r async for r in client.stream_generate('mistral', 'hi', parameters={'temperature': 0})]
+        second = [r async for r in client.stream_generate('mistral', 'hi', parameters={'temperature': 0})]
+        assert [r['token'] for r in second] == [r['token'] for r in first]
+        assert all(r['cached'] for r in second)
+        assert client.stats['requests'] == 1
+
+    @pytest.mark.asyncio
+    async def test_sampled_requests_bypass_unless_forced(self, client, tmp_path):
+        """Test non-deterministic requests skip the cache unless use_cache=True."""
+        client.cache = ResponseCache(tmp_path / 'cache')
+        client.model_digests['mistral'] = 'sha256:abc'
+        for _ in range(2):
+            await client.generate('mistral', 'hi', parameters={'temperature': 0.8})
+        assert client.stats['requests'] == 2
+        assert client.cache.stats['bypassed'] == 2
+        for _ in range(2):
+            async for _record in client.stream_generate('mistral', 'hi', parameters={'temperature': 0.8}, use_cache=True):
+                pass
+        assert client.stats['requests'] == 3
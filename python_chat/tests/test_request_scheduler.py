@@ -0,0 +1,197 @@
+import pytest
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.request_scheduler import BACKGROUND, INTERACTIVE, NORMAL, RequestScheduler, request_key
+
+
+class FakeUpstream:
+    """Records calls and streams tokens until released."""
+
+    def __init__(self):
+        self.calls = []
+        self.running = 0
+        self.max_running = 0
+        self.cancelled = 0
+        self.release = asyncio.Event()
+
+    def factory(self, name, tokens=('a', 'b')):
+        async def stream():
+            self.calls.append(name)
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+            try:
+                yield {'token': tokens[0]}
+                await self.release.wait()
+                for token in tokens[1:]:
+                    yield {'token': token}
+            except asyncio.CancelledError:
+                self.cancelled += 1
+                raise
+            finally:
+                self.running -= 1
+        return stream
+
+
+async def collect(scheduler, factory, **kwargs):
+    return [r['token'] async for r in scheduler.stream(factory, **kwargs)]
+
+
+class TestScheduling:
+    @pytest.mark.asyncio
+    async def test_concurrency_cap(self):
+        """Test no more than max_per_host requests run at once."""
+        scheduler = RequestScheduler(max_per_host=2)
+        upstream = FakeUpstream()
+        tasks = [asyncio.ensure_future(collect(scheduler, upstream.factory(i))) for i in range(5)]
+        await asyncio.sleep(0.01)
+        assert upstream.running == 2
+        upstream.release.set()
+        await asyncio.gather(*tasks)
+        assert upstream.max_running == 2
+        assert scheduler.active() == 0
+
+    @pytest.mark.asyncio
+    async def test_interactive_requests_jump_the_queue(self):
+        """Test queued requests are admitted by priority class, then age."""
+        scheduler = RequestScheduler(max_per_host=1)
+        upstream = FakeUpstream()
+        first = asyncio.ensure_future(collect(scheduler, upstream.factory('first')))
+        await asyncio.sleep(0)
+        queued = [
+            asyncio.ensure_future(collect(scheduler, upstream.factory(name), priority=priority))
+            for name, priority in [('bg', BACKGROUND), ('normal', NORMAL), ('chat', INTERACTIVE)]
+        ]
+        await asyncio.sleep(0.01)
+        upstream.release.set()
+        await asyncio.gather(first, *queued)
+        assert upstream.calls == ['first', 'chat', 'normal', 'bg']
+
+    @pytest.mark.asyncio
+    async def test_configure_follows_the_host_pool(self):
+        """Test adding hosts admits queued requests and removing them lowers the cap."""
+        hosts = {'ollama': {'hosts': ['http://a', 'http://b', 'http://c']},
+                 'scheduler': {'max_per_host': 1}}
+        scheduler = RequestScheduler.from_config(dict(hosts, ollama={'hosts': []}))
+        upstream = FakeUpstream()
+        tasks = [asyncio.ensure_future(collect(scheduler, upstream.factory(i))) for i in range(4)]
+        await asyncio.sleep(0.01)
+        assert upstream.running == 1
+        scheduler.configure(hosts)
+        await asyncio.sleep(0.01)
+        assert upstream.running == 3 and scheduler.active() == 3
+        scheduler.configure(dict(hosts, ollama={'hosts': ['http://a']}))
+        assert upstream.calls == [0, 1, 2]
+        upstream.release.set()
+        await asyncio.gather(*tasks)
+        assert upstream.calls == [0, 1, 2, 3] and upstream.max_running == 3
+        assert scheduler.active() == 0
+
+
+class TestCoalescing:
+    @pytest.mark.asyncio
+    async def test_identical_requests_share_one_call(self):
+        """Test a duplicate in-flight request joins it and still gets every record."""
+        scheduler = RequestScheduler()
+        upstream = FakeUpstream()
+        key = request_key('chat', 'mistral', [{'role': 'user', 'content': 'hi'}])
+        first = asyncio.ensure_future(collect(scheduler, upstream.factory('one'), key=key))
+        await asyncio.sleep(0.01)
+        second = asyncio.ensure_future(collect(scheduler, upstream.factory('two'), key=key))
+        await asyncio.sleep(0.01)
+        upstream.release.set()
+        assert await first == ['a', 'b']
+        assert await second == ['a', 'b']
+        assert upstream.calls == ['one']
+        assert scheduler.stats['coalesced'] == 1
+
+    @pytest.mark.asyncio
+    async def test_upstream_cancelled_when_every_waiter_leaves(self):
+        """Test the shared call stays up for remaining waiters and stops with the last."""
+        scheduler = RequestScheduler()
+        upstream = FakeUpstream()
+        waiters = [asyncio.ensure_future(collect(scheduler, upstream.factory('x'), key='k'))
+                   for _ in range(2)]
+        await asyncio.sleep(0.01)
+        waiters[0].cancel()
+        await asyncio.sleep(0.01)
+        assert upstream.cancelled == 0
+        waiters[1].cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        await asyncio.sleep(0.01)
+        assert upstream.cancelled == 1
+        assert scheduler.active() == 0
+
+    @pytest.mark.asyncio
+    async def test_errors_fan_out(self):
+        """Test every waiter sees the upstream error."""
+        scheduler = RequestScheduler()
+
+        async def failing():
+            await asyncio.sleep(0.01)
+            raise ValueError('boom')
+            yield
+
+        results = await asyncio.gather(
+            collect(scheduler, failing, key='k'), collect(scheduler, failing, key='k'),
+            return_exceptions=True,
+        )
+        assert [type(r) for r in results] == [ValueError, ValueError]
+
+
+class TestSupersede:
+    @pytest.mark.asyncio
+    async def test_background_jobs_in_group_are_cancelled(self):
+        """Test superseding cancels queued and running background work only."""
+        scheduler = RequestScheduler(max_per_host=1)
+        upstream = FakeUpstream()
+        running = asyncio.ensure_future(
+            collect(scheduler, upstream.factory('title'), priority=BACKGROUND, group=1))
+        queued = asyncio.ensure_future(
+            collect(scheduler, upstream.factory('summary'), priority=BACKGROUND, group=1))
+        other = asyncio.ensure_future(
+            collect(scheduler, upstream.factory('other'), priority=BACKGROUND, group=2))
+        await asyncio.sleep(0.01)
+        assert scheduler.supersede(1) == 2
+        chat = asyncio.ensure_future(collect(scheduler, upstream.factory('chat'), group=1))
+        await asyncio.sleep(0.01)
+        upstream.release.set()
+        results = await asyncio.gather(running, queued, other, chat, return_exceptions=True)
+        assert isinstance(results[0], asyncio.CancelledError)
+        assert isinstance(results[1], asyncio.CancelledError)
+        assert results[2] == results[3] == ['a', 'b']
+        assert 'summary' not in upstream.calls
+        assert scheduler.active() == 0
+
+    @pytest.mark.asyncio
+    async def test_joined_background_job_is_promoted(self):
+        """Test an interactive request joining a queued background one raises its priority."""
+        scheduler = RequestScheduler(max_per_host=1)
+        upstream = FakeUpstream()
+        blocker = asyncio.ensure_future(collect(scheduler, upstream.factory('blocker')))
+        await asyncio.sleep(0)
+        background = asyncio.ensure_future(
+            collect(scheduler, upstream.factory('shared'), key='k', priority=BACKGROUND, group=1))
+        normal = asyncio.ensure_future(
+            collect(scheduler, upstream.factory('normal'), priority=NORMAL))
+        await asyncio.sleep(0)
+        joined = asyncio.ensure_future(collect(scheduler, upstream.factory('shared'), key='k'))
+        await asyncio.sleep(0.01)
+        assert scheduler.supersede(1) == 0
+        upstream.release.set()
+        await asyncio.gather(blocker, background, normal, joined)
+        assert upstream.calls == ['blocker', 'shared', 'normal']
+
+    @pytest.mark.asyncio
+    async def test_superseded_before_it_starts(self):
+        """Test a job cancelled in the same tick it was submitted still finishes."""
+        scheduler = RequestScheduler()
+        upstream = FakeUpstream()
+        stream = scheduler.stream(upstream.factory('title'), priority=BACKGROUND, group=1)
+        assert scheduler.supersede(1) == 1
+        with pytest.raises(asyncio.CancelledError):
+            await asyncio.wait_for(stream.__anext__(), 1)
+        assert upstream.calls == []
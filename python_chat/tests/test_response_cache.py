@@ -0,0 +1,64 @@
+import pytest
+import os
+import sys
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.response_cache import ResponseCache, is_deterministic
+
+RECORDS = [{'response': 'Hi', 'done': False}, {'response': '', 'done': True, 'eval_count': 1}]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResponseCache(tmp_path / 'cache', max_entries=2, max_disk_bytes=10_000, ttl=60)
+
+
+class TestResponseCache:
+    def test_key_is_stable(self):
+        """Test keys ignore dict ordering but include the model digest."""
+        key = ResponseCache.make_key('m', 'sha1', {'prompt': 'p', 'options': {'a': 1, 'b': 2}})
+        assert key == ResponseCache.make_key('m', 'sha1', {'options': {'b': 2, 'a': 1}, 'prompt': 'p'})
+        assert key != ResponseCache.make_key('m', 'sha2', {'prompt': 'p', 'options': {'a': 1, 'b': 2}})
+
+    def test_memory_lru_then_disk(self, cache):
+        """Test evicted entries are still served from disk and promoted back."""
+        for key in ('a', 'b', 'c'):
+            cache.put(key * 8, RECORDS)
+        assert cache.stats['memory_evictions'] == 1
+        assert cache.get('a' * 8) == RECORDS
+        assert cache.stats['disk_hits'] == 1
+        assert cache.get('a' * 8) == RECORDS
+        assert cache.stats['memory_hits'] == 1
+
+    def test_survives_restart(self, cache, tmp_path):
+        """Test the disk tier is reused by a new cache instance."""
+        cache.put('k' * 8, RECORDS)
+        reopened = ResponseCache(tmp_path / 'cache')
+        assert reopened.get('k' * 8) == RECORDS
+
+    def test_ttl(self, cache):
+        """Test expired entries are misses in both tiers."""
+        cache.put('k' * 8, RECORDS)
+        with patch('src.response_cache.time.time', return_value=10 ** 12):
+            assert cache.get('k' * 8) is None
+        assert cache.stats['expired'] == 1
+        assert cache.get('k' * 8) is None
+
+    def test_disk_size_bound(self, tmp_path):
+        """Test the oldest files are evicted once the disk tier is full."""
+        cache = ResponseCache(tmp_path / 'cache', max_entries=1, max_disk_bytes=400)
+        records = [{'response': 'x' * 100, 'done': True}]
+        for i in range(5):
+            cache.put(f'{i:08d}', records)
+        assert cache.stats['disk_evictions'] > 0
+        assert cache._disk_bytes <= 400
+        assert cache.get('00000004') == records
+
+    def test_is_deterministic(self):
+        """Test only greedy or seeded sampling counts as deterministic."""
+        assert is_deterministic({'temperature': 0})
+        assert is_deterministic({'temperature': 0.7, 'seed': 42})
+        assert not is_deterministic({'temperature': 0.7})
+        assert not is_deterministic(None)
@@ -0,0 +1,109 @@
+import pytest
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.search_index import (
+    MATCH_END, MATCH_START, SearchIndex, build_query, highlight, make_snippet, parse_transcript
+)
+from src.session_store import SessionStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SessionStore(tmp_path / 'chats.db')
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def index(store):
+    return SearchIndex(store)
+
+
+class TestSearchIndex:
+    def test_messages_are_indexed_as_saved(self, store, index):
+        """Test inserts, checkpoints and deletes keep the index in step."""
+        session = store.create_session()
+        store.append_message(session, 'user', 'How do I tune sqlite?')
+        message_id = store.append_message(session, 'assistant', '', finalized=False)
+        store.checkpoint_message(message_id, 'Enable WAL mode first')
+        assert [r['id'] for r in index.search('wal')] == [message_id]
+        store.delete_messages(session)
+        assert index.search('wal') == []
+
+    def test_prefix_and_snippet(self, store, index):
+        """Test the last word matches as a prefix and matches are marked."""
+        session = store.create_session()
+        store.append_message(session, 'user', 'Kivy recycleview performance')
+        result = index.search('recycle')[0]
+        assert f"{MATCH_START}recycleview{MATCH_END}" in result['snippet']
+        assert highlight(result['snippet'], '[b]', '[/b]') == 'Kivy [b]recycleview[/b] performance'
+
+    def test_ranking(self, store, index):
+        """Test the message that matches more strongly comes first."""
+        session = store.create_session()
+        weak = store.append_message(session, 'user', 'streaming is one topic among many other long words here')
+        strong = store.append_message(session, 'user', 'streaming streaming')
+        assert [r['id'] for r in index.search('streaming')] == [strong, weak]
+
+    def test_old_best_match_is_found(self, store, index):
+        """Test the strongest match is returned even behind thousands of newer weak ones."""
+        session = store.create_session()
+        strong = store.append_message(session, 'user', 'streaming streaming streaming')
+        with store.transaction():
+            store.conn.executemany(
+                "INSERT INTO messages (session_id, role, content, created_at) VALUES (?, ?, ?, 0)",
+                [(session, 'user', f'streaming and {n} other words in a longer message')
+                 for n in range(3000)],
+            )
+        results = index.search('streaming', limit=5)
+        assert len(results) == 5 and results[0]['id'] == strong
+
+    @pytest.mark.asyncio
+    async def test_search_async(self, store, index):
+        """Test searching from a worker thread sees messages saved after the first query."""
+        session = store.create_session()
+        first = store.append_message(session, 'user', 'asynchronous search')
+        assert [r['id'] for r in await index.search_async('async')] == [first]
+        second = store.append_message(session, 'assistant', 'search again')
+        assert await index.search_async('search') == index.search('search')
+        assert {r['id'] for r in await index.search_async('search')} == {first, second}
+        index.close()
+
+    def test_existing_history_is_indexed(self, store):
+        """Test messages saved before the index existed are searchable."""
+        session = store.create_session()
+        store.append_message(session, 'user', 'legacy message')
+        assert len(SearchIndex(store).search('legacy')) == 1
+
+    def test_reindex_exported_transcripts(self, tmp_path, store, index):
+        """Test exported text files are imported once and re-imported when changed."""
+        export = tmp_path / 'chat_history.txt'
+        export.write_text("Welcome\nYou: first line\nsecond line\nAssistant: an answer\n")
+        assert index.reindex([tmp_path]) == (1, 3)
+        assert index.reindex([tmp_path]) == (0, 0)
+        result = index.search('second')[0]
+        assert result['role'] == 'user'
+        os.utime(export, (1, 1))
+        assert index.reindex([export]) == (1, 3)
+        assert len(index.search('answer')) == 1
+
+    def test_build_query_escapes_syntax(self):
+        """Test FTS5 operators typed by the user are treated as words."""
+        assert build_query('foo" OR bar*') == '"foo" "OR" "bar"*'
+        assert build_query('  ') == ''
+
+    def test_parse_transcript(self):
+        """Test role prefixes split messages and other lines continue them."""
+        assert parse_transcript("Welcome\nYou: a\nb\nAssistant: c") == [
+            ('system', 'Welcome'), ('user', 'a\nb'), ('assistant', 'c')
+        ]
+
+    def test_make_snippet(self):
+        """Test snippets are cut around the first match at word boundaries."""
+        content = ' '.join(['filler'] * 40 + ['needle', 'here'] + ['filler'] * 40)
+        snippet = make_snippet(content, 'need', context=20)
+        assert snippet.startswith('...filler') and snippet.endswith('filler...')
+        assert f'{MATCH_START}needle{MATCH_END} here' in snippet
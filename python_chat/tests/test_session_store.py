@@ -0,0 +1,59 @@
+import pytest
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.session_store import SessionStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SessionStore(tmp_path / 'chats.db')
+    yield store
+    store.close()
+
+
+class TestSessionStore:
+    def test_wal_mode(self, store):
+        """Test the database is opened in WAL mode."""
+        assert store.conn.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+
+    def test_append_and_load(self, store):
+        """Test messages keep their role, model and order."""
+        session = store.create_session()
+        store.append_message(session, 'user', 'Hello')
+        store.append_message(session, 'assistant', 'Hi', model='mistral')
+        rows = store.load_recent(session)
+        assert [(r['role'], r['content'], r['model']) for r in rows] == [
+            ('user', 'Hello', None), ('assistant', 'Hi', 'mistral')
+        ]
+
+    def test_load_recent_pages_backwards(self, store):
+        """Test only the newest page is loaded, and older pages on request."""
+        session = store.create_session()
+        for i in range(10):
+            store.append_message(session, 'user', str(i))
+        page = store.load_recent(session, limit=4)
+        assert [r['content'] for r in page] == ['6', '7', '8', '9']
+        older = store.load_recent(session, limit=4, before_id=page[0]['id'])
+        assert [r['content'] for r in older] == ['2', '3', '4', '5']
+
+    def test_checkpoint_then_finalize(self, store):
+        """Test a streaming message is saved in place until it is finalized."""
+        session = store.create_session()
+        message_id = store.append_message(session, 'assistant', '', finalized=False)
+        store.checkpoint_message(message_id, 'Hel')
+        assert store.load_recent(session)[0]['content'] == 'Hel'
+        store.finalize_message(message_id, 'Hello')
+        store.checkpoint_message(message_id, 'stale')
+        row = store.load_recent(session)[0]
+        assert (row['content'], row['finalized']) == ('Hello', 1)
+
+    def test_latest_session(self, store):
+        """Test the most recently written session is reopened."""
+        first = store.create_session()
+        second = store.create_session()
+        store.append_message(first, 'user', 'newer')
+        assert store.latest_session() == first
+        assert store.count_messages(second) == 0
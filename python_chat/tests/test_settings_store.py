@@ -0,0 +1,155 @@
+import pytest
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.config import DEFAULT_CONFIG
+from src.settings_dialog import config_changes, dialog_values
+from src.settings_store import SettingsError, SettingsStore, deep_merge, migrate_legacy, validate
+
+
+@pytest.fixture
+def path(tmp_path):
+    return tmp_path / 'settings' / 'config.json'
+
+
+def make_store(path, **kwargs):
+    kwargs.setdefault('watch', False)
+    return SettingsStore(path, **kwargs)
+
+
+class TestSchema:
+    def test_deep_merge_keeps_untouched_defaults(self):
+        """Test nested sections are merged key by key."""
+        merged = deep_merge(DEFAULT_CONFIG, {'ollama': {'timeouts': {'idle': 5}}})
+        assert merged['ollama']['timeouts'] == {'connect': 5, 'first_byte': 120, 'idle': 5}
+        assert merged['ollama']['host'] == DEFAULT_CONFIG['ollama']['host']
+        assert DEFAULT_CONFIG['ollama']['timeouts']['idle'] == 60
+
+    def test_validate(self):
+        """Test wrong types and out-of-range values are reported by path."""
+        problems = validate({
+            'theme': 'neon',
+            'ollama': {'timeouts': {'idle': -1}, 'hosts': ['localhost']},
+            'context': {'max_tokens': 'big'},
+            'storage': {'auto_title': 1},
+            'window': {'width': 1024.5},
+            'extra': {'anything': True},
+        })
+        assert sorted(path for path, _ in problems) == [
+            'context.max_tokens', 'ollama.hosts', 'ollama.timeouts.idle', 'storage.auto_title', 'theme',
+        ]
+
+    def test_migrate_legacy_dialog_file(self):
+        """Test flat settings from the old dialog move into their sections."""
+        migrated = migrate_legacy({
+            'api_endpoint': 'http://gpu:11434/api',
+            'api_key': '',
+            'model_name': 'llama3',
+            'use_local_model': True,
+        })
+        assert migrated == {
+            'model': 'llama3',
+            'ollama': {'host': 'http://gpu:11434', 'api_key': '', 'use_local_model': True},
+        }
+
+    def test_dialog_round_trip(self):
+        """Test the dialog fields map onto the settings and back."""
+        values = dialog_values(deep_merge(DEFAULT_CONFIG, config_changes({
+            'api_endpoint': 'http://a:11434, http://b:11434/api',
+            'api_key': 'k',
+            'model_name': 'llama3',
+            'use_local_model': False,
+        })))
+        assert values == {
+            'api_endpoint': 'http://a:11434, http://b:11434',
+            'api_key': 'k',
+            'model_name': 'llama3',
+            'use_local_model': False,
+        }
+
+
+class TestSettingsStore:
+    def test_reads_once_and_caches(self, path):
+        """Test the file is read on creation only and get() returns the cached dict."""
+        path.parent.mkdir(parents=True)
+        path.write_text(json.dumps({'model': 'llama3'}))
+        store = make_store(path)
+        settings = store.get()
+        path.write_text(json.dumps({'model': 'gemma'}))
+        assert store.get() is settings
+        assert settings['model'] == 'llama3'
+        assert settings['ollama']['host'] == DEFAULT_CONFIG['ollama']['host']
+
+    def test_invalid_values_fall_back_to_defaults(self, path):
+        """Test values that break the schema are dropped and reported."""
+        path.parent.mkdir(parents=True)
+        path.write_text(json.dumps({'model': 'llama3', 'context': {'max_tokens': 'big'}}))
+        store = make_store(path)
+        assert store.get()['model'] == 'llama3'
+        assert store.get()['context']['max_tokens'] == DEFAULT_CONFIG['context']['max_tokens']
+        assert [p for p, _ in store.errors] == ['context.max_tokens']
+
+    def test_update_rejects_invalid_changes(self, path):
+        """Test an invalid update raises and leaves the settings alone."""
+        store = make_store(path)
+        with pytest.raises(SettingsError):
+            store.update({'ollama': {'host': 'localhost'}})
+        assert store.get()['ollama']['host'] == DEFAULT_CONFIG['ollama']['host']
+
+    def test_writes_are_debounced_atomic_and_off_thread(self, path):
+        """Test a burst of updates becomes one background write of the overrides."""
+        store = make_store(path, debounce=0.1)
+        writes = []
+        original = store._write
+        store._write = lambda data: (writes.append(threading.current_thread().name), original(data))
+        for tokens in (1024, 2048, 8192):
+            store.update({'context': {'max_tokens': tokens}})
+        assert not path.exists()
+        assert store.get()['context']['max_tokens'] == 8192
+        deadline = time.monotonic() + 2
+        while not path.exists() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        time.sleep(0.15)
+        assert writes == ['settings-writer']
+        assert json.loads(path.read_text()) == {'context': {'max_tokens': 8192}}
+        assert os.listdir(path.parent) == ['config.json']
+        store.close()
+
+    def test_close_flushes_pending_write(self, path):
+        """Test closing saves a change still waiting out the debounce."""
+        store = make_store(path, debounce=60)
+        store.update({'model': 'llama3'})
+        store.close()
+        assert json.loads(path.read_text()) == {'model': 'llama3'}
+        assert make_store(path).get()['model'] == 'llama3'
+
+    def test_subscribers_see_updates_and_file_edits(self, path):
+        """Test subscribers are told about updates and about changes made on disk."""
+        store = make_store(path, debounce=0)
+        seen = []
+        store.subscribe(lambda settings: seen.append(settings['model']))
+        store.update({'model': 'llama3'})
+        store.flush()
+        # Our own write is not reported back as an edit
+        store._on_file_changed()
+        path.write_text(json.dumps({'model': 'gemma'}))
+        store._on_file_changed()
+        assert seen == ['llama3', 'gemma']
+        assert store.get()['model'] == 'gemma'
+        store.close()
+
+    def test_file_watcher(self, path):
+        """Test edits on disk reach subscribers through watchdog."""
+        path.parent.mkdir(parents=True)
+        store = SettingsStore(path)
+        changed = threading.Event()
+        store.subscribe(lambda settings: changed.set())
+        path.write_text(json.dumps({'model': 'gemma'}))
+        assert changed.wait(5)
+        assert store.get()['model'] == 'gemma'
+        store.close()
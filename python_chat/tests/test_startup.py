@@ -0,0 +1,83 @@
+import pytest
+import json
+import os
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Seconds from interpreter start to the first frame; override per machine
+COLD_START_BUDGET = float(os.environ.get('CHATBOX_COLD_START_BUDGET', '3.0'))
+
+DEFERRED_MODULES = [
+    'aiohttp',
+    'src.ollama_client',
+    'src.settings_dialog',
+    'kivy.uix.dropdown',
+    'kivy.uix.popup',
+]
+
+PROBE_APP = """
+import asyncio, json, sys
+sys.path.insert(0, {root!r})
+import main
+from src.startup import probe
+
+class ProbeApp(main.ChatApp):
+    def after_first_frame(self):
+        self.deferred = {{
+            'client_created': self._ollama_client is not None,
+            'menus_built': sorted(self.menus),
+            'modules_loaded': [m for m in {modules!r} if m in sys.modules],
+        }}
+        self.stop()
+
+async def run():
+    app = ProbeApp()
+    await app.async_run(async_lib='asyncio')
+    if app.closing is not None:
+        await app.closing
+    print(json.dumps({{'marks': probe.report(), 'deferred': app.deferred}}))
+
+asyncio.run(run())
+"""
+
+
+def run_python(code, cwd, **env):
+    # Run from a file: Kivy looks up the source file of the App subclass
+    script = cwd / 'probe.py'
+    script.write_text(code)
+    result = subprocess.run(
+        [sys.executable, str(script)], cwd=cwd, capture_output=True, text=True, timeout=60,
+        env=dict(os.environ, KIVY_NO_ARGS='1', **env),
+    )
+    assert result.returncode == 0, result.stderr[-2000:]
+    return result.stdout.strip().splitlines()[-1]
+
+
+class TestStartup:
+    def test_import_defers_optional_modules(self, tmp_path):
+        """Test importing main leaves the client, popups and settings dialog unloaded."""
+        code = (
+            f"import json, sys; sys.path.insert(0, {ROOT!r}); import main; "
+            f"print(json.dumps([m for m in {DEFERRED_MODULES!r} if m in sys.modules]))"
+        )
+        assert json.loads(run_python(code, tmp_path)) == []
+
+    @pytest.mark.slow
+    def test_cold_start_budget(self, tmp_path):
+        """Test the first frame is drawn within budget and before deferred work runs."""
+        profile = tmp_path / 'startup.json'
+        code = PROBE_APP.format(root=ROOT, modules=DEFERRED_MODULES)
+        result = json.loads(run_python(code, tmp_path, CHATBOX_STARTUP_PROFILE=str(profile)))
+        marks = result['marks']
+        assert marks['imports'] < marks['build'] < marks['first_frame']
+        assert json.loads(profile.read_text()) == marks
+        assert result['deferred'] == {
+            'client_created': False,
+            'menus_built': [],
+            'modules_loaded': [],
+        }
+        assert marks['first_frame'] < COLD_START_BUDGET, marks
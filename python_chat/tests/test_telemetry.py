@@ -0,0 +1,136 @@
+import pytest
+import pytest_asyncio
+import asyncio
+import json
+import os
+import sys
+
+import aiohttp
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.ollama_client import OllamaClient, OllamaError
+from src.telemetry import MetricsServer, Telemetry, derived, labels
+from tests.fake_ollama import FakeOllama
+
+
+@pytest_asyncio.fixture
+async def fake():
+    server = FakeOllama(seed=0, num_tokens=10)
+    await server.start()
+    yield server
+    await server.close()
+
+
+@pytest_asyncio.fixture
+async def client(fake):
+    client = OllamaClient(host=fake.url, telemetry=Telemetry())
+    yield client
+    await client.close()
+
+
+def finished(telemetry, model='mistral', host='http://a', ttft=0.2, **fields):
+    trace = telemetry.begin('/api/chat', model, host)
+    trace.started -= ttft
+    trace.token('x')
+    return trace.finish(dict(fields, done=True))
+
+
+class TestTelemetry:
+    def test_record_fields(self):
+        """Test a record has the client timings next to the server's fields."""
+        telemetry = Telemetry()
+        record = finished(telemetry, eval_count=50, eval_duration=2 * 10**9, context=[1])
+        assert record['status'] == 'ok' and record['tokens'] == 1 and record['kind'] == 'reply'
+        assert record['ttft'] >= 0.2
+        assert record['eval_count'] == 50
+        assert 'context' not in record
+        assert derived(record)['eval_rate'] == 25
+        assert not telemetry.active
+
+    def test_percentiles_per_model_and_host(self):
+        """Test rolling percentiles can be read per model, per host or overall."""
+        telemetry = Telemetry(window=10)
+        for i in range(20):
+            finished(telemetry, 'mistral', 'http://a', ttft=i / 10)
+        finished(telemetry, 'llama2', 'http://b', ttft=5.0)
+        mistral = telemetry.percentiles(model='mistral')['ttft']
+        # Only the last ten requests are in the window
+        assert 1.0 <= mistral[50] < 2.0 and mistral[99] < 2.0
+        assert telemetry.percentiles(host='http://b')['ttft'][50] >= 5.0
+        assert telemetry.percentiles()['ttft'][99] >= 5.0
+        assert telemetry.percentiles(model='phi') == {}
+
+    def test_jsonl(self, tmp_path):
+        """Test records are appended as they finish and can be exported in one go."""
+        telemetry = Telemetry(jsonl_path=tmp_path / 'live' / 'telemetry.jsonl')
+        finished(telemetry)
+        finished(telemetry, model='llama2')
+        telemetry.close()
+        live = [json.loads(line) for line in (tmp_path / 'live' / 'telemetry.jsonl').read_text().splitlines()]
+        assert [r['model'] for r in live] == ['mistral', 'llama2']
+        assert telemetry.export_jsonl(tmp_path / 'export.jsonl') == 2
+        assert (tmp_path / 'export.jsonl').read_text().count('\n') == 2
+
+    def test_prometheus_format(self):
+        """Test the exposition has counters, quantiles, counts and sums with escaped labels."""
+        telemetry = Telemetry()
+        finished(telemetry, eval_count=10, eval_duration=10**9)
+        text = telemetry.prometheus()
+        assert 'ollama_chat_requests_total{model="mistral",host="http://a",status="ok"} 1' in text
+        assert '# TYPE ollama_chat_ttft_seconds summary' in text
+        assert 'ollama_chat_eval_rate_tokens_per_second{model="mistral",host="http://a",quantile="0.99"} 10' in text
+        assert 'ollama_chat_eval_rate_tokens_per_second_count{model="mistral",host="http://a"} 1' in text
+        assert labels('a"b', 'c\\d') == '{model="a\\"b",host="c\\\\d"}'
+
+
+class TestClientTelemetry:
+    @pytest.mark.asyncio
+    async def test_requests_are_timed(self, fake, client):
+        """Test every streamed request is recorded with its gaps and Ollama's durations."""
+        async for _ in client.stream_generate('mistral', 'hi'):
+            pass
+        [record] = client.telemetry.records
+        assert record['host'] == fake.url and record['path'] == '/api/generate'
+        assert record['tokens'] == 10
+        assert record['ttft'] is not None and record['gap_max'] >= record['gap_p50']
+        assert record['eval_count'] == 10 and record['total_duration'] > 0
+        assert set(client.telemetry.percentiles(model='mistral', host=fake.url)) == {
+            'ttft', 'gap', 'duration', 'load', 'prompt_rate', 'eval_rate'}
+
+    @pytest.mark.asyncio
+    async def test_failures_and_cancellations(self, fake, client):
+        """Test failed and abandoned requests are counted by outcome."""
+        with pytest.raises(OllamaError):
+            async for _ in client.stream_chat('missing', []):
+                pass
+        fake.token_rate = 5
+        first = asyncio.Event()
+
+        async def read():
+            async for _ in client.stream_chat('mistral', [{'role': 'user', 'content': 'hi'}]):
+                first.set()
+
+        task = asyncio.ensure_future(read())
+        await first.wait()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        statuses = [r['status'] for r in client.telemetry.records]
+        assert statuses == ['error', 'cancelled']
+        assert client.telemetry.requests[('missing', fake.url, 'error')] == 1
+
+    @pytest.mark.asyncio
+    async def test_metrics_endpoint(self, client):
+        """Test the metrics server answers scrapes in the Prometheus text format."""
+        async for _ in client.stream_generate('mistral', 'hi'):
+            pass
+        server = MetricsServer(client.telemetry, 0)
+        url = await server.start()
+        try:
+            async with aiohttp.ClientSession() as session:
+                async with session.get(url) as response:
+                    assert response.status == 200
+                    assert response.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+                    assert 'ollama_chat_ttft_seconds_count' in await response.text()
+        finally:
+            await server.close()
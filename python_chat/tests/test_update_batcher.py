@@ -0,0 +1,46 @@
+import pytest
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from kivy.clock import Clock
+
+from src.update_batcher import UpdateBatcher
+
+
+@pytest.fixture
+def flushes():
+    return []
+
+
+@pytest.fixture
+def batcher(flushes):
+    batcher = UpdateBatcher(flushes.append)
+    yield batcher
+    batcher.discard()
+
+
+class TestUpdateBatcher:
+    def test_deltas_coalesce_into_one_flush(self, batcher, flushes):
+        """Test many deltas pushed within a frame produce a single update."""
+        for token in ["Hel", "lo", ", ", "world"]:
+            batcher.push(0, token)
+        batcher.push(1, "other")
+        assert flushes == []
+        Clock.tick()
+        assert flushes == [{0: "Hello, world", 1: "other"}]
+
+    def test_explicit_flush(self, batcher, flushes):
+        """Test flush hands over pending text immediately and only once."""
+        batcher.push(0, "a")
+        batcher.flush()
+        Clock.tick()
+        assert flushes == [{0: "a"}]
+
+    def test_discard(self, batcher, flushes):
+        """Test discarded deltas are never shown."""
+        batcher.push(0, "a")
+        batcher.discard()
+        Clock.tick()
+        assert flushes == []
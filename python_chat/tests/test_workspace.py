@@ -0,0 +1,109 @@
+import pytest
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.message_list import MessageList
+from src.session_store import SessionStore
+from src.workspace import RECORD_OVERHEAD, ChatSession, Workspace
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SessionStore(tmp_path / 'chats.db')
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def view():
+    return MessageList(size=(400, 300))
+
+
+def saved_session(store, *texts, title=""):
+    session_id = store.create_session(title)
+    for text in texts:
+        store.append_message(session_id, 'user', text)
+    return session_id
+
+
+class TestChatSession:
+    def test_keys_survive_show_and_hide(self, view):
+        """Test a message keeps its key while the session moves in and out of the view."""
+        session = ChatSession(1)
+        session.prepend([{'role': 'user', 'text': 'old'}])
+        key = session.append('assistant', 'Hel')
+        session.show(view)
+        session.extend(key, 'lo')
+        assert view.get_message(key)['text'] == 'Hello'
+        session.hide()
+        assert view.data == []
+        session.extend(key, '!')
+        assert [r['text'] for r in session.data] == ['old', 'Hello!']
+        session.show(view)
+        assert view.get_message(key)['text'] == 'Hello!'
+
+    def test_memory(self):
+        """Test the estimate counts the bytes of the text and a fixed cost per record."""
+        session = ChatSession(1)
+        session.append('user', 'x' * 100)
+        assert 100 + RECORD_OVERHEAD < session.memory() < 200 + RECORD_OVERHEAD
+        wide = ChatSession(2)
+        wide.append('user', '\u4f60\u597d' * 50)
+        # Two bytes a character, not one
+        assert wide.memory() > 200 + RECORD_OVERHEAD
+
+
+class TestWorkspace:
+    def test_only_the_shown_session_uses_the_view(self, store, view):
+        """Test switching sessions hands the one view from session to session."""
+        first = saved_session(store, 'a1', 'a2', title='First')
+        second = saved_session(store, 'b1')
+        workspace = Workspace(store)
+        workspace.show(first, view)
+        assert workspace.active.title == 'First'
+        workspace.show(second, view)
+        assert [r['text'] for r in view.data] == ['b1']
+        assert workspace.sessions[first].view is None
+        assert [r['text'] for r in workspace.sessions[first].records] == ['a1', 'a2']
+        assert list(workspace.sessions) == [first, second]
+
+    def test_idle_sessions_are_paged_out(self, store, view):
+        """Test the least recently shown idle sessions are dropped past the ceiling and reload."""
+        ids = [saved_session(store, f'{n}' * 1000) for n in range(3)]
+        workspace = Workspace(store, max_bytes=2 * (sys.getsizeof('0' * 1000) + RECORD_OVERHEAD))
+        for session_id in ids:
+            workspace.show(session_id, view)
+        oldest = workspace.sessions[ids[0]]
+        assert oldest.paged_out and oldest.records == []
+        assert not workspace.sessions[ids[1]].paged_out
+        assert workspace.stats['paged_out'] == 1
+        workspace.show(ids[0], view)
+        assert view.data[0]['text'] == '0' * 1000
+        assert workspace.stats['paged_in'] == 1
+
+    def test_generating_sessions_stay_resident(self, store, view):
+        """Test a session with a reply streaming into it is never paged out."""
+        first = saved_session(store, 'x' * 1000)
+        workspace = Workspace(store, max_bytes=1)
+        workspace.show(first, view)
+        workspace.active.streaming = (1, [])
+        workspace.show(saved_session(store), view)
+        assert not workspace.sessions[first].paged_out
+
+    def test_close(self, store, view):
+        """Test closing the shown session empties the view."""
+        session_id = saved_session(store, 'a')
+        workspace = Workspace(store)
+        workspace.show(session_id, view)
+        assert workspace.close(session_id).session_id == session_id
+        assert workspace.active is None and view.data == []
+        assert workspace.close(session_id) is None
+
+    def test_from_config(self, store):
+        """Test the page size and memory ceiling come from the settings."""
+        workspace = Workspace.from_config(
+            store, {'storage': {'history_page_size': 50}, 'workspace': {'max_memory_mb': 2}}
+        )
+        assert workspace.page_size == 50 and workspace.max_bytes == 2 * 2**20